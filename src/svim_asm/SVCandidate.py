@@ -1,3 +1,72 @@
+from collections import namedtuple
+
+from svim_asm.SVIM_reference import reverse_complement
+from svim_asm.SVIM_sequence import encode_sequence
+
+
+#Fields of a VCF record. INFO is a list of (key, value) pairs (value is None for flags), FORMAT a list of keys
+#and SAMPLE the list of corresponding values. The ID is only assigned when the sorted records are written.
+VcfRecord = namedtuple("VcfRecord", ["chrom", "pos", "ref", "alt", "filters", "info", "format", "sample"])
+
+
+def format_vcf_record(record, variant_id):
+    """Format a VcfRecord as a line of a VCF file"""
+    info_string = ";".join(key if value is None else "{0}={1}".format(key, value) for key, value in record.info)
+    return "{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filter}\t{info}\t{format}\t{samples}".format(
+                chrom=record.chrom,
+                pos=record.pos,
+                id=variant_id,
+                ref=record.ref,
+                alt=record.alt,
+                qual=".",
+                filter="PASS" if len(record.filters) == 0 else ";".join(record.filters),
+                info=info_string,
+                format=":".join(record.format),
+                samples=":".join(str(value) for value in record.sample))
+
+
+class QueryNameTable:
+    """Per-run table of query names. Candidates store the integer IDs of their supporting query sequences
+    and the names are only looked up when the READS tag of the VCF is written."""
+    def __init__(self):
+        self.ids = dict()
+        self.names = []
+
+
+    def get_id(self, name):
+        try:
+            return self.ids[name]
+        except KeyError:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+            return self.ids[name]
+
+
+    def get_names(self, ids):
+        return [self.names[query_id] for query_id in ids]
+
+
+def get_read_names_argument(options):
+    """Return the read_names argument for the VCF records: False if query names are not written, the QueryNameTable
+    of the run if candidates store query IDs or True if candidates store the names directly"""
+    if not options.query_names:
+        return False
+    query_name_table = getattr(options, "query_name_table", None)
+    return True if query_name_table is None else query_name_table
+
+
+def get_candidate_types(options):
+    """Return the set of candidate types (DEL, INV, INS, DUP_TAN, DUP_INT, BND) that are needed for the SV types
+    requested with --types, taking into account duplications that are output as insertions"""
+    types_to_output = [entry.strip() for entry in options.types.split(",")]
+    candidate_types = set(sv_type for sv_type in ["DEL", "INV", "INS", "BND"] if sv_type in types_to_output)
+    if ("INS" in types_to_output) if options.tandem_duplications_as_insertions else ("DUP:TANDEM" in types_to_output):
+        candidate_types.add("DUP_TAN")
+    if ("INS" in types_to_output) if options.interspersed_duplications_as_insertions else ("DUP:INT" in types_to_output):
+        candidate_types.add("DUP_INT")
+    return candidate_types
+
+
 class Candidate:
     """Candidate class for structural variant candidates. Candidates reflect the final SV types and can be merged from signatures of several reads.
     """
@@ -31,7 +100,19 @@ class Candidate:
             return float("inf")
 
 
-    def get_vcf_entry(self):
+    def get_allele_regions(self):
+        """Return the reference regions (contig, start, end) that are fetched for the sequence alleles of the VCF record"""
+        return []
+
+
+    def get_read_names(self, read_names):
+        """Return the names of the supporting query sequences. read_names is a QueryNameTable if the candidate stores query IDs."""
+        if isinstance(read_names, QueryNameTable):
+            return read_names.get_names(self.reads)
+        return self.reads
+
+
+    def get_vcf_record(self):
         raise NotImplementedError
 
 
@@ -50,32 +131,33 @@ class CandidateDeletion(Candidate):
         self.genotype = genotype
 
 
-    def get_vcf_entry(self, sequence_alleles = False, reference = None, read_names = False):
+    def get_allele_regions(self):
+        contig, start, end = self.get_source()
+        return [(contig, max(0, start-1), end)]
+
+
+    def get_vcf_record(self, sequence_alleles = False, reference = None, read_names = False):
         contig, start, end = self.get_source()
         filters = []
         if sequence_alleles:
-            ref_allele = reference.fetch(contig, max(0, start-1), end).upper()
-            alt_allele = reference.fetch(contig, max(0, start-1), start).upper()
+            ref_allele = reference.fetch(contig, max(0, start-1), end)
+            alt_allele = reference.fetch(contig, max(0, start-1), start)
         else:
             ref_allele = "N"
             alt_allele = "<" + self.type + ">"
-        info_template="SVTYPE={0};END={1};SVLEN={2}"
-        info_string = info_template.format(self.type, 
-                                           end, 
-                                           start - end)
+        info = [("SVTYPE", self.type),
+                ("END", end),
+                ("SVLEN", start - end)]
         if read_names:
-            info_string += ";READS={0}".format(",".join(self.reads))
-        return "{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filter}\t{info}\t{format}\t{samples}".format(
-                    chrom=contig,
-                    pos=max(1, start),
-                    id="PLACEHOLDERFORID",
-                    ref=ref_allele,
-                    alt=alt_allele,
-                    qual=".",
-                    filter="PASS" if len(filters) == 0 else ";".join(filters),
-                    info=info_string,
-                    format="GT",
-                    samples="{gt}".format(gt=self.genotype))
+            info.append(("READS", ",".join(self.get_read_names(read_names))))
+        return VcfRecord(chrom=contig,
+                         pos=max(1, start),
+                         ref=ref_allele,
+                         alt=alt_allele,
+                         filters=filters,
+                         info=info,
+                         format=["GT"],
+                         sample=[self.genotype])
 
 
 class CandidateInversion(Candidate):
@@ -93,36 +175,34 @@ class CandidateInversion(Candidate):
         self.complete = complete
         self.genotype = genotype
 
-        self.complement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
+
+    def get_allele_regions(self):
+        return [self.get_source()]
 
 
-    def get_vcf_entry(self, sequence_alleles = False, reference = None, read_names = False):
+    def get_vcf_record(self, sequence_alleles = False, reference = None, read_names = False):
         contig, start, end = self.get_source()
         filters = []
         if not self.complete:
             filters.append("incomplete_inversion")
         if sequence_alleles:
-            ref_allele = reference.fetch(contig, start, end).upper()
-            alt_allele = "".join(self.complement.get(base.upper(), base.upper()) for base in reversed(ref_allele))
+            ref_allele = reference.fetch(contig, start, end)
+            alt_allele = reverse_complement(ref_allele)
         else:
             ref_allele = "N"
             alt_allele = "<" + self.type + ">"
-        info_template="SVTYPE={0};END={1}"
-        info_string = info_template.format(self.type, 
-                                            end)
+        info = [("SVTYPE", self.type),
+                ("END", end)]
         if read_names:
-            info_string += ";READS={0}".format(",".join(self.reads))
-        return "{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filter}\t{info}\t{format}\t{samples}".format(
-                    chrom=contig,
-                    pos=start+1,
-                    id="PLACEHOLDERFORID",
-                    ref=ref_allele,
-                    alt=alt_allele,
-                    qual=".",
-                    filter="PASS" if len(filters) == 0 else ";".join(filters),
-                    info=info_string,
-                    format="GT",
-                    samples="{gt}".format(gt=self.genotype))
+            info.append(("READS", ",".join(self.get_read_names(read_names))))
+        return VcfRecord(chrom=contig,
+                         pos=start+1,
+                         ref=ref_allele,
+                         alt=alt_allele,
+                         filters=filters,
+                         info=info,
+                         format=["GT"],
+                         sample=[self.genotype])
 
 
 class CandidateInsertion(Candidate):
@@ -137,7 +217,8 @@ class CandidateInsertion(Candidate):
 
         self.type = "INS"
         self.reads = reads
-        self.sequence = sequence
+        #Inserted sequence with 2 bits per base (EncodedSequence)
+        self.sequence = encode_sequence(sequence)
         self.genotype = genotype
 
     def get_destination(self):
@@ -148,32 +229,33 @@ class CandidateInsertion(Candidate):
         return (self.type, self.dest_contig, self.dest_start)
 
 
-    def get_vcf_entry(self, sequence_alleles = False, reference = None, read_names = False):
+    def get_allele_regions(self):
+        contig, start, end = self.get_destination()
+        return [(contig, max(0, start-1), start)]
+
+
+    def get_vcf_record(self, sequence_alleles = False, reference = None, read_names = False):
         contig, start, end = self.get_destination()
         filters = []
         if sequence_alleles:
-            ref_allele = reference.fetch(contig, max(0, start-1), start).upper()
-            alt_allele = ref_allele + self.sequence
+            ref_allele = reference.fetch(contig, max(0, start-1), start)
+            alt_allele = ref_allele + self.sequence.decode()
         else:
             ref_allele = "N"
             alt_allele = "<" + self.type + ">"
-        info_template="SVTYPE={0};END={1};SVLEN={2}"
-        info_string = info_template.format(self.type, 
-                                           start, 
-                                           end - start) 
+        info = [("SVTYPE", self.type),
+                ("END", start),
+                ("SVLEN", end - start)]
         if read_names:
-            info_string += ";READS={0}".format(",".join(self.reads))
-        return "{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filter}\t{info}\t{format}\t{samples}".format(
-                    chrom=contig,
-                    pos=max(1, start),
-                    id="PLACEHOLDERFORID",
-                    ref=ref_allele,
-                    alt=alt_allele,
-                    qual=".",
-                    filter="PASS" if len(filters) == 0 else ";".join(filters),
-                    info=info_string,
-                    format="GT",
-                    samples="{gt}".format(gt=self.genotype))
+            info.append(("READS", ",".join(self.get_read_names(read_names))))
+        return VcfRecord(chrom=contig,
+                         pos=max(1, start),
+                         ref=ref_allele,
+                         alt=alt_allele,
+                         filters=filters,
+                         info=info,
+                         format=["GT"],
+                         sample=[self.genotype])
 
 
 class CandidateDuplicationTandem(Candidate):
@@ -185,7 +267,7 @@ class CandidateDuplicationTandem(Candidate):
         self.source_start = max(0, source_start)
         #0-based end of the region (one past the last copied base)
         self.source_end = min(contig_length, source_end)
-        
+
         #number of additional copies
         self.copies = copies
 
@@ -200,40 +282,40 @@ class CandidateDuplicationTandem(Candidate):
         return (source_contig, source_end, source_end + self.copies * (source_end - source_start))
 
 
-    def get_vcf_entry_as_ins(self, sequence_alleles = False, reference = None, read_names = False):
+    def get_allele_regions(self):
+        return [self.get_source()]
+
+
+    def get_vcf_record_as_ins(self, sequence_alleles = False, reference = None, read_names = False):
         contig = self.source_contig
         start = self.source_start
         end = self.source_end
         svtype = "INS"
         filters = []
         if sequence_alleles:
-            ref_allele = reference.fetch(contig, self.source_start, self.source_end).upper()
+            ref_allele = reference.fetch(contig, self.source_start, self.source_end)
             alt_allele = ref_allele * (self.copies + 1)
         else:
             ref_allele = "N"
             alt_allele = "<" + svtype + ">"
         if not(self.fully_covered):
             filters.append("not_fully_covered")
-        info_template="SVTYPE={0};END={1};SVLEN={2}"
-        info_string = info_template.format(svtype, 
-                                           end, 
-                                           (end - start) * self.copies)
+        info = [("SVTYPE", svtype),
+                ("END", end),
+                ("SVLEN", (end - start) * self.copies)]
         if read_names:
-            info_string += ";READS={0}".format(",".join(self.reads))
-        return "{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filter}\t{info}\t{format}\t{samples}".format(
-                    chrom=contig,
-                    pos=start+1,
-                    id="PLACEHOLDERFORID",
-                    ref=ref_allele,
-                    alt=alt_allele,
-                    qual=".",
-                    filter="PASS" if len(filters) == 0 else ";".join(filters),
-                    info=info_string,
-                    format="GT",
-                    samples="{gt}".format(gt=self.genotype))
-
-
-    def get_vcf_entry_as_dup(self, read_names = False):
+            info.append(("READS", ",".join(self.get_read_names(read_names))))
+        return VcfRecord(chrom=contig,
+                         pos=start+1,
+                         ref=ref_allele,
+                         alt=alt_allele,
+                         filters=filters,
+                         info=info,
+                         format=["GT"],
+                         sample=[self.genotype])
+
+
+    def get_vcf_record_as_dup(self, read_names = False):
         contig = self.source_contig
         start = self.source_start
         end = self.source_end
@@ -242,23 +324,19 @@ class CandidateDuplicationTandem(Candidate):
         filters = []
         if not(self.fully_covered):
             filters.append("not_fully_covered")
-        info_template="SVTYPE={0};END={1};SVLEN={2}"
-        info_string = info_template.format(svtype, 
-                                           end, 
-                                           length)
+        info = [("SVTYPE", svtype),
+                ("END", end),
+                ("SVLEN", length)]
         if read_names:
-            info_string += ";READS={0}".format(",".join(self.reads))
-        return "{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filter}\t{info}\t{format}\t{samples}".format(
-                    chrom=contig,
-                    pos=start+1,
-                    id="PLACEHOLDERFORID",
-                    ref="N",
-                    alt="<" + svtype + ">",
-                    qual=".",
-                    filter="PASS" if len(filters) == 0 else ";".join(filters),
-                    info=info_string,
-                    format="GT:CN",
-                    samples="{gt}:{cn}".format(gt=self.genotype, cn=self.copies + 1))
+            info.append(("READS", ",".join(self.get_read_names(read_names))))
+        return VcfRecord(chrom=contig,
+                         pos=start+1,
+                         ref="N",
+                         alt="<" + svtype + ">",
+                         filters=filters,
+                         info=info,
+                         format=["GT", "CN"],
+                         sample=[self.genotype, self.copies + 1])
 
 
 class CandidateDuplicationInterspersed(Candidate):
@@ -293,58 +371,57 @@ class CandidateDuplicationInterspersed(Candidate):
         return (self.type, self.dest_contig, self.dest_start)
 
 
-    def get_vcf_entry_as_ins(self, sequence_alleles = False, reference = None, read_names = False):
+    def get_allele_regions(self):
+        contig, start, end = self.get_destination()
+        return [(contig, max(0, start-1), start), self.get_source()]
+
+
+    def get_vcf_record_as_ins(self, sequence_alleles = False, reference = None, read_names = False):
         contig, start, end = self.get_destination()
         svtype = "INS"
         filters = []
         if sequence_alleles:
-            ref_allele = reference.fetch(contig, max(0, start-1), start).upper()
-            alt_allele = ref_allele + reference.fetch(self.source_contig, self.source_start, self.source_end).upper()
+            ref_allele = reference.fetch(contig, max(0, start-1), start)
+            alt_allele = ref_allele + reference.fetch(self.source_contig, self.source_start, self.source_end)
         else:
             ref_allele = "N"
             alt_allele = "<" + svtype + ">"
-        info_template="SVTYPE={0};{1}END={2};SVLEN={3}"
-        info_string = info_template.format(svtype, 
-                                           "CUTPASTE;" if self.cutpaste else "", 
-                                           start, 
-                                           end - start)
+        info = [("SVTYPE", svtype)]
+        if self.cutpaste:
+            info.append(("CUTPASTE", None))
+        info.extend([("END", start),
+                     ("SVLEN", end - start)])
         if read_names:
-            info_string += ";READS={0}".format(",".join(self.reads))
-        return "{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filter}\t{info}\t{format}\t{samples}".format(
-                    chrom=contig,
-                    pos=max(1, start),
-                    id="PLACEHOLDERFORID",
-                    ref=ref_allele,
-                    alt=alt_allele,
-                    qual=".",
-                    filter="PASS" if len(filters) == 0 else ";".join(filters),
-                    info=info_string,
-                    format="GT",
-                    samples="{gt}".format(gt=self.genotype))
-
-
-    def get_vcf_entry_as_dup(self, read_names = False):
+            info.append(("READS", ",".join(self.get_read_names(read_names))))
+        return VcfRecord(chrom=contig,
+                         pos=max(1, start),
+                         ref=ref_allele,
+                         alt=alt_allele,
+                         filters=filters,
+                         info=info,
+                         format=["GT"],
+                         sample=[self.genotype])
+
+
+    def get_vcf_record_as_dup(self, read_names = False):
         contig, start, end = self.get_source()
         svtype = "DUP:INT"
         filters = []
-        info_template="SVTYPE={0};{1}END={2};SVLEN={3}"
-        info_string = info_template.format(svtype, 
-                                           "CUTPASTE;" if self.cutpaste else "", 
-                                           end, 
-                                           end - start)
+        info = [("SVTYPE", svtype)]
+        if self.cutpaste:
+            info.append(("CUTPASTE", None))
+        info.extend([("END", end),
+                     ("SVLEN", end - start)])
         if read_names:
-            info_string += ";READS={0}".format(",".join(self.reads))
-        return "{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filter}\t{info}\t{format}\t{samples}".format(
-                    chrom=contig,
-                    pos=start+1,
-                    id="PLACEHOLDERFORID",
-                    ref="N",
-                    alt="<" + svtype + ">",
-                    qual=".",
-                    filter="PASS" if len(filters) == 0 else ";".join(filters),
-                    info=info_string,
-                    format="GT",
-                    samples="{gt}".format(gt=self.genotype))
+            info.append(("READS", ",".join(self.get_read_names(read_names))))
+        return VcfRecord(chrom=contig,
+                         pos=start+1,
+                         ref="N",
+                         alt="<" + svtype + ">",
+                         filters=filters,
+                         info=info,
+                         format=["GT"],
+                         sample=[self.genotype])
 
 
 class CandidateBreakend(Candidate):
@@ -382,11 +459,11 @@ class CandidateBreakend(Candidate):
 
     def get_destination(self):
         return (self.dest_contig, self.dest_start)
-    
+
     def get_key(self):
         return (self.type, self.source_contig, self.source_start)
 
-    def get_vcf_entry(self, read_names = False):
+    def get_vcf_record(self, read_names = False):
         source_contig, source_start = self.get_source()
         dest_contig, dest_start = self.get_destination()
         if (self.source_direction == 'fwd') and (self.dest_direction == 'fwd'):
@@ -398,23 +475,19 @@ class CandidateBreakend(Candidate):
         elif (self.source_direction == 'rev') and (self.dest_direction == 'fwd'):
             alt_string = "[{contig}:{start}[N".format(contig = dest_contig, start = dest_start)
         filters = []
-        info_template="SVTYPE={0}"
-        info_string = info_template.format(self.type)
+        info = [("SVTYPE", self.type)]
         if read_names:
-            info_string += ";READS={0}".format(",".join(self.reads))
-        return "{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filter}\t{info}\t{format}\t{samples}".format(
-                    chrom=source_contig,
-                    pos=source_start,
-                    id="PLACEHOLDERFORID",
-                    ref="N",
-                    alt=alt_string,
-                    qual=".",
-                    filter="PASS" if len(filters) == 0 else ";".join(filters),
-                    info=info_string,
-                    format="GT",
-                    samples="{gt}".format(gt=self.genotype))
-
-    def get_vcf_entry_reverse(self, read_names = False):
+            info.append(("READS", ",".join(self.get_read_names(read_names))))
+        return VcfRecord(chrom=source_contig,
+                         pos=source_start,
+                         ref="N",
+                         alt=alt_string,
+                         filters=filters,
+                         info=info,
+                         format=["GT"],
+                         sample=[self.genotype])
+
+    def get_vcf_record_reverse(self, read_names = False):
         source_contig, source_start = self.get_destination()
         dest_contig, dest_start = self.get_source()
         if (self.source_direction == 'rev') and (self.dest_direction == 'rev'):
@@ -426,18 +499,14 @@ class CandidateBreakend(Candidate):
         elif (self.source_direction == 'rev') and (self.dest_direction == 'fwd'):
             alt_string = "[{contig}:{start}[N".format(contig = dest_contig, start = dest_start)
         filters = []
-        info_template="SVTYPE={0}"
-        info_string = info_template.format(self.type)
+        info = [("SVTYPE", self.type)]
         if read_names:
-            info_string += ";READS={0}".format(",".join(self.reads))
-        return "{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filter}\t{info}\t{format}\t{samples}".format(
-                    chrom=source_contig,
-                    pos=source_start,
-                    id="PLACEHOLDERFORID",
-                    ref="N",
-                    alt=alt_string,
-                    qual=".",
-                    filter="PASS" if len(filters) == 0 else ";".join(filters),
-                    info=info_string,
-                    format="GT",
-                    samples="{gt}".format(gt=self.genotype))
+            info.append(("READS", ",".join(self.get_read_names(read_names))))
+        return VcfRecord(chrom=source_contig,
+                         pos=source_start,
+                         ref="N",
+                         alt=alt_string,
+                         filters=filters,
+                         info=info,
+                         format=["GT"],
+                         sample=[self.genotype])
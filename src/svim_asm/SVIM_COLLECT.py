@@ -1,8 +1,14 @@
 import logging
+import argparse
 import pysam
 
-from svim_asm.SVIM_intra import analyze_alignment_indel
-from svim_asm.SVIM_inter import analyze_read_segments
+from multiprocessing import Pool
+
+from svim_asm.SVIM_intra import analyze_cigar_indel, get_indel_candidates
+from svim_asm.SVIM_inter import get_alignment_segments, analyze_alignment_segments
+from svim_asm.SVIM_spill import new_candidate_list
+from svim_asm.SVIM_coverage import CoverageRecorder
+from svim_asm.SVCandidate import QueryNameTable
 
 
 def retrieve_other_alignments(main_alignment, bam):
@@ -54,9 +60,60 @@ def retrieve_other_alignments(main_alignment, bam):
     return other_alignments
 
 
+def get_query_reads(alignment, options):
+    """Return the supporting reads of candidates from the given alignment: the ID of its query name in the
+    query name table of the run or an empty tuple if query names are not tracked"""
+    query_name_table = getattr(options, "query_name_table", None)
+    if query_name_table is None:
+        return ()
+    return (query_name_table.get_id(alignment.query_name), )
+
+
+def analyze_alignment(alignment, bam, options):
+    """Detect SV candidates from a single alignment record.
+    The reference interval of the alignment is recorded in options.coverage_recorder if present.
+    Supplementary alignments are only analyzed for indels. Primary alignments are additionally analyzed
+    together with the other alignments of the same query that are reconstructed from the SA tag."""
+    return analyze_alignment_multi(alignment, bam, options, [options])[0]
+
+
+def analyze_alignment_multi(alignment, bam, options, parameter_sets):
+    """Detect SV candidates from a single alignment record for each of the given parameter sets
+    (copies of options with different size thresholds and gap/overlap tolerances, see analyze_alignment).
+    The CIGAR indels and the alignment segments of the query are extracted once and evaluated against
+    each parameter set. Returns one list of SV candidates per parameter set."""
+    if alignment.is_unmapped or alignment.is_secondary or alignment.mapping_quality < options.min_mapq:
+        return [[] for parameter_set in parameter_sets]
+    coverage_recorder = getattr(options, "coverage_recorder", None)
+    if coverage_recorder is not None:
+        coverage_recorder.add(alignment.reference_name, alignment.reference_start, alignment.reference_end)
+    reads = get_query_reads(alignment, options)
+    candidate_types = getattr(options, "candidate_types", None)
+    if candidate_types is not None and "DEL" not in candidate_types and "INS" not in candidate_types:
+        sv_candidate_lists = [[] for parameter_set in parameter_sets]
+    else:
+        indels = analyze_cigar_indel(alignment.cigartuples, min(parameter_set.min_sv_size for parameter_set in parameter_sets))
+        sv_candidate_lists = [get_indel_candidates(alignment, indels, bam, reads, parameter_set) for parameter_set in parameter_sets]
+    if alignment.is_supplementary:
+        return sv_candidate_lists
+    supplementary_alignments = retrieve_other_alignments(alignment, bam)
+    good_suppl_alns = [aln for aln in supplementary_alignments if not aln.is_unmapped and aln.mapping_quality >= options.min_mapq]
+    segments = get_alignment_segments(alignment, good_suppl_alns)
+    for sv_candidates, parameter_set in zip(sv_candidate_lists, parameter_sets):
+        sv_candidates.extend(analyze_alignment_segments(alignment, segments, bam, parameter_set, reads))
+    return sv_candidate_lists
+
+
 def analyze_alignment_file_coordsorted(bam, options):
+    return analyze_alignment_file_coordsorted_multi(bam, options, [options])[0]
+
+
+def analyze_alignment_file_coordsorted_multi(bam, options, parameter_sets):
+    """Detect SV candidates chromosome by chromosome for each of the given parameter sets (see analyze_alignment_multi).
+    The memory budget is shared by the candidate lists of all parameter sets."""
     chromosomes = bam.references
-    sv_candidates = []
+    max_memory = None if options.max_memory is None else options.max_memory // len(parameter_sets)
+    sv_candidate_lists = [new_candidate_list(max_memory, options.working_dir) for parameter_set in parameter_sets]
     for current_chromosome in chromosomes:
         alignment_it = bam.fetch(contig = current_chromosome)
         logging.info("Processing chromosome {0}...".format(current_chromosome))
@@ -64,16 +121,172 @@ def analyze_alignment_file_coordsorted(bam, options):
         while True:
             try:
                 current_alignment = next(alignment_it)
-                if current_alignment.is_unmapped or current_alignment.is_secondary or current_alignment.mapping_quality < options.min_mapq:
-                    continue
-                if current_alignment.is_supplementary:
-                    sv_candidates.extend(analyze_alignment_indel(current_alignment, bam, current_alignment.query_name, options))
-                else:
-                    supplementary_alignments = retrieve_other_alignments(current_alignment, bam)
-                    good_suppl_alns = [aln for aln in supplementary_alignments if not aln.is_unmapped and aln.mapping_quality >= options.min_mapq]
-
-                    sv_candidates.extend(analyze_alignment_indel(current_alignment, bam, current_alignment.query_name, options))
-                    sv_candidates.extend(analyze_read_segments(current_alignment, good_suppl_alns, bam, options))
+                for sv_candidates, new_candidates in zip(sv_candidate_lists, analyze_alignment_multi(current_alignment, bam, options, parameter_sets)):
+                    sv_candidates.extend(new_candidates)
             except StopIteration:
                 break
-    return sv_candidates
+    return sv_candidate_lists
+
+
+def get_regions(contig_names, contig_lengths, window_size = None):
+    """Return the regions (contig, start, end) of the reference in genomic order: whole contigs or windows of the given size"""
+    regions = []
+    for contig, length in zip(contig_names, contig_lengths):
+        if window_size is None:
+            regions.append((contig, None, None))
+        else:
+            for start in range(0, max(length, 1), window_size):
+                regions.append((contig, start, min(length, start + window_size)))
+    return regions
+
+
+def fetch_region_alignments(bam, region):
+    """Yield the alignments of an indexed alignment file that start in the given region (contig, start, end).
+    Start and end are 0-based and may be None for the whole contig. Alignments starting before the region
+    belong to the previous region and are skipped so that every alignment is analyzed in exactly one region.
+    The index query still returns these alignments, so an alignment is decoded once for every region it overlaps."""
+    contig, start, end = region
+    for alignment in bam.fetch(contig = contig, start = start, stop = end):
+        if start is not None and alignment.reference_start < start:
+            continue
+        yield alignment
+
+
+def analyze_regions_coordsorted(bam, regions, options):
+    """Yield the SV candidates from the alignments in the given regions (contig, start, end) of an indexed alignment file
+    (see fetch_region_alignments)."""
+    for contig, start, end in regions:
+        if start is None and end is None:
+            logging.info("Processing chromosome {0}...".format(contig))
+        else:
+            logging.debug("Processing region {0}:{1}-{2}...".format(contig, "" if start is None else start + 1, "" if end is None else end))
+        for alignment in fetch_region_alignments(bam, (contig, start, end)):
+            yield from analyze_alignment(alignment, bam, options)
+
+
+# Alignment file and options of the current COLLECT worker process, set up once per worker
+worker_aln_file = None
+worker_options = None
+worker_parameter_sets = None
+
+
+def init_collect_worker(bam_path, options, parameter_sets):
+    global worker_aln_file, worker_options, worker_parameter_sets
+    worker_aln_file = pysam.AlignmentFile(bam_path, reference_filename = options.genome)
+    worker_options = options
+    worker_parameter_sets = parameter_sets
+
+
+def analyze_window(region):
+    """Detect SV candidates in one region in a worker process. Returns the candidates of each parameter set,
+    the query names in order of their IDs (or None if query names are not tracked) and the covered intervals (or None)."""
+    if worker_options.query_name_table is not None:
+        worker_options.query_name_table = QueryNameTable()
+    if worker_options.coverage_recorder is not None:
+        worker_options.coverage_recorder = CoverageRecorder()
+    sv_candidate_lists = [[] for parameter_set in worker_parameter_sets]
+    for alignment in fetch_region_alignments(worker_aln_file, region):
+        for sv_candidates, new_candidates in zip(sv_candidate_lists, analyze_alignment_multi(alignment, worker_aln_file, worker_options, worker_parameter_sets)):
+            sv_candidates.extend(new_candidates)
+    query_names = None if worker_options.query_name_table is None else worker_options.query_name_table.names
+    intervals = None if worker_options.coverage_recorder is None else worker_options.coverage_recorder.intervals
+    return sv_candidate_lists, query_names, intervals
+
+
+def analyze_alignment_file_parallel_multi(bam_path, bam, options, parameter_sets):
+    """Detect SV candidates for each of the given parameter sets with options.collect_processes worker processes.
+    Contigs are split into windows of options.collect_window_size and each window is analyzed by one worker that
+    opens its own handle of the indexed alignment file. Alignments are analyzed in the window where they start
+    (see fetch_region_alignments), so merging the windows in genomic order gives the same candidates in the same
+    order as analyze_alignment_file_coordsorted_multi. Query IDs and covered intervals of the workers are
+    translated into the query name table and coverage recorder of the run."""
+    max_memory = None if options.max_memory is None else options.max_memory // len(parameter_sets)
+    sv_candidate_lists = [new_candidate_list(max_memory, options.working_dir) for parameter_set in parameter_sets]
+    regions = get_regions(bam.references, bam.lengths, options.collect_window_size)
+    query_name_table = getattr(options, "query_name_table", None)
+    coverage_recorder = getattr(options, "coverage_recorder", None)
+    # The workers get their own query name table and coverage recorder per window
+    worker_options = argparse.Namespace(**vars(options))
+    worker_options.query_name_table = None if query_name_table is None else QueryNameTable()
+    worker_options.coverage_recorder = None if coverage_recorder is None else CoverageRecorder()
+    worker_parameter_sets = []
+    for parameter_set in parameter_sets:
+        if parameter_set is options:
+            worker_parameter_sets.append(worker_options)
+        else:
+            worker_parameter_sets.append(argparse.Namespace(**dict(vars(parameter_set), query_name_table = None, coverage_recorder = None)))
+    logging.info("Processing {0} windows with {1} processes...".format(len(regions), options.collect_processes))
+    with Pool(processes = options.collect_processes, initializer = init_collect_worker, initargs = (bam_path, worker_options, worker_parameter_sets)) as pool:
+        for region, (window_candidate_lists, query_names, intervals) in zip(regions, pool.imap(analyze_window, regions, chunksize = 1)):
+            if query_names is not None:
+                query_ids = [query_name_table.get_id(name) for name in query_names]
+                for window_candidates in window_candidate_lists:
+                    for candidate in window_candidates:
+                        candidate.reads = tuple(query_ids[query_id] for query_id in candidate.reads)
+            if intervals is not None:
+                for contig, contig_intervals in intervals.items():
+                    for start, end in contig_intervals:
+                        coverage_recorder.add(contig, start, end)
+            for sv_candidates, window_candidates in zip(sv_candidate_lists, window_candidate_lists):
+                sv_candidates.extend(window_candidates)
+    return sv_candidate_lists
+
+
+def bam_iterator(bam):
+    """Iterate over the alignment records in file order and yield (primary, supplementary, secondary) lists
+    of alignments for each run of records with the same query name"""
+    current_name = None
+    primary, supplementary, secondary = [], [], []
+    for alignment in bam:
+        if alignment.query_name != current_name:
+            if current_name is not None:
+                yield (primary, supplementary, secondary)
+            current_name = alignment.query_name
+            primary, supplementary, secondary = [], [], []
+        if alignment.is_secondary:
+            secondary.append(alignment)
+        elif alignment.is_supplementary:
+            supplementary.append(alignment)
+        else:
+            primary.append(alignment)
+    if current_name is not None:
+        yield (primary, supplementary, secondary)
+
+
+def analyze_alignment_file_querysorted(bam, options):
+    """Detect SV candidates in one streaming pass over an alignment file that does not need to be sorted or indexed,
+    e.g. query-grouped output of minimap2 read from standard input. Each query is analyzed as soon as all of its records
+    have been read. The candidates are returned in the order of the coordinate-sorted analysis."""
+    return analyze_alignment_file_querysorted_multi(bam, options, [options])[0]
+
+
+def analyze_alignment_file_querysorted_multi(bam, options, parameter_sets):
+    """Detect SV candidates in one streaming pass for each of the given parameter sets (see analyze_alignment_multi
+    and analyze_alignment_file_querysorted). The memory budget is shared by the candidate lists of all parameter sets."""
+    candidates_by_alignment = [[] for parameter_set in parameter_sets]
+    if options.max_memory is None:
+        spilled_candidate_lists = None
+    else:
+        spilled_candidate_lists = [new_candidate_list(options.max_memory // len(parameter_sets), options.working_dir) for parameter_set in parameter_sets]
+    num_queries = 0
+    for primary, supplementary, secondary in bam_iterator(bam):
+        num_queries += 1
+        if num_queries % 10000 == 0:
+            logging.info("Processed {0} query sequences...".format(num_queries))
+        for alignment in primary + supplementary:
+            for index, sv_candidates in enumerate(analyze_alignment_multi(alignment, bam, options, parameter_sets)):
+                if len(sv_candidates) == 0:
+                    continue
+                if spilled_candidate_lists is None:
+                    candidates_by_alignment[index].append((alignment.reference_id, alignment.reference_start, sv_candidates))
+                else:
+                    #Candidates are sorted by key when spilled. The alignment position keeps equal keys in coordinate order.
+                    spilled_candidate_lists[index].extend(sv_candidates, (alignment.reference_id, alignment.reference_start))
+    logging.info("Processed {0} query sequences.".format(num_queries))
+    if spilled_candidate_lists is not None:
+        return spilled_candidate_lists
+    sv_candidate_lists = []
+    for parameter_set_candidates in candidates_by_alignment:
+        parameter_set_candidates.sort(key=lambda entry: (entry[0], entry[1]))
+        sv_candidate_lists.append([candidate for reference_id, reference_start, sv_candidates in parameter_set_candidates for candidate in sv_candidates])
+    return sv_candidate_lists
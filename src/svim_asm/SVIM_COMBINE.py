@@ -1,21 +1,26 @@
 import os
 import logging
 import re
+import threading
 
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from heapq import merge
 from math import pow, sqrt
-import time
 from statistics import mean, stdev
 from edlib import align
 import numpy as np
 from scipy.cluster.hierarchy import linkage, fcluster
 
-from svim_asm.SVCandidate import CandidateInversion, CandidateDuplicationTandem, CandidateDuplicationInterspersed, CandidateDeletion, CandidateInsertion, CandidateBreakend
+from svim_asm.SVIM_vcf import get_vcf_header_lines, open_vcf_writer
+from svim_asm.SVIM_reference import reverse_complement, BlockReference
+from svim_asm.SVIM_sketch import compute_haplotype_sketch, sketch_lower_bound
+from svim_asm.SVIM_spill import SpillingCandidateList, SpillingSorter, new_candidate_list, estimate_vcf_entry_size
+from svim_asm.SVCandidate import get_read_names_argument, CandidateInversion, CandidateDuplicationTandem, CandidateDuplicationInterspersed, CandidateDeletion, CandidateInsertion, CandidateBreakend
 
-def form_partitions(sv_candidates_with_haplotype, max_distance):
-    """Form partitions of signatures using mean distance."""
-    sorted_candidates_with_haplotype = sorted(sv_candidates_with_haplotype, key=lambda evi: evi[1].get_key())
-    partitions = []
+def iterate_partitions(sorted_candidates_with_haplotype, max_distance):
+    """Yield partitions of (haplotype, candidate) from a stream that is sorted by candidate key.
+    A new partition is started when the SV type or contig changes or when the distance to the previous candidate exceeds max_distance."""
     current_partition = []
     for haplotype, candidate in sorted_candidates_with_haplotype:
         if len(current_partition) > 0:
@@ -24,81 +29,152 @@ def form_partitions(sv_candidates_with_haplotype, max_distance):
             if last_candidate_key[0] != candidate_key[0] or \
                last_candidate_key[1] != candidate_key[1] or \
                abs(last_candidate_key[2] - candidate_key[2]) > max_distance:
-                partitions.append(current_partition[:])
+                yield current_partition
                 current_partition = []
         current_partition.append((haplotype, candidate))
     if len(current_partition) > 0:
-        partitions.append(current_partition[:])
-    return partitions
+        yield current_partition
 
 
-def compute_distance(candidate_with_haplotype1, candidate_with_haplotype2, reference):
+def form_partitions(sv_candidates_with_haplotype, max_distance):
+    """Form partitions of signatures using mean distance."""
+    sorted_candidates_with_haplotype = sorted(sv_candidates_with_haplotype, key=lambda evi: evi[1].get_key())
+    return list(iterate_partitions(sorted_candidates_with_haplotype, max_distance))
+
+
+def get_breakpoint_windows(options):
+    """Return (minimum SV size, window size) for breakpoint-local distances or None if they are disabled"""
+    if options.local_distance_min_size is None:
+        return None
+    return (options.local_distance_min_size, options.breakpoint_window_size)
+
+
+def compute_breakpoint_distance(candidate1, candidate2, reference, max_distance, window_size):
+    """Compute the edit distance between two large inversions or tandem duplications from fixed-size windows
+    around their left and right breakpoints. The windows contain the flanking reference and the first (or last)
+    window_size bases of the inverted or duplicated sequence. The difference in haplotype length (span length
+    times number of copies) is a lower bound of the full edit distance and is checked first."""
+    region_chr = candidate1.source_contig
+    chr_length = reference.get_reference_length(region_chr)
+    region_start = max(0, min(candidate1.source_start, candidate2.source_start) - 100)
+    region_end = min(chr_length, max(candidate1.source_end, candidate2.source_end) + 100)
+    if candidate1.type == "DUP_TAN":
+        if candidate1.copies != candidate2.copies:
+            return max_distance + 1 if max_distance is not None else 1000000000
+        copies = candidate1.copies + 1
+    else:
+        copies = 1
+    length_difference = abs((candidate1.source_end - candidate1.source_start) - (candidate2.source_end - candidate2.source_start)) * copies
+    if max_distance is not None and length_difference > max_distance:
+        return max_distance + 1
+
+    windows = []
+    for candidate in (candidate1, candidate2):
+        start, end = candidate.source_start, candidate.source_end
+        window = min(window_size, end - start)
+        if candidate.type == "INV":
+            left = reference.fetch(region_chr, region_start, start) + reverse_complement(reference.fetch(region_chr, end - window, end))
+            right = reverse_complement(reference.fetch(region_chr, start, start + window)) + reference.fetch(region_chr, end, region_end)
+        else:
+            left = reference.fetch(region_chr, region_start, start) + reference.fetch(region_chr, start, start + window)
+            right = reference.fetch(region_chr, end - window, end) + reference.fetch(region_chr, end, region_end)
+        windows.append((left, right))
+
+    k = -1 if max_distance is None else max_distance
+    left_distance = align(windows[0][0], windows[1][0], k = k)["editDistance"]
+    if left_distance == -1:
+        return max_distance + 1
+    right_distance = align(windows[0][1], windows[1][1], k = -1 if max_distance is None else max_distance - left_distance)["editDistance"]
+    if right_distance == -1:
+        return max_distance + 1
+    return max(left_distance + right_distance, length_difference)
+
+
+def compute_distance(candidate_with_haplotype1, candidate_with_haplotype2, reference, max_distance = None, breakpoint_windows = None):
+    """Compute the edit distance between the haplotype sequences implied by two candidates.
+    If max_distance is given, the alignment stops early and max_distance + 1 is returned for all larger distances.
+    If breakpoint_windows (minimum SV size, window size) is given, inversions and tandem duplications of at least
+    the minimum size are compared using windows around their breakpoints (see compute_breakpoint_distance)."""
     haplotype1, candidate1 = candidate_with_haplotype1
     haplotype2, candidate2 = candidate_with_haplotype2
-    complement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
 
     if haplotype1 == haplotype2:
         return 1000000000
 
+    k = -1 if max_distance is None else max_distance
+
+    if breakpoint_windows is not None and candidate1.type in ("INV", "DUP_TAN"):
+        min_size, window_size = breakpoint_windows
+        if min(candidate1.source_end - candidate1.source_start, candidate2.source_end - candidate2.source_start) >= min_size:
+            return compute_breakpoint_distance(candidate1, candidate2, reference, max_distance, window_size)
+
     if candidate1.type == "DEL":
         region_chr = candidate1.source_contig
         chr_length = reference.get_reference_length(region_chr)
         region_start = max(0, min(candidate1.source_start, candidate2.source_start) - 100)
         region_end = min(chr_length, max(candidate1.source_end, candidate2.source_end) + 100)
-        haplotype1 = reference.fetch(region_chr, region_start, candidate1.source_start).upper() + reference.fetch(region_chr, candidate1.source_end, region_end).upper()
-        haplotype2 = reference.fetch(region_chr, region_start, candidate2.source_start).upper() + reference.fetch(region_chr, candidate2.source_end, region_end).upper()
-        editDistance = align(haplotype1, haplotype2)["editDistance"]
+        haplotype1 = reference.fetch(region_chr, region_start, candidate1.source_start) + reference.fetch(region_chr, candidate1.source_end, region_end)
+        haplotype2 = reference.fetch(region_chr, region_start, candidate2.source_start) + reference.fetch(region_chr, candidate2.source_end, region_end)
+        editDistance = align(haplotype1, haplotype2, k = k)["editDistance"]
     elif candidate1.type == "INV":
         region_chr = candidate1.source_contig
         chr_length = reference.get_reference_length(region_chr)
         region_start = max(0, min(candidate1.source_start, candidate2.source_start) - 100)
         region_end = min(chr_length, max(candidate1.source_end, candidate2.source_end) + 100)
-        inverted_seq1 = "".join(complement.get(base.upper(), base.upper()) for base in reversed(reference.fetch(region_chr, candidate1.source_start, candidate1.source_end).upper()))
-        haplotype1 = reference.fetch(region_chr, region_start, candidate1.source_start).upper() + \
+        inverted_seq1 = reverse_complement(reference.fetch(region_chr, candidate1.source_start, candidate1.source_end))
+        haplotype1 = reference.fetch(region_chr, region_start, candidate1.source_start) + \
                      inverted_seq1 + \
-                     reference.fetch(region_chr, candidate1.source_end, region_end).upper()
-        inverted_seq2 = "".join(complement.get(base.upper(), base.upper()) for base in reversed(reference.fetch(region_chr, candidate2.source_start, candidate2.source_end).upper()))
-        haplotype2 = reference.fetch(region_chr, region_start, candidate2.source_start).upper() + \
+                     reference.fetch(region_chr, candidate1.source_end, region_end)
+        inverted_seq2 = reverse_complement(reference.fetch(region_chr, candidate2.source_start, candidate2.source_end))
+        haplotype2 = reference.fetch(region_chr, region_start, candidate2.source_start) + \
                      inverted_seq2 + \
-                     reference.fetch(region_chr, candidate2.source_end, region_end).upper()
-        editDistance = align(haplotype1, haplotype2)["editDistance"]
+                     reference.fetch(region_chr, candidate2.source_end, region_end)
+        editDistance = align(haplotype1, haplotype2, k = k)["editDistance"]
     elif candidate1.type == "INS":
+        #Both haplotypes span the same reference region so their lengths differ by the difference of the
+        #insertion lengths. This bound and identical insertions are checked on the encoded sequences.
+        if candidate1.dest_start == candidate2.dest_start and candidate1.sequence == candidate2.sequence:
+            return 0
+        if max_distance is not None and abs(len(candidate1.sequence) - len(candidate2.sequence)) > max_distance:
+            return max_distance + 1
         region_chr = candidate1.dest_contig
         chr_length = reference.get_reference_length(region_chr)
         region_start = max(0, min(candidate1.dest_start, candidate2.dest_start) - 100)
         region_end = min(chr_length, max(candidate1.dest_start, candidate2.dest_start) + 100)
-        haplotype1 = reference.fetch(region_chr, region_start, candidate1.dest_start).upper() + \
-                     candidate1.sequence + \
-                     reference.fetch(region_chr, candidate1.dest_start, region_end).upper()
-        haplotype2 = reference.fetch(region_chr, region_start, candidate2.dest_start).upper() + \
-                     candidate2.sequence + \
-                     reference.fetch(region_chr, candidate2.dest_start, region_end).upper()
-        editDistance = align(haplotype1, haplotype2)["editDistance"]
+        haplotype1 = reference.fetch(region_chr, region_start, candidate1.dest_start) + \
+                     candidate1.sequence.decode() + \
+                     reference.fetch(region_chr, candidate1.dest_start, region_end)
+        haplotype2 = reference.fetch(region_chr, region_start, candidate2.dest_start) + \
+                     candidate2.sequence.decode() + \
+                     reference.fetch(region_chr, candidate2.dest_start, region_end)
+        editDistance = align(haplotype1, haplotype2, k = k)["editDistance"]
     elif candidate1.type == "DUP_TAN":
         region_chr = candidate1.source_contig
         chr_length = reference.get_reference_length(region_chr)
         region_start = max(0, min(candidate1.source_start, candidate2.source_start) - 100)
         region_end = min(chr_length, max(candidate1.source_end, candidate2.source_end) + 100)
-        haplotype1 = reference.fetch(region_chr, region_start, candidate1.source_start).upper() + \
-                     reference.fetch(region_chr, candidate1.source_start, candidate1.source_end).upper() * (candidate1.copies + 1) + \
-                     reference.fetch(region_chr, candidate1.source_end, region_end).upper()
-        haplotype2 = reference.fetch(region_chr, region_start, candidate2.source_start).upper() + \
-                     reference.fetch(region_chr, candidate2.source_start, candidate2.source_end).upper() * (candidate2.copies + 1) + \
-                     reference.fetch(region_chr, candidate2.source_end, region_end).upper()
-        editDistance = align(haplotype1, haplotype2)["editDistance"]
+        haplotype1 = reference.fetch(region_chr, region_start, candidate1.source_start) + \
+                     reference.fetch(region_chr, candidate1.source_start, candidate1.source_end) * (candidate1.copies + 1) + \
+                     reference.fetch(region_chr, candidate1.source_end, region_end)
+        haplotype2 = reference.fetch(region_chr, region_start, candidate2.source_start) + \
+                     reference.fetch(region_chr, candidate2.source_start, candidate2.source_end) * (candidate2.copies + 1) + \
+                     reference.fetch(region_chr, candidate2.source_end, region_end)
+        editDistance = align(haplotype1, haplotype2, k = k)["editDistance"]
     elif candidate1.type == "DUP_INT":
         region_chr = candidate1.dest_contig
         chr_length = reference.get_reference_length(region_chr)
         region_start = max(0, min(candidate1.dest_start, candidate2.dest_start) - 100)
         region_end = min(chr_length, max(candidate1.dest_start, candidate2.dest_start) + 100)
-        haplotype1 = reference.fetch(region_chr, region_start, candidate1.dest_start).upper() + \
-                     reference.fetch(candidate1.source_contig, candidate1.source_start, candidate1.source_end).upper() + \
-                     reference.fetch(region_chr, candidate1.dest_start, region_end).upper()
-        haplotype2 = reference.fetch(region_chr, region_start, candidate2.dest_start).upper() + \
-                     reference.fetch(candidate2.source_contig, candidate2.source_start, candidate2.source_end).upper() + \
-                     reference.fetch(region_chr, candidate2.dest_start, region_end).upper()
-        editDistance = align(haplotype1, haplotype2)["editDistance"]
-
+        haplotype1 = reference.fetch(region_chr, region_start, candidate1.dest_start) + \
+                     reference.fetch(candidate1.source_contig, candidate1.source_start, candidate1.source_end) + \
+                     reference.fetch(region_chr, candidate1.dest_start, region_end)
+        haplotype2 = reference.fetch(region_chr, region_start, candidate2.dest_start) + \
+                     reference.fetch(candidate2.source_contig, candidate2.source_start, candidate2.source_end) + \
+                     reference.fetch(region_chr, candidate2.dest_start, region_end)
+        editDistance = align(haplotype1, haplotype2, k = k)["editDistance"]
+
+    if editDistance == -1:
+        return max_distance + 1
     return editDistance
 
 
@@ -117,29 +193,75 @@ def span_position_distance_breakends(candidate1, candidate2):
     return position_distance
 
 
-def pair_haplotypes(partitions, reference, edit_distance_threshold = 10):
+def get_identity_key(candidate):
+    """Return a key that is equal for two candidates if and only if they imply the same haplotype sequence"""
+    if candidate.type == "INS":
+        return (candidate.type, candidate.dest_contig, candidate.dest_start, candidate.dest_end, candidate.sequence)
+    elif candidate.type == "DUP_TAN":
+        return (candidate.type, candidate.source_contig, candidate.source_start, candidate.source_end, candidate.copies)
+    elif candidate.type == "DUP_INT":
+        return (candidate.type, candidate.source_contig, candidate.source_start, candidate.source_end, candidate.dest_contig, candidate.dest_start)
+    return (candidate.type, candidate.source_contig, candidate.source_start, candidate.source_end)
+
+
+def cut_linkage_tree(partition, Z, threshold):
+    """Return the clusters of a partition obtained by cutting its linkage tree at the given distance threshold"""
+    cluster_indices = list(fcluster(Z, threshold, criterion='distance'))
+    clusters = [[] for i in range(max(cluster_indices))]
+    for candidate_index, cluster_index in enumerate(cluster_indices):
+        clusters[cluster_index-1].append(partition[candidate_index])
+    return clusters
+
+
+def pair_haplotypes(partitions, reference, edit_distance_threshold = 10, max_partition_size = 10, breakpoint_windows = None, sketch_prefilter = False,
+                    linkage_cache = None):
+    """Finds clusters in partitions using edit distance and complete-linkage clustering.
+    Distances above the threshold do not change the clusters and are therefore only computed up to the threshold.
+    With sketch_prefilter, insertions and interspersed duplications are sketched once and pairs whose lower bound
+    of the edit distance exceeds the threshold are not aligned.
+    If a linkage_cache is given, the linkage tree of each partition is added to it (see SVIM_sweep)."""
     clusters_final = []
     for partition in partitions:
         if len(partition) < 2:
             new_clusters = [partition]
+            if linkage_cache is not None:
+                linkage_cache.add(partition)
         #Ignore very large partitions because they tend to be in difficult regions
-        elif len(partition) > 10:
+        elif len(partition) > max_partition_size:
             continue
         else:
+            #Identical candidates from different haplotypes (typically homozygous SVs) have distance 0 without alignment
+            #and a partition consisting only of them forms one cluster
+            identity_keys = [get_identity_key(candidate) for haplotype, candidate in partition]
+            haplotypes = [haplotype for haplotype, candidate in partition]
+            if len(set(identity_keys)) == 1 and len(set(haplotypes)) == len(haplotypes):
+                clusters_final.append(partition)
+                if linkage_cache is not None:
+                    linkage_cache.add(partition)
+                continue
             distances = []
+            if sketch_prefilter and partition[0][1].type in ("INS", "DUP_INT"):
+                sketches = [compute_haplotype_sketch(candidate, reference) for haplotype, candidate in partition]
+            else:
+                sketches = None
             for i in range(len(partition)-1):
                 for j in range(i+1, len(partition)):
-                    distances.append(compute_distance(partition[i], partition[j], reference))
+                    if identity_keys[i] == identity_keys[j] and haplotypes[i] != haplotypes[j]:
+                        distances.append(0)
+                    elif sketches is not None and haplotypes[i] != haplotypes[j] and \
+                       sketch_lower_bound(sketches[i], sketches[j]) > edit_distance_threshold:
+                        distances.append(edit_distance_threshold + 1)
+                    else:
+                        distances.append(compute_distance(partition[i], partition[j], reference, edit_distance_threshold, breakpoint_windows))
             Z = linkage(np.array(distances), method = "complete")
-            cluster_indices = list(fcluster(Z, edit_distance_threshold, criterion='distance'))
-            new_clusters = [[] for i in range(max(cluster_indices))]
-            for candidate_index, cluster_index in enumerate(cluster_indices):
-                new_clusters[cluster_index-1].append(partition[candidate_index])
+            new_clusters = cut_linkage_tree(partition, Z, edit_distance_threshold)
+            if linkage_cache is not None:
+                linkage_cache.add(partition, Z)
         clusters_final.extend(new_clusters)
     return clusters_final
 
 
-def pair_haplotypes_breakends(partitions, span_position_distance_threshold = 0.3):
+def pair_haplotypes_breakends(partitions, span_position_distance_threshold = 0.3, max_partition_size = 10):
     """Finds clusters in partitions using span-position distance and hierarchical clustering. 
     Assumes that all signatures in the given partition are of the same type and on the same contig"""
     clusters_final = []
@@ -147,7 +269,7 @@ def pair_haplotypes_breakends(partitions, span_position_distance_threshold = 0.3
         if len(partition) < 2:
             new_clusters = [partition]
         #Ignore very large partitions because they tend to be in difficult regions
-        elif len(partition) > 10:
+        elif len(partition) > max_partition_size:
             continue
         else:
             data = np.array( [[haplotype, candidate.get_source()[1], 1 if candidate.source_direction == 'fwd' else 0, candidate.get_destination()[1], 1 if candidate.dest_direction == 'fwd' else 0] for (haplotype, candidate) in partition])
@@ -160,312 +282,354 @@ def pair_haplotypes_breakends(partitions, span_position_distance_threshold = 0.3
     return clusters_final
 
 
-def pair_candidates(sv_candidates1, sv_candidates2, reference, edit_distance_threshold, bam):
-    deletion_candidates1 = [(1, cand) for cand in sv_candidates1 if cand.type == "DEL"]
-    insertion_candidates1 = [(1, cand) for cand in sv_candidates1 if cand.type == "INS"]
-    inversion_candidates1 = [(1, cand) for cand in sv_candidates1 if cand.type == "INV"]
-    tandem_duplication_candidates1 = [(1, cand) for cand in sv_candidates1 if cand.type == "DUP_TAN"]
-    breakend_candidates1 = [(1, cand) for cand in sv_candidates1 if cand.type == "BND"]
-    interspersed_duplication_candidates1 = [(1, cand) for cand in sv_candidates1 if cand.type == "DUP_INT"]
-
-    deletion_candidates2 = [(2, cand) for cand in sv_candidates2 if cand.type == "DEL"]
-    insertion_candidates2 = [(2, cand) for cand in sv_candidates2 if cand.type == "INS"]
-    inversion_candidates2 = [(2, cand) for cand in sv_candidates2 if cand.type == "INV"]
-    tandem_duplication_candidates2 = [(2, cand) for cand in sv_candidates2 if cand.type == "DUP_TAN"]
-    breakend_candidates2 = [(2, cand) for cand in sv_candidates2 if cand.type == "BND"]
-    interspersed_duplication_candidates2 = [(2, cand) for cand in sv_candidates2 if cand.type == "DUP_INT"]
-
-    paired_candidates = []
-    #DELETIONS
-    logging.info("Pairing {0} deletions...".format(len(deletion_candidates1) + len(deletion_candidates2)))
-    partitions = form_partitions(deletion_candidates1 + deletion_candidates2, 10000)
-    clusters = pair_haplotypes(partitions, reference, edit_distance_threshold)
-    for cluster in clusters:
-        if len(cluster) == 1:
-            candidate = cluster[0][1]
-            genotype = "1/0" if cluster[0][0] == 1 else "0/1"
-            paired_candidates.append(CandidateDeletion(candidate.source_contig, 
-                                                       candidate.source_start, 
-                                                       candidate.source_end, 
-                                                       candidate.reads,
-                                                       bam,
-                                                       genotype))
-        elif len(cluster) == 2:
-            candidate = cluster[0][1]
-            reads = cluster[0][1].reads + cluster[1][1].reads
-            genotype = "1/1"
-            paired_candidates.append(CandidateDeletion(candidate.source_contig, 
-                                                       candidate.source_start, 
-                                                       candidate.source_end, 
-                                                       reads,
-                                                       bam,
-                                                       genotype))
-        else:
-            logging.error("Cluster size should be either 1 or 2 but is " + str(len(cluster)))
-    
-    #INVERSIONS
-    logging.info("Pairing {0} inversions...".format(len(inversion_candidates1) + len(inversion_candidates2)))
-    partitions = form_partitions(inversion_candidates1 + inversion_candidates2, 10000)
-    clusters = pair_haplotypes(partitions, reference, edit_distance_threshold)
-    for cluster in clusters:
-        if len(cluster) == 1:
-            candidate = cluster[0][1]
-            genotype = "1/0" if cluster[0][0] == 1 else "0/1"
-            paired_candidates.append(CandidateInversion(candidate.source_contig, 
-                                                        candidate.source_start, 
-                                                        candidate.source_end, 
-                                                        candidate.reads, 
-                                                        candidate.complete, 
-                                                        bam, 
-                                                        genotype))
-        elif len(cluster) == 2:
-            candidate = cluster[0][1]
-            complete = cluster[0][1].complete or cluster[1][1].complete
-            reads = cluster[0][1].reads + cluster[1][1].reads
-            genotype = "1/1"
-            paired_candidates.append(CandidateInversion(candidate.source_contig, 
-                                                        candidate.source_start, 
-                                                        candidate.source_end, 
-                                                        reads, 
-                                                        complete, 
-                                                        bam, 
-                                                        genotype))
+def get_genotype(haplotypes, num_haplotypes, uncovered_haplotypes = ()):
+    """Return the genotype vector (e.g. 1/0/1) of a variant present on the given haplotypes (numbered from 1).
+    Uncovered haplotypes that do not carry the variant are missing (.)."""
+    alleles = []
+    for haplotype in range(1, num_haplotypes + 1):
+        if haplotype in haplotypes:
+            alleles.append("1")
+        elif haplotype in uncovered_haplotypes:
+            alleles.append(".")
         else:
-            logging.error("Cluster size should be either 1 or 2 but is " + str(len(cluster)))
+            alleles.append("0")
+    return "/".join(alleles)
 
-    #INSERTIONS
-    logging.info("Pairing {0} insertions...".format(len(insertion_candidates1) + len(insertion_candidates2)))
-    partitions = form_partitions(insertion_candidates1 + insertion_candidates2, 10000)
-    clusters = pair_haplotypes(partitions, reference, edit_distance_threshold)
-    for cluster in clusters:
-        if len(cluster) == 1:
-            candidate = cluster[0][1]
-            genotype = "1/0" if cluster[0][0] == 1 else "0/1"
-            paired_candidates.append(CandidateInsertion(candidate.dest_contig, 
-                                                        candidate.dest_start, 
-                                                        candidate.dest_end, 
-                                                        candidate.reads, 
-                                                        candidate.sequence, 
-                                                        bam, 
-                                                        genotype))
-        elif len(cluster) == 2:
-            candidate = cluster[0][1]
-            reads = cluster[0][1].reads + cluster[1][1].reads
-            genotype = "1/1"
-            paired_candidates.append(CandidateInsertion(candidate.dest_contig, 
-                                                        candidate.dest_start, 
-                                                        candidate.dest_end, 
-                                                        reads, 
-                                                        candidate.sequence, 
-                                                        bam, 
-                                                        genotype))
-        else:
-            logging.error("Cluster size should be either 1 or 2 but is " + str(len(cluster)))
 
-    #TANDEM DUPLICATIONS
-    logging.info("Pairing {0} tandem duplications...".format(len(tandem_duplication_candidates1) + len(tandem_duplication_candidates2)))
-    partitions = form_partitions(tandem_duplication_candidates1 + tandem_duplication_candidates2, 10000)
-    clusters = pair_haplotypes(partitions, reference, edit_distance_threshold)
-    for cluster in clusters:
-        if len(cluster) == 1:
-            candidate = cluster[0][1]
-            genotype = "1/0" if cluster[0][0] == 1 else "0/1"
-            paired_candidates.append(CandidateDuplicationTandem(candidate.source_contig, 
-                                                                candidate.source_start, 
-                                                                candidate.source_end, 
-                                                                candidate.copies, 
-                                                                candidate.fully_covered, 
-                                                                candidate.reads,
-                                                                bam, 
-                                                                genotype))
-        elif len(cluster) == 2:
-            candidate = cluster[0][1]
-            fully_covered = cluster[0][1].fully_covered or cluster[1][1].fully_covered
-            reads = cluster[0][1].reads + cluster[1][1].reads
-            genotype = "1/1"
-            paired_candidates.append(CandidateDuplicationTandem(candidate.source_contig, 
-                                                                candidate.source_start, 
-                                                                candidate.source_end, 
-                                                                round(mean([cluster[0][1].copies, cluster[1][1].copies])),
-                                                                fully_covered,
-                                                                reads, 
-                                                                bam, 
-                                                                genotype))
-        else:
-            logging.error("Cluster size should be either 1 or 2 but is " + str(len(cluster)))
+def get_uncovered_haplotypes(cluster, coverages):
+    """Return the haplotypes (numbered from 1) without a candidate in the cluster whose alignments do not cover the variant"""
+    if coverages is None:
+        return set()
+    carriers = set(haplotype for haplotype, member in cluster)
+    candidate = cluster[0][1]
+    return set(haplotype for haplotype, coverage in enumerate(coverages, 1) if haplotype not in carriers and not coverage.covers_candidate(candidate))
 
-    #INTERSPERSED DUPLICATIONS
-    logging.info("Pairing {0} interspersed duplications...".format(len(interspersed_duplication_candidates1) + len(interspersed_duplication_candidates2)))
-    partitions = form_partitions(interspersed_duplication_candidates1 + interspersed_duplication_candidates2, 10000)
-    clusters = pair_haplotypes(partitions, reference, edit_distance_threshold)
-    for cluster in clusters:
-        if len(cluster) == 1:
-            candidate = cluster[0][1]
-            genotype = "1/0" if cluster[0][0] == 1 else "0/1"
-            paired_candidates.append(CandidateDuplicationInterspersed(candidate.source_contig, 
-                                                                      candidate.source_start, 
-                                                                      candidate.source_end, 
-                                                                      candidate.dest_contig, 
-                                                                      candidate.dest_start, 
-                                                                      candidate.dest_end,
-                                                                      candidate.reads,
-                                                                      bam, 
-                                                                      candidate.cutpaste,
-                                                                      genotype))
-        elif len(cluster) == 2:
-            candidate = cluster[0][1]
-            reads = cluster[0][1].reads + cluster[1][1].reads
-            cutpaste = cluster[0][1].cutpaste or cluster[1][1].cutpaste
-            genotype = "1/1"
-            paired_candidates.append(CandidateDuplicationInterspersed(candidate.source_contig, 
-                                                                      candidate.source_start, 
-                                                                      candidate.source_end, 
-                                                                      candidate.dest_contig, 
-                                                                      candidate.dest_start, 
-                                                                      candidate.dest_end,
-                                                                      reads,
-                                                                      bam, 
-                                                                      cutpaste,
-                                                                      genotype))
-        else:
-            logging.error("Cluster size should be either 1 or 2 but is " + str(len(cluster)))
 
-    #BREAKENDS
-    logging.info("Pairing {0} breakends...".format(len(breakend_candidates1) + len(breakend_candidates2)))
-    partitions = form_partitions(breakend_candidates1 + breakend_candidates2, 10000)
-    clusters = pair_haplotypes_breakends(partitions)
+def merge_clusters(clusters, num_haplotypes, bam, coverages = None, drop_uncovered = False):
+    """Merge each cluster into a single candidate (see merge_cluster) and yield the merged candidates.
+    Haplotypes that do not cover a variant according to coverages are missing in its genotype or,
+    with drop_uncovered, the variant is dropped."""
     for cluster in clusters:
-        if len(cluster) == 1:
-            candidate = cluster[0][1]
-            genotype = "1/0" if cluster[0][0] == 1 else "0/1"
-            paired_candidates.append(CandidateBreakend(candidate.source_contig, 
-                                                        candidate.source_start, 
-                                                        candidate.source_direction, 
-                                                        candidate.dest_contig, 
-                                                        candidate.dest_start, 
-                                                        candidate.dest_direction,
-                                                        candidate.reads,
-                                                        bam,
-                                                        genotype))
-        elif len(cluster) == 2:
-            candidate = cluster[0][1]
-            reads = cluster[0][1].reads + cluster[1][1].reads
-            genotype = "1/1"
-            paired_candidates.append(CandidateBreakend(candidate.source_contig, 
-                                                        candidate.source_start, 
-                                                        candidate.source_direction, 
-                                                        candidate.dest_contig, 
-                                                        candidate.dest_start, 
-                                                        candidate.dest_direction,
-                                                        reads,
-                                                        bam,
-                                                        genotype))
+        uncovered_haplotypes = get_uncovered_haplotypes(cluster, coverages)
+        if drop_uncovered and len(uncovered_haplotypes) > 0:
+            continue
+        yield merge_cluster(cluster, num_haplotypes, bam, uncovered_haplotypes)
+
+
+def merge_cluster(cluster, num_haplotypes, bam, uncovered_haplotypes = ()):
+    """Merge a cluster of (haplotype, candidate) with at most one candidate per haplotype into a single candidate.
+    The position is taken from the first candidate and the genotype lists all haplotypes carrying the variant."""
+    candidate = cluster[0][1]
+    reads = tuple(read for haplotype, member in cluster for read in member.reads)
+    genotype = get_genotype(set(haplotype for haplotype, member in cluster), num_haplotypes, uncovered_haplotypes)
+    if candidate.type == "DEL":
+        return CandidateDeletion(candidate.source_contig, 
+                                 candidate.source_start, 
+                                 candidate.source_end, 
+                                 reads,
+                                 bam,
+                                 genotype)
+    elif candidate.type == "INV":
+        complete = any(member.complete for haplotype, member in cluster)
+        return CandidateInversion(candidate.source_contig, 
+                                  candidate.source_start, 
+                                  candidate.source_end, 
+                                  reads, 
+                                  complete, 
+                                  bam, 
+                                  genotype)
+    elif candidate.type == "INS":
+        return CandidateInsertion(candidate.dest_contig, 
+                                  candidate.dest_start, 
+                                  candidate.dest_end, 
+                                  reads, 
+                                  candidate.sequence, 
+                                  bam, 
+                                  genotype)
+    elif candidate.type == "DUP_TAN":
+        fully_covered = any(member.fully_covered for haplotype, member in cluster)
+        return CandidateDuplicationTandem(candidate.source_contig, 
+                                          candidate.source_start, 
+                                          candidate.source_end, 
+                                          round(mean([member.copies for haplotype, member in cluster])),
+                                          fully_covered,
+                                          reads, 
+                                          bam, 
+                                          genotype)
+    elif candidate.type == "DUP_INT":
+        cutpaste = any(member.cutpaste for haplotype, member in cluster)
+        return CandidateDuplicationInterspersed(candidate.source_contig, 
+                                                candidate.source_start, 
+                                                candidate.source_end, 
+                                                candidate.dest_contig, 
+                                                candidate.dest_start, 
+                                                candidate.dest_end,
+                                                reads,
+                                                bam, 
+                                                cutpaste,
+                                                genotype)
+    elif candidate.type == "BND":
+        return CandidateBreakend(candidate.source_contig, 
+                                 candidate.source_start, 
+                                 candidate.source_direction, 
+                                 candidate.dest_contig, 
+                                 candidate.dest_start, 
+                                 candidate.dest_direction,
+                                 reads,
+                                 bam,
+                                 genotype)
+
+
+def count_candidates(sv_candidates, sv_type):
+    if isinstance(sv_candidates, SpillingCandidateList):
+        return sv_candidates.count_type(sv_type)
+    return sum(1 for cand in sv_candidates if cand.type == sv_type)
+
+
+def pair_candidates_multi(sv_candidate_lists, reference, edit_distance_threshold, bam, max_memory = None, directory = None, breakpoint_windows = None,
+                          sketch_prefilter = False, coverages = None, drop_uncovered = False, candidate_types = None, linkage_cache = None):
+    """Jointly cluster the SV candidates of N haplotypes (one list per haplotype) and merge each cluster
+    into one candidate with a genotype vector over all haplotypes. The candidates of all haplotypes are merged
+    into one stream sorted by key which is partitioned by position and clustered with at most one candidate per haplotype.
+    Candidate lists that were spilled to disk are already sorted and are read back in a k-way merge.
+    With a memory budget, the paired candidates are returned as a SpillingCandidateList.
+    breakpoint_windows and sketch_prefilter are passed on to pair_haplotypes.
+    If the covered reference intervals of each haplotype (coverages) are given, haplotypes that do not cover a variant
+    are missing in its genotype or, with drop_uncovered, the variant is dropped.
+    If candidate_types is given, candidates of other types are neither paired nor returned.
+    If a linkage_cache is given, the clustering of each partition is added to it for later threshold sweeps."""
+    num_haplotypes = len(sv_candidate_lists)
+    # Partitions can contain one candidate per haplotype for a few nearby variants
+    max_partition_size = 5 * num_haplotypes
+    sv_types = [("DEL", "deletions"), ("INV", "inversions"), ("INS", "insertions"), ("DUP_TAN", "tandem duplications"), ("DUP_INT", "interspersed duplications"), ("BND", "breakends")]
+    if candidate_types is not None:
+        sv_types = [(sv_type, sv_type_name) for sv_type, sv_type_name in sv_types if sv_type in candidate_types]
+    for sv_type, sv_type_name in sv_types:
+        logging.info("Pairing {0} {1}...".format(sum(count_candidates(sv_candidates, sv_type) for sv_candidates in sv_candidate_lists), sv_type_name))
+
+    def haplotype_stream(haplotype, sv_candidates):
+        if isinstance(sv_candidates, SpillingCandidateList):
+            #Spilled candidates are sorted by key and therefore by type
+            spilled_candidates = sv_candidates
+            sv_candidates = (candidate for sv_type in sorted(spilled_candidates.sorters.keys()) if candidate_types is None or sv_type in candidate_types
+                             for candidate in spilled_candidates.iter_type(sv_type))
+        else:
+            sv_candidates = sorted((candidate for candidate in sv_candidates if candidate_types is None or candidate.type in candidate_types),
+                                   key=lambda cand: cand.get_key())
+        for candidate in sv_candidates:
+            yield (haplotype, candidate)
+
+    # Merging is stable: candidates with equal keys are ordered by haplotype and then by their order within the haplotype
+    sorted_candidates = merge(*[haplotype_stream(haplotype, sv_candidates) for haplotype, sv_candidates in enumerate(sv_candidate_lists, 1)],
+                              key=lambda entry: entry[1].get_key())
+    paired_candidates = new_candidate_list(max_memory, directory)
+    for partition in iterate_partitions(sorted_candidates, 10000):
+        if partition[0][1].type == "BND":
+            clusters = pair_haplotypes_breakends([partition], max_partition_size = max_partition_size)
+            #Breakend clusters do not depend on the edit distance threshold
+            if linkage_cache is not None:
+                for cluster in clusters:
+                    linkage_cache.add(cluster)
         else:
-            logging.error("Cluster size should be either 1 or 2 but is " + str(len(cluster)))
+            clusters = pair_haplotypes([partition], reference, edit_distance_threshold, max_partition_size, breakpoint_windows, sketch_prefilter, linkage_cache)
+        paired_candidates.extend(merge_clusters(clusters, num_haplotypes, bam, coverages, drop_uncovered))
     return paired_candidates
 
 
+def pair_candidates(sv_candidates1, sv_candidates2, reference, edit_distance_threshold, bam):
+    return pair_candidates_multi([sv_candidates1, sv_candidates2], reference, edit_distance_threshold, bam)
+
+
+def nice_position_key(position):
+    """Sort key of a position (contig, start, end) where contig names are ordered the way that humans expect"""
+    convert = lambda text: int(text) if text.isdigit() else text
+    alphanum_key = lambda key: [ convert(c) for c in re.split('([0-9]+)', key) ]
+    return ( alphanum_key(str(position[0])), position[1], position[2] )
+
+
 def sorted_nicely(vcf_entries):
-    """ Sort the given vcf entries (in the form ((contig, start, end), vcf_string, sv_type)) in the way that humans expect.
+    """ Sort the given vcf entries (in the form ((contig, start, end), vcf_record, sv_type)) in the way that humans expect.
         e.g. chr10 comes after chr2
         Algorithm adapted from https://blog.codinghorror.com/sorting-for-humans-natural-sort-order/"""
-    convert = lambda text: int(text) if text.isdigit() else text
-    alphanum_key = lambda key: [ convert(c) for c in re.split('([0-9]+)', key) ]
-    tuple_key = lambda entry: ( alphanum_key(str(entry[0][0])), entry[0][1], entry[0][2] )
-    return sorted(vcf_entries, key = tuple_key)
+    return sorted(vcf_entries, key = lambda entry: nice_position_key(entry[0]))
 
 
-def write_final_vcf(int_duplication_candidates,
-                    inversion_candidates, 
-                    tandem_duplication_candidates, 
-                    deletion_candidates, 
-                    insertion_candidates, 
-                    breakend_candidates, 
-                    version, 
-                    contig_names, 
-                    contig_lengths,
-                    types_to_output,
-                    reference,
-                    options):
-    vcf_output = open(options.working_dir + '/variants.vcf', 'w')
-
-    # Write header lines
-    print("##fileformat=VCFv4.2", file=vcf_output)
-    print("##fileDate={0}".format(time.strftime("%Y-%m-%d|%I:%M:%S%p|%Z|%z")), file=vcf_output)
-    print("##source=SVIM-asm-v{0}".format(version), file=vcf_output)
-    for contig_name, contig_length in zip(contig_names, contig_lengths):
-        print("##contig=<ID={0},length={1}>".format(contig_name, contig_length), file=vcf_output)
+def get_vcf_jobs(candidates_with_order, types_to_output, options):
+    """Prepare VCF records depending on command-line parameters.
+    candidates_with_order(sv_type) returns (order, candidate) pairs of the given SV type.
+    Yields (position, svtype, candidate, function returning the VCF record, whether the function needs sequence alleles, order)
+    where order ranks records with equal positions in the same way for in-memory and spilled candidates."""
     if "DEL" in types_to_output:
-        print("##ALT=<ID=DEL,Description=\"Deletion\">", file=vcf_output)
+        for order, candidate in candidates_with_order("DEL"):
+            yield (candidate.get_source(), "DEL", candidate, candidate.get_vcf_record, True, (0, order))
     if "INV" in types_to_output:
-        print("##ALT=<ID=INV,Description=\"Inversion\">", file=vcf_output)
-    if (not options.tandem_duplications_as_insertions and "DUP:TANDEM" in types_to_output) or \
-       (not options.interspersed_duplications_as_insertions and "DUP:INT" in types_to_output):
-        print("##ALT=<ID=DUP,Description=\"Duplication\">", file=vcf_output)
-    if not options.tandem_duplications_as_insertions and "DUP:TANDEM" in types_to_output:
-        print("##ALT=<ID=DUP:TANDEM,Description=\"Tandem Duplication\">", file=vcf_output)
-    if not options.interspersed_duplications_as_insertions and "DUP:INT" in types_to_output:
-        print("##ALT=<ID=DUP:INT,Description=\"Interspersed Duplication\">", file=vcf_output)
+        for order, candidate in candidates_with_order("INV"):
+            yield (candidate.get_source(), "INV", candidate, candidate.get_vcf_record, True, (1, order))
     if "INS" in types_to_output:
-        print("##ALT=<ID=INS,Description=\"Insertion\">", file=vcf_output)
-    if "BND" in types_to_output:
-        print("##ALT=<ID=BND,Description=\"Breakend\">", file=vcf_output)
-    print("##INFO=<ID=SVTYPE,Number=1,Type=String,Description=\"Type of structural variant\">", file=vcf_output)
-    print("##INFO=<ID=CUTPASTE,Number=0,Type=Flag,Description=\"Genomic origin of interspersed duplication seems to be deleted\">", file=vcf_output)
-    print("##INFO=<ID=END,Number=1,Type=Integer,Description=\"End position of the variant described in this record\">", file=vcf_output)
-    print("##INFO=<ID=SVLEN,Number=1,Type=Integer,Description=\"Difference in length between REF and ALT alleles\">", file=vcf_output)    
-    if options.query_names:
-        print("##INFO=<ID=READS,Number=.,Type=String,Description=\"Names of all supporting reads\">", file=vcf_output)
-    print("##FILTER=<ID=not_fully_covered,Description=\"Tandem duplication is not fully covered by a contig\">", file=vcf_output)
-    print("##FILTER=<ID=incomplete_inversion,Description=\"Only one inversion breakpoint is supported\">", file=vcf_output)
-    print("##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">", file=vcf_output)
-    if not options.tandem_duplications_as_insertions and "DUP:TANDEM" in types_to_output:
-        print("##FORMAT=<ID=CN,Number=1,Type=Integer,Description=\"Copy number of tandem duplication (e.g. 2 for one additional copy)\">", file=vcf_output)
-    print("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" + options.sample, file=vcf_output)
-
-
-    # Prepare VCF entries depending on command-line parameters
-    vcf_entries = []
-    sequence_alleles = not options.symbolic_alleles
-    if "DEL" in types_to_output:
-        for candidate in deletion_candidates:
-            vcf_entries.append((candidate.get_source(), candidate.get_vcf_entry(sequence_alleles, reference, options.query_names), "DEL"))
-    if "INV" in types_to_output:
-        for candidate in inversion_candidates:
-            vcf_entries.append((candidate.get_source(), candidate.get_vcf_entry(sequence_alleles, reference, options.query_names), "INV"))
-    if "INS" in types_to_output:
-        for candidate in insertion_candidates:
-            vcf_entries.append((candidate.get_destination(), candidate.get_vcf_entry(sequence_alleles, reference, options.query_names), "INS"))
+        for order, candidate in candidates_with_order("INS"):
+            yield (candidate.get_destination(), "INS", candidate, candidate.get_vcf_record, True, (2, order))
     if options.tandem_duplications_as_insertions:
         if "INS" in types_to_output:
-            for candidate in tandem_duplication_candidates:
-                vcf_entries.append((candidate.get_source(), candidate.get_vcf_entry_as_ins(sequence_alleles, reference, options.query_names), "INS"))
+            for order, candidate in candidates_with_order("DUP_TAN"):
+                yield (candidate.get_source(), "INS", candidate, candidate.get_vcf_record_as_ins, True, (3, order))
     else:
         if "DUP:TANDEM" in types_to_output:
-            for candidate in tandem_duplication_candidates:
-                vcf_entries.append((candidate.get_source(), candidate.get_vcf_entry_as_dup(options.query_names), "DUP_TANDEM"))
+            for order, candidate in candidates_with_order("DUP_TAN"):
+                yield (candidate.get_source(), "DUP_TANDEM", candidate, candidate.get_vcf_record_as_dup, False, (3, order))
     if options.interspersed_duplications_as_insertions:
         if "INS" in types_to_output:
-            for candidate in int_duplication_candidates:
-                vcf_entries.append((candidate.get_destination(), candidate.get_vcf_entry_as_ins(sequence_alleles, reference, options.query_names), "INS"))
+            for order, candidate in candidates_with_order("DUP_INT"):
+                yield (candidate.get_destination(), "INS", candidate, candidate.get_vcf_record_as_ins, True, (4, order))
     else:
         if "DUP:INT" in types_to_output:
-            for candidate in int_duplication_candidates:
-                vcf_entries.append((candidate.get_source(), candidate.get_vcf_entry_as_dup(options.query_names), "DUP_INT"))
+            for order, candidate in candidates_with_order("DUP_INT"):
+                yield (candidate.get_source(), "DUP_INT", candidate, candidate.get_vcf_record_as_dup, False, (4, order))
     if "BND" in types_to_output:
-        for candidate in breakend_candidates:
-            vcf_entries.append(((candidate.get_source()[0], candidate.get_source()[1], candidate.get_source()[1] + 1), candidate.get_vcf_entry(options.query_names), "BND"))
-            vcf_entries.append(((candidate.get_destination()[0], candidate.get_destination()[1], candidate.get_destination()[1] + 1), candidate.get_vcf_entry_reverse(options.query_names), "BND"))
+        for order, candidate in candidates_with_order("BND"):
+            yield ((candidate.get_source()[0], candidate.get_source()[1], candidate.get_source()[1] + 1), "BND", candidate, candidate.get_vcf_record, False, (5, order, 0))
+            yield ((candidate.get_destination()[0], candidate.get_destination()[1], candidate.get_destination()[1] + 1), "BND", candidate, candidate.get_vcf_record_reverse, False, (5, order, 1))
 
-    if sequence_alleles:
-        reference.close()
 
-    # Sort and write entries to VCF
+def write_vcf_entries(sorted_vcf_entries, vcf_writer):
+    """Assign IDs to the sorted entries (position, vcf_record, sv_type, ...) and write them"""
     svtype_counter = defaultdict(int)
-    for source, entry, svtype in sorted_nicely(vcf_entries):
+    for entry in sorted_vcf_entries:
+        record, svtype = entry[1], entry[2]
         variant_id = "svim_asm.{svtype}.{number}".format(svtype = svtype, number = svtype_counter[svtype] + 1)
-        entry_with_id = entry.replace("PLACEHOLDERFORID", variant_id, 1)
         svtype_counter[svtype] += 1
-        print(entry_with_id, file=vcf_output)
+        vcf_writer.write(record, variant_id)
+
+
+def format_vcf_entries(vcf_jobs, reference, options):
+    """Build the VCF entries (position, vcf_record, svtype) of the given jobs and return them sorted by position.
+    Sequence alleles are retrieved in genomic order from blocks of the reference."""
+    sequence_alleles = not options.symbolic_alleles
+    read_names = get_read_names_argument(options)
+    if sequence_alleles:
+        allele_regions = [job[2].get_allele_regions() if job[4] else [] for job in vcf_jobs]
+        block_reference = BlockReference(reference, (region for regions in allele_regions for region in regions))
+        job_order = sorted(range(len(vcf_jobs)), key=lambda index: allele_regions[index][0] if len(allele_regions[index]) > 0 else ("", 0, 0))
+    else:
+        job_order = range(len(vcf_jobs))
+
+    vcf_entries = [None] * len(vcf_jobs)
+    for index in job_order:
+        position, svtype, candidate, get_record, needs_alleles, order = vcf_jobs[index]
+        if needs_alleles:
+            vcf_entries[index] = (position, get_record(sequence_alleles, block_reference if sequence_alleles else reference, read_names), svtype)
+        else:
+            vcf_entries[index] = (position, get_record(read_names), svtype)
+
+    if sequence_alleles:
+        block_reference.close()
+    return sorted_nicely(vcf_entries)
+
+
+def group_vcf_jobs_by_contig(vcf_jobs):
+    """Split the VCF jobs into groups of the same contig. The groups are returned in output order
+    and the jobs of each group keep their relative order."""
+    groups = defaultdict(list)
+    for job in vcf_jobs:
+        groups[tuple(nice_position_key(job[0])[0])].append(job)
+    return [groups[contig_key] for contig_key in sorted(groups.keys())]
+
+
+def format_vcf_entries_pipelined(job_groups, reference, options):
+    """Yield the sorted VCF entries of all job groups in order. With more than one format thread, the groups
+    are formatted on a thread pool (each thread with its own reference handle) while the caller consumes
+    the entries of earlier groups. At most two groups per thread are formatted ahead of the caller."""
+    if options.format_threads <= 1 or len(job_groups) <= 1:
+        for vcf_jobs in job_groups:
+            yield from format_vcf_entries(vcf_jobs, reference, options)
+        return
+
+    thread_data = threading.local()
+    thread_references = []
+    lock = threading.Lock()
+
+    def format_group(vcf_jobs):
+        if options.symbolic_alleles:
+            return format_vcf_entries(vcf_jobs, reference, options)
+        if not hasattr(thread_data, "reference"):
+            thread_data.reference = reference.clone()
+            with lock:
+                thread_references.append(thread_data.reference)
+        return format_vcf_entries(vcf_jobs, thread_data.reference, options)
+
+    try:
+        with ThreadPoolExecutor(max_workers = options.format_threads) as executor:
+            pending = deque()
+            for vcf_jobs in job_groups:
+                pending.append(executor.submit(format_group, vcf_jobs))
+                if len(pending) >= 2 * options.format_threads:
+                    yield from pending.popleft().result()
+            while len(pending) > 0:
+                yield from pending.popleft().result()
+    finally:
+        for thread_reference in thread_references:
+            thread_reference.close()
+
+
+def write_final_vcf(int_duplication_candidates,
+                    inversion_candidates, 
+                    tandem_duplication_candidates, 
+                    deletion_candidates, 
+                    insertion_candidates, 
+                    breakend_candidates, 
+                    version, 
+                    contig_names, 
+                    contig_lengths,
+                    types_to_output,
+                    reference,
+                    options,
+                    vcf_writer = None):
+    """Write the candidates to the output file in the working directory or, if given, to vcf_writer"""
+    if vcf_writer is None:
+        header_lines = get_vcf_header_lines(version, contig_names, contig_lengths, types_to_output, options)
+        vcf_writer = open_vcf_writer(header_lines, options)
+
+    candidates_by_type = {"DEL": deletion_candidates,
+                          "INV": inversion_candidates,
+                          "INS": insertion_candidates,
+                          "DUP_TAN": tandem_duplication_candidates,
+                          "DUP_INT": int_duplication_candidates,
+                          "BND": breakend_candidates}
+    vcf_jobs = get_vcf_jobs(lambda sv_type: enumerate(candidates_by_type[sv_type]), types_to_output, options)
+    job_groups = group_vcf_jobs_by_contig(vcf_jobs)
+
+    # Format the records of each contig (including reference fetches) while the entries of earlier contigs are written
+    write_vcf_entries(format_vcf_entries_pipelined(job_groups, reference, options), vcf_writer)
+    vcf_writer.close()
+
+
+def write_final_vcf_spilled(sv_candidates,
+                            version,
+                            contig_names,
+                            contig_lengths,
+                            types_to_output,
+                            reference,
+                            options,
+                            vcf_writer = None):
+    """Write the candidates of a SpillingCandidateList to the output VCF (or, if given, to vcf_writer) within the memory
+    budget of options.max_memory. Candidates are read type by type in the order of their keys which also keeps reference
+    fetches in genomic order. The VCF entries are sorted with a SpillingSorter and written in the same order as by write_final_vcf."""
+    if vcf_writer is None:
+        header_lines = get_vcf_header_lines(version, contig_names, contig_lengths, types_to_output, options)
+        vcf_writer = open_vcf_writer(header_lines, options)
+    sequence_alleles = not options.symbolic_alleles
+    read_names = get_read_names_argument(options)
+
+    vcf_entries = SpillingSorter(key = lambda entry: (nice_position_key(entry[0]), entry[3]),
+                                 estimate_size = estimate_vcf_entry_size,
+                                 max_memory = options.max_memory,
+                                 directory = options.working_dir)
+    for position, svtype, candidate, get_record, needs_alleles, order in get_vcf_jobs(sv_candidates.iter_type_with_order, types_to_output, options):
+        if needs_alleles:
+            record = get_record(sequence_alleles, reference, read_names)
+        else:
+            record = get_record(read_names)
+        vcf_entries.add((position, record, svtype, order))
 
-    vcf_output.close()
\ No newline at end of file
+    write_vcf_entries(vcf_entries, vcf_writer)
+    vcf_entries.close()
+    vcf_writer.close()
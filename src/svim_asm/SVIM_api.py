@@ -0,0 +1,225 @@
+"""Python interface to the COLLECT, PAIR and OUTPUT steps of SVIM-asm for use in other pipelines.
+
+    from svim_asm.SVIM_api import collect, pair, write_vcf
+
+    haplotype1 = collect("hap1.bam", regions = ["chr1", "chr2:1000000-2000000"], min_sv_size = 50)
+    haplotype2 = collect("hap2.bam", regions = ["chr1", "chr2:1000000-2000000"], min_sv_size = 50)
+    write_vcf(pair(haplotype1, haplotype2, reference = "genome.fa"), "variants.vcf", reference = "genome.fa")
+
+Parameters are given as keyword arguments named like the command-line options (e.g. min_mapq, max_edit_distance,
+query_names). Parameters that are not given take the defaults of the command-line interface.
+No files are written except for the output of write_vcf.
+
+Candidates can be saved to and loaded from a compact binary candidate store (see SVIM_store):
+
+    save_candidates(collect("hap1.bam"), "hap1.svim")
+    store = load_candidates("hap1.svim")
+"""
+
+import re
+import argparse
+import pysam
+
+from svim_asm.SVIM_input_parsing import add_collect_arguments, add_collect_process_arguments, add_pair_arguments, add_output_arguments
+from svim_asm.SVIM_COLLECT import analyze_regions_coordsorted, analyze_alignment_file_querysorted
+from svim_asm.SVIM_COMBINE import pair_candidates_multi, get_breakpoint_windows, write_final_vcf, write_final_vcf_spilled
+from svim_asm.SVIM_pipeline import is_coordsorted_and_indexed
+from svim_asm.SVIM_reference import open_reference
+from svim_asm.SVIM_shard import ContigTable
+from svim_asm.SVIM_spill import SpillingCandidateList, new_candidate_list, parse_memory_size
+from svim_asm.SVIM_store import save_candidates as save_candidate_store, load_candidates as load_candidate_store
+from svim_asm.SVIM_vcf import get_vcf_header_lines, TextVcfWriter, HtslibVcfWriter
+from svim_asm.SVCandidate import QueryNameTable, get_candidate_types
+
+
+def get_version():
+    """Return the version of the installed svim-asm package"""
+    try:
+        from importlib.metadata import version
+        return version("svim-asm")
+    except Exception:
+        return "unknown"
+
+
+def get_options(**params):
+    """Return an options namespace with the command-line defaults, overridden by the given keyword arguments"""
+    # The defaults are taken from the same argument groups as in the haploid, diploid and polyploid modes
+    parser = argparse.ArgumentParser()
+    group_collect = parser.add_argument_group('COLLECT')
+    add_collect_arguments(group_collect)
+    add_collect_process_arguments(group_collect)
+    add_pair_arguments(parser.add_argument_group('PAIR'))
+    add_output_arguments(parser.add_argument_group('OUTPUT'))
+    options = parser.parse_args([])
+    options.genome = None
+    # Temporary files of max_memory are written to the system's temporary directory unless a working_dir is given
+    options.working_dir = None
+    for key, value in params.items():
+        if not hasattr(options, key):
+            raise TypeError("Unknown parameter: {0}".format(key))
+        if key == "max_memory" and isinstance(value, str):
+            value = parse_memory_size(value)
+        setattr(options, key, value)
+    # Candidates of the API store the names of their supporting query sequences directly (see collect)
+    options.query_name_table = None
+    options.candidate_types = get_candidate_types(options)
+    return options
+
+
+def save_candidates(candidates, path):
+    """Save SV candidates to a candidate store. The names of supporting query sequences are saved
+    if the candidates were collected with query_names = True."""
+    return save_candidate_store(candidates, path, True)
+
+
+def load_candidates(path, query_names = False):
+    """Open a candidate store. With query_names = True, the names of supporting query sequences are loaded as well."""
+    return load_candidate_store(path, query_names)
+
+
+def parse_region(region):
+    """Parse a region given as contig name, samtools-style string (chr1:1001-2000, 1-based) or tuple (contig, start, end) with 0-based start"""
+    if not isinstance(region, str):
+        contig, start, end = region
+        return (contig, start, end)
+    match = re.match(r"^(.+):([0-9,]+)-([0-9,]+)$", region)
+    if match is None:
+        return (region, None, None)
+    return (match.group(1), int(match.group(2).replace(",", "")) - 1, int(match.group(3).replace(",", "")))
+
+
+def open_reference_argument(reference):
+    """Return (reference, whether it was opened here) for a reference given as FASTA path or opened reference"""
+    if isinstance(reference, str):
+        return open_reference(reference), True
+    return reference, False
+
+
+def collect(bam, regions = None, **params):
+    """Yield the SV candidates detected in the given SAM/BAM/CRAM file (path or pysam.AlignmentFile).
+    Coordinate-sorted and indexed files are read chromosome by chromosome (or region by region) and candidates are
+    yielded as soon as each alignment has been analyzed. Other files are read in one streaming pass and yielded in the
+    same order afterwards. Regions are only supported for indexed files. Use genome = <FASTA> to decode CRAM files.
+    With query_names = True, the candidates list the names of their supporting query sequences."""
+    options = get_options(**params)
+    # Query IDs are only used within this call and replaced by the names before the candidates are yielded
+    options.query_name_table = QueryNameTable() if options.query_names else None
+    own_bam = isinstance(bam, str)
+    if own_bam:
+        aln_file = pysam.AlignmentFile(bam, threads = options.io_threads, reference_filename = options.genome)
+    else:
+        aln_file = bam
+    try:
+        if bam != "-" and is_coordsorted_and_indexed(aln_file):
+            if regions is None:
+                regions = [(contig, None, None) for contig in aln_file.references]
+            sv_candidates = analyze_regions_coordsorted(aln_file, [parse_region(region) for region in regions], options)
+        elif regions is not None:
+            raise ValueError("Regions can only be analyzed in coordinate-sorted and indexed alignment files")
+        else:
+            sv_candidates = analyze_alignment_file_querysorted(aln_file, options)
+        for candidate in sv_candidates:
+            if options.query_name_table is not None:
+                candidate.reads = tuple(options.query_name_table.get_names(candidate.reads))
+            yield candidate
+    finally:
+        if own_bam:
+            aln_file.close()
+
+
+def pair(*haplotypes, reference, **params):
+    """Pair the SV candidates of two or more haplotypes (iterables of candidates) and yield the merged candidates
+    with genotypes listing the haplotypes in the given order. The reference (FASTA path or opened reference) is
+    used to compare the sequences of candidates. With max_memory, the candidates are spilled to disk
+    when they exceed the memory budget."""
+    options = get_options(**params)
+    reference, own_reference = open_reference_argument(reference)
+    sv_candidate_lists = []
+    try:
+        for haplotype in haplotypes:
+            sv_candidates = new_candidate_list(options.max_memory, options.working_dir)
+            sv_candidates.extend(haplotype)
+            sv_candidate_lists.append(sv_candidates)
+        # Merged candidates only need the contig lengths, which are taken from the reference
+        contig_table = ContigTable(reference.references, reference.lengths)
+        paired_candidates = pair_candidates_multi(sv_candidate_lists, reference, options.max_edit_distance, contig_table,
+                                                  options.max_memory, options.working_dir, get_breakpoint_windows(options), options.sketch_prefilter,
+                                                  candidate_types = get_candidate_types(options))
+        yield from paired_candidates
+    finally:
+        for sv_candidates in sv_candidate_lists:
+            if hasattr(sv_candidates, "close"):
+                sv_candidates.close()
+        if own_reference:
+            reference.close()
+
+
+def write_vcf(candidates, sink, reference, sample = "Sample", **params):
+    """Write the SV candidates in VCF format to sink, which is either an open text stream or a path.
+    Paths ending with .vcf.gz or .bcf are written compressed and indexed. The contigs of the VCF header are taken
+    from the reference (FASTA path or opened reference) which also provides the sequence alleles. With max_memory,
+    the candidates and VCF records are spilled to disk when they exceed the memory budget.
+    Returns the number of written records."""
+    options = get_options(sample = sample, **params)
+    reference, own_reference = open_reference_argument(reference)
+    types_to_output = [entry.strip() for entry in options.types.split(",")]
+    header_lines = get_vcf_header_lines(get_version(), reference.references, reference.lengths, types_to_output, options)
+    if isinstance(sink, str) and sink.endswith(".bcf"):
+        vcf_writer = HtslibVcfWriter(sink, header_lines, sample, mode = "wb", threads = options.output_threads)
+    elif isinstance(sink, str) and sink.endswith(".gz"):
+        vcf_writer = TextVcfWriter(sink, header_lines, sample, compressed = True, threads = options.output_threads, index_format = options.index_format)
+    else:
+        vcf_writer = TextVcfWriter(sink, header_lines, sample)
+    counter = CountingWriter(vcf_writer)
+
+    sv_candidates = new_candidate_list(options.max_memory, options.working_dir)
+    try:
+        sv_candidates.extend(candidates)
+        if isinstance(sv_candidates, SpillingCandidateList):
+            write_final_vcf_spilled(sv_candidates,
+                                    get_version(),
+                                    reference.references,
+                                    reference.lengths,
+                                    types_to_output,
+                                    reference,
+                                    options,
+                                    vcf_writer = counter)
+        else:
+            candidates_by_type = {"DEL": [], "INV": [], "INS": [], "DUP_TAN": [], "DUP_INT": [], "BND": []}
+            for candidate in sv_candidates:
+                candidates_by_type[candidate.type].append(candidate)
+            write_final_vcf(candidates_by_type["DUP_INT"],
+                            candidates_by_type["INV"],
+                            candidates_by_type["DUP_TAN"],
+                            candidates_by_type["DEL"],
+                            candidates_by_type["INS"],
+                            candidates_by_type["BND"],
+                            get_version(),
+                            reference.references,
+                            reference.lengths,
+                            types_to_output,
+                            reference,
+                            options,
+                            vcf_writer = counter)
+    finally:
+        if hasattr(sv_candidates, "close"):
+            sv_candidates.close()
+        if own_reference:
+            reference.close()
+    return counter.count
+
+
+class CountingWriter:
+    """Passes records through to a VCF writer and counts them"""
+    def __init__(self, vcf_writer):
+        self.vcf_writer = vcf_writer
+        self.count = 0
+
+
+    def write(self, record, variant_id):
+        self.count += 1
+        self.vcf_writer.write(record, variant_id)
+
+
+    def close(self):
+        self.vcf_writer.close()
@@ -0,0 +1,123 @@
+import os
+import logging
+import argparse
+
+from multiprocessing import Pool
+from time import strftime, localtime
+
+from svim_asm.SVIM_pipeline import run_sample, open_reference_or_log
+
+
+def read_manifest(path):
+    """Read the batch manifest and return a list of (sample, list of BAM files).
+    Each line contains a sample name followed by one (haploid), two (diploid) or more (polyploid) BAM files, separated by tabs."""
+    samples = []
+    sample_names = set()
+    with open(path) as manifest_file:
+        for line_number, line in enumerate(manifest_file, 1):
+            if line.strip() == "" or line.startswith("#"):
+                continue
+            fields = [field.strip() for field in line.rstrip("\n").split("\t")]
+            if len(fields) < 2:
+                raise ValueError("Line {0} of the manifest needs to contain a sample name and at least one BAM file.".format(line_number))
+            sample, bam_files = fields[0], fields[1:]
+            if sample in sample_names:
+                raise ValueError("Sample {0} is listed more than once in the manifest (line {1}).".format(sample, line_number))
+            sample_names.add(sample)
+            samples.append((sample, [os.path.abspath(bam_file) for bam_file in bam_files]))
+    return samples
+
+
+def schedule_samples(samples):
+    """Order samples by decreasing total size of their BAM files. Handing the largest samples out first
+    keeps the worker processes busy until the end instead of waiting for one large sample at the end."""
+    return sorted(samples, key=lambda sample: sum(os.path.getsize(bam_file) for bam_file in sample[1]), reverse=True)
+
+
+def get_sample_options(options, sample, bam_files):
+    """Derive the options of a single haploid, diploid or polyploid run from the batch options"""
+    sample_options = argparse.Namespace(**vars(options))
+    sample_options.sample = sample
+    sample_options.working_dir = os.path.join(options.working_dir, sample)
+    if len(bam_files) == 1:
+        sample_options.sub = 'haploid'
+        sample_options.bam_file = bam_files[0]
+    elif len(bam_files) == 2:
+        sample_options.sub = 'diploid'
+        sample_options.bam_file1, sample_options.bam_file2 = bam_files
+    else:
+        sample_options.sub = 'polyploid'
+        sample_options.bam_files = bam_files
+    return sample_options
+
+
+# Reference genome of the current worker process, opened once and shared by all samples the worker analyzes
+worker_reference = None
+
+
+def init_batch_worker(genome):
+    global worker_reference
+    rootLogger = logging.getLogger()
+    # Samples are logged to their own directories, not to the log file of the batch
+    for handler in list(rootLogger.handlers):
+        if isinstance(handler, logging.FileHandler):
+            rootLogger.removeHandler(handler)
+    worker_reference = open_reference_or_log(genome)
+
+
+def run_batch_sample(job):
+    """Analyze one sample of the batch and return (sample, success)"""
+    sample_options, version = job
+    if not os.path.exists(sample_options.working_dir):
+        os.makedirs(sample_options.working_dir)
+    rootLogger = logging.getLogger()
+    fileHandler = logging.FileHandler("{0}/SVIM_{1}.log".format(sample_options.working_dir, strftime("%y%m%d_%H%M%S", localtime())), mode="w")
+    fileHandler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)-7.7s]  %(message)s"))
+    rootLogger.addHandler(fileHandler)
+    try:
+        logging.info("SAMPLE: {0}".format(sample_options.sample))
+        success = run_sample(sample_options, version, worker_reference)
+    except Exception as e:
+        logging.error(e, exc_info=True)
+        success = False
+    finally:
+        rootLogger.removeHandler(fileHandler)
+        fileHandler.close()
+    return sample_options.sample, success
+
+
+def run_batch(options, version):
+    """Analyze all samples of the manifest on a pool of worker processes that share the reference genome.
+    Returns the list of samples that could not be analyzed."""
+    global worker_reference
+    samples = schedule_samples(read_manifest(options.manifest))
+    logging.info("Found {0} samples in manifest.".format(len(samples)))
+    jobs = [(get_sample_options(options, sample, bam_files), version) for sample, bam_files in samples]
+
+    # Check the reference once before any sample is analyzed
+    reference = open_reference_or_log(options.genome)
+    if reference is None:
+        return [sample for sample, bam_files in samples]
+
+    failed_samples = []
+    if options.processes > 1:
+        reference.close()
+        pool = Pool(processes = options.processes, initializer = init_batch_worker, initargs = (options.genome, ))
+        results = pool.imap_unordered(run_batch_sample, jobs, chunksize = 1)
+    else:
+        pool = None
+        worker_reference = reference
+        results = map(run_batch_sample, jobs)
+    for index, (sample, success) in enumerate(results, 1):
+        if success:
+            logging.info("Finished sample {0} ({1}/{2}).".format(sample, index, len(jobs)))
+        else:
+            logging.error("Sample {0} could not be analyzed ({1}/{2}).".format(sample, index, len(jobs)))
+            failed_samples.append(sample)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    else:
+        worker_reference = None
+        reference.close()
+    return failed_samples
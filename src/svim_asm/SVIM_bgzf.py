@@ -0,0 +1,77 @@
+import struct
+import zlib
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+#Maximum number of uncompressed bytes per BGZF block (same as htslib)
+BGZF_BLOCK_SIZE = 0xff00
+#Maximum size of a complete BGZF block (including header and footer)
+BGZF_MAX_BLOCK_SIZE = 0x10000
+#Empty block that marks the end of a BGZF file
+BGZF_EOF = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+
+def compress_block(data, level):
+    """Compress a chunk of at most BGZF_BLOCK_SIZE bytes into a complete BGZF block.
+    zlib releases the GIL so that several blocks can be compressed in parallel threads."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    #Fall back to stored (uncompressed) deflate blocks if the data is incompressible
+    if len(compressed) + 26 > BGZF_MAX_BLOCK_SIZE:
+        compressor = zlib.compressobj(0, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+    header = struct.pack("<BBBBIBBHBBHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(compressed) + 25)
+    footer = struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data))
+    return header + compressed + footer
+
+
+class BgzfWriter:
+    """Text file writer producing BGZF-compressed output (readable with gzip/bgzip and indexable with tabix).
+    Blocks are compressed by a pool of threads while the caller keeps on producing text."""
+    def __init__(self, path, threads = 1, level = 6):
+        self.handle = open(path, "wb")
+        self.level = level
+        self.buffer = bytearray()
+        self.executor = ThreadPoolExecutor(max_workers = threads) if threads > 1 else None
+        self.max_pending = 4 * threads
+        self.pending = deque()
+
+
+    def write(self, text):
+        self.buffer += text.encode()
+        while len(self.buffer) >= BGZF_BLOCK_SIZE:
+            self._submit(bytes(self.buffer[:BGZF_BLOCK_SIZE]))
+            del self.buffer[:BGZF_BLOCK_SIZE]
+        return len(text)
+
+
+    def _submit(self, data):
+        if self.executor is None:
+            self.handle.write(compress_block(data, self.level))
+            return
+        self.pending.append(self.executor.submit(compress_block, data, self.level))
+        #Write finished blocks in order and bound the number of blocks in flight
+        while self.pending and (len(self.pending) > self.max_pending or self.pending[0].done()):
+            self.handle.write(self.pending.popleft().result())
+
+
+    def close(self):
+        if len(self.buffer) > 0:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        while self.pending:
+            self.handle.write(self.pending.popleft().result())
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.handle.write(BGZF_EOF)
+        self.handle.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
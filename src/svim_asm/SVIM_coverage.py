@@ -0,0 +1,88 @@
+import numpy as np
+
+
+class CoverageRecorder:
+    """Collects the reference intervals covered by alignments during COLLECT. Intervals that overlap or touch
+    the previous interval of the same contig are merged right away, so coordinate-sorted input needs memory
+    proportional to the number of covered blocks rather than the number of alignments."""
+    def __init__(self):
+        self.intervals = dict()
+
+
+    def add(self, contig, start, end):
+        contig_intervals = self.intervals.setdefault(contig, [])
+        if len(contig_intervals) > 0:
+            last_start, last_end = contig_intervals[-1]
+            if last_start <= start <= last_end:
+                if end > last_end:
+                    contig_intervals[-1] = (last_start, end)
+                return
+        contig_intervals.append((start, end))
+
+
+    def finish(self):
+        """Return the recorded intervals as CoverageIntervals"""
+        return CoverageIntervals({contig: merge_intervals(contig_intervals) for contig, contig_intervals in self.intervals.items()})
+
+
+def merge_intervals(intervals):
+    """Sort and merge (start, end) intervals and return them as two arrays of starts and ends"""
+    merged_starts, merged_ends = [], []
+    for start, end in sorted(intervals):
+        if len(merged_ends) > 0 and start <= merged_ends[-1]:
+            merged_ends[-1] = max(merged_ends[-1], end)
+        else:
+            merged_starts.append(start)
+            merged_ends.append(end)
+    return (np.array(merged_starts, dtype = np.int64), np.array(merged_ends, dtype = np.int64))
+
+
+def get_candidate_loci(candidate):
+    """Return the reference positions (contig, position) that a haplotype needs to cover to support or
+    refute the given candidate: the breakpoints of DEL, INV and DUP_TAN, the insertion point of INS and DUP_INT
+    and both ends of BND."""
+    if candidate.type in ("DEL", "INV", "DUP_TAN"):
+        return [(candidate.source_contig, candidate.source_start), (candidate.source_contig, max(candidate.source_start, candidate.source_end - 1))]
+    elif candidate.type in ("INS", "DUP_INT"):
+        return [(candidate.dest_contig, candidate.dest_start)]
+    return [(candidate.source_contig, candidate.source_start), (candidate.dest_contig, candidate.dest_start)]
+
+
+class CoverageIntervals:
+    """Sorted, non-overlapping reference intervals covered by the alignments of one haplotype.
+    Queries use binary search and take O(log n) time."""
+    def __init__(self, intervals):
+        self.intervals = intervals
+
+
+    def covers(self, contig, position):
+        if contig not in self.intervals:
+            return False
+        starts, ends = self.intervals[contig]
+        index = np.searchsorted(starts, position, side = "right") - 1
+        return index >= 0 and position < ends[index]
+
+
+    def covers_candidate(self, candidate):
+        return all(self.covers(contig, position) for contig, position in get_candidate_loci(candidate))
+
+
+    def save(self, path):
+        contigs = list(self.intervals.keys())
+        np.savez(path,
+                 contigs = np.array(contigs, dtype = str),
+                 counts = np.array([len(self.intervals[contig][0]) for contig in contigs], dtype = np.int64),
+                 starts = np.concatenate([self.intervals[contig][0] for contig in contigs] + [np.zeros(0, dtype = np.int64)]),
+                 ends = np.concatenate([self.intervals[contig][1] for contig in contigs] + [np.zeros(0, dtype = np.int64)]))
+
+
+def load_coverage(paths):
+    """Load and merge the coverage intervals saved by CoverageIntervals.save() to the given paths"""
+    intervals = dict()
+    for path in paths:
+        with np.load(path) as data:
+            offset = 0
+            for contig, count in zip(data["contigs"].tolist(), data["counts"].tolist()):
+                intervals.setdefault(contig, []).extend(zip(data["starts"][offset:offset + count].tolist(), data["ends"][offset:offset + count].tolist()))
+                offset += count
+    return CoverageIntervals({contig: merge_intervals(contig_intervals) for contig, contig_intervals in intervals.items()})
@@ -3,17 +3,236 @@ import os
 import logging
 import argparse
 
+from svim_asm.SVIM_spill import parse_memory_size
+
+
+def add_collect_arguments(group):
+    """Add the options of the COLLECT step to the given argument group"""
+    group.add_argument('--min_mapq',
+                      type=int,
+                      default=20,
+                      help='Minimum mapping quality of alignments to consider (default: %(default)s). \
+                            Alignments with a lower mapping quality are ignored.')
+    group.add_argument('--min_sv_size',
+                      type=int,
+                      default=40,
+                      help='Minimum SV size to detect (default: %(default)s). \
+                            SVIM can potentially detect events of any size but is limited by the \
+                            signal-to-noise ratio in the input alignments. That means that more \
+                            accurate assemblies and alignments enable the detection of smaller events.')
+    group.add_argument('--max_sv_size',
+                      type=int,
+                      default=100000,
+                      help='Maximum SV size to detect (default: %(default)s). \
+                              This parameter is used to distinguish long deletions (and inversions) from \
+                              translocations which cannot be distinguished from the alignment alone. \
+                              Split read segments mapping far apart on the reference could either \
+                              indicate a very long deletion (inversion) or a translocation breakpoint. \
+                              SVIM calls a translocation breakpoint if the mapping distance is larger \
+                              than this parameter and a deletion (or inversion) if it is smaller or equal.')
+    group.add_argument('--query_gap_tolerance',
+                      type=int,
+                      default=50,
+                      help='Maximum tolerated gap between adjacent alignment segments on the query \
+                            (default: %(default)s). Example: \
+                            Deletions are detected from two subsequent segments of a split query sequence that are mapped \
+                            far apart from each other on the reference. The query gap tolerance determines \
+                            the maximum tolerated length of the query gap between both segments. If there is an \
+                            unaligned query segment larger than this value between the two segments, no deletion is called.')
+    group.add_argument('--query_overlap_tolerance',
+                      type=int,
+                      default=50,
+                      help='Maximum tolerated overlap between adjacent alignment segments on the query \
+                            (default: %(default)s). Example: \
+                            Deletions are detected from two subsequent segments of a split query sequence that are mapped \
+                            far apart from each other on the reference. The query overlap tolerance determines \
+                            the maximum tolerated length of an overlap between both segments in the query. If the \
+                            overlap between the two segments in the query is larger than this value, no deletion is called.')
+    group.add_argument('--reference_gap_tolerance',
+                      type=int,
+                      default=50,
+                      help='Maximum tolerated gap between adjacent alignment segments on the reference \
+                            (default: %(default)s). Example: \
+                            Insertions are detected from two segments of a split query sequence that are mapped \
+                            right next to each other on the reference but with unaligned sequence between them on the query. \
+                            The reference gap tolerance determines the maximum tolerated length of the reference gap between \
+                            both segments. If there is a reference gap larger than this value between the two segments, no \
+                            insertion is called.')
+    group.add_argument('--reference_overlap_tolerance',
+                      type=int,
+                      default=50,
+                      help='Maximum tolerated overlap between adjacent alignment segments on the reference \
+                            (default: %(default)s). Example: \
+                            Insertions are detected from two segments of a split query sequence that are mapped \
+                            right next to each other on the reference but with unaligned sequence between them on the query. \
+                            The reference overlap tolerance determines the maximum tolerated length of an overlap between \
+                            both segments on the reference. If there is a reference gap larger than this value between the \
+                            two segments, no insertion is called.')
+    group.add_argument('--io_threads',
+                      type=int,
+                      default=1,
+                      help='Number of threads used by htslib to decompress the input BAM/CRAM files (default: %(default)s). \
+                            With more than one thread, decompression overlaps with the detection of SVs. \
+                            CRAM files are decoded with the given reference genome.')
+    add_memory_argument(group)
+
+
+def add_collect_process_arguments(group):
+    """Add the options for running COLLECT on windows of the contigs in parallel to the given argument group"""
+    group.add_argument('--collect_processes',
+                      type=int,
+                      default=1,
+                      help='Number of processes that run COLLECT on windows of the contigs of coordinate-sorted and indexed input files \
+                            (default: %(default)s). Each alignment is analyzed in the window where it starts and the windows are merged \
+                            in genomic order, so the result is the same as with one process.')
+    group.add_argument('--collect_window_size',
+                      type=int,
+                      default=10000000,
+                      help='Size of the windows analyzed by the processes of --collect_processes (default: %(default)s). \
+                            Alignments that span several windows are read again and skipped in each further window they overlap, \
+                            so smaller windows spread the work more evenly but decode long alignments more often.')
+
+
+def add_memory_argument(group):
+    """Add the option for the memory budget of SV candidates to the given argument group"""
+    group.add_argument('--max_memory',
+                      type=parse_memory_size,
+                      default=None,
+                      help='Approximate memory budget for SV candidates and output records, e.g. 500M or 8G (default: no limit). \
+                            When the budget is exceeded, candidates are sorted and written to temporary files in the working directory. \
+                            PAIR and OUTPUT then read them back by merging the sorted files.')
+
+
+def parse_shard(value):
+    """Parse a shard given as i/N (1-based) into the tuple (i, N)"""
+    try:
+        index, num_shards = [int(field) for field in value.split("/")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("Shard must be given as i/N, e.g. 3/10")
+    if num_shards < 1 or index < 1 or index > num_shards:
+        raise argparse.ArgumentTypeError("Shard index must be between 1 and the number of shards")
+    return (index, num_shards)
+
+
+def parse_thresholds(value):
+    """Parse a comma-separated list of non-negative integers"""
+    try:
+        thresholds = [int(entry) for entry in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("Thresholds must be given as comma-separated integers, e.g. 50,100,200")
+    if any(threshold < 0 for threshold in thresholds):
+        raise argparse.ArgumentTypeError("Thresholds must not be negative")
+    return thresholds
+
+
+def add_pair_arguments(group):
+    """Add the options of the PAIR step to the given argument group"""
+    group.add_argument('--max_edit_distance',
+                      type=int,
+                      default=200,
+                      help='Maximum edit distance between both alleles to be paired up into a homozygous call (default: %(default)s).')
+    group.add_argument('--local_distance_min_size',
+                      type=int,
+                      default=None,
+                      help='Compare inversions and tandem duplications of at least this size only in windows around their breakpoints \
+                            instead of aligning the complete haplotypes. The difference in length (and copy number) is still checked exactly. \
+                            This makes pairing large SVs much faster (default: disabled).')
+    group.add_argument('--breakpoint_window_size',
+                      type=int,
+                      default=1000,
+                      help='Size of the windows around breakpoints used for --local_distance_min_size (default: %(default)s).')
+    group.add_argument('--sketch_prefilter',
+                      action='store_true',
+                      help='Compute q-gram sketches of the haplotypes of insertions and interspersed duplications and skip the alignment \
+                            of pairs whose edit distance is provably larger than --max_edit_distance. The results are unchanged.')
+    group.add_argument('--uncovered_haplotypes',
+                      type=str,
+                      choices=["ignore", "missing", "drop"],
+                      default="ignore",
+                      help='Treatment of haplotypes whose alignments (with sufficient mapping quality) do not cover a variant that was \
+                            found on other haplotypes, e.g. because of assembly gaps. With "missing", their allele is set to missing (e.g. ./1). \
+                            With "drop", such variants are omitted. By default, they are assumed to carry the reference allele (default: %(default)s).')
+    group.add_argument('--save_linkage',
+                      action='store_true',
+                      help='Save the linkage trees of all partitions to the working directory. The sweep mode can then cut them at \
+                            several edit distance thresholds up to --max_edit_distance without pairing again (default: %(default)s).')
+
+
+def add_output_arguments(group, sample = True):
+    """Add the options of the OUTPUT step to the given argument group"""
+    if sample:
+        group.add_argument('--sample',
+                          type=str,
+                          default="Sample",
+                          help='Sample ID to include in output vcf file (default: %(default)s)')
+    group.add_argument('--types',
+                      type=str,
+                      default="DEL,INS,INV,DUP:TANDEM,DUP:INT,BND",
+                      help='SV types to include in output VCF (default: %(default)s). \
+                            Give a comma-separated list of SV types. The possible SV types are: DEL (deletions), \
+                            INS (novel insertions), INV (inversions), DUP:TANDEM (tandem duplications), \
+                            DUP:INT (interspersed duplications), BND (breakends).')
+    group.add_argument('--symbolic_alleles',
+                      action='store_true',
+                      help='Use symbolic alleles, such as <DEL> or <INV> in the VCF output (default: %(default)s). \
+                            By default, deletions, insertions, and inversions are represented by their nucleotide sequence in the output VCF.')
+    group.add_argument('--tandem_duplications_as_insertions',
+                      action='store_true',
+                      help='Represent tandem duplications as insertions in output VCF (default: %(default)s). \
+                            By default, tandem duplications are represented by the SVTYPE=DUP:TANDEM and the genomic source is given by the \
+                            POS and END tags. When enabling this option, duplications are instead represented by the SVTYPE=INS \
+                            and POS and END both give the insertion point of the duplication.')
+    group.add_argument('--interspersed_duplications_as_insertions',
+                      action='store_true',
+                      help='Represent interspersed duplications as insertions in output VCF (default: %(default)s). \
+                            By default, interspersed duplications are represented by the SVTYPE=DUP:INT and the genomic source is given by the \
+                            POS and END tags. When enabling this option, duplications are instead represented by the SVTYPE=INS \
+                            and POS and END both give the insertion point of the duplication.')
+    group.add_argument('--query_names',
+                      action='store_true',
+                      help='Output names of supporting query sequences in INFO tag of VCF (default: %(default)s). \
+                            If enabled, the INFO/READS tag contains the list of names of the supporting query sequences.')
+    group.add_argument('--output_format',
+                      type=str,
+                      choices=['vcf', 'vcf.gz', 'bcf'],
+                      default='vcf',
+                      help='Format of the output file (default: %(default)s). \
+                            With vcf.gz, SVs are written to a BGZF-compressed variants.vcf.gz \
+                            that is indexed with tabix right away. With bcf, the records are converted by htslib \
+                            into a binary variants.bcf with CSI index.')
+    group.add_argument('--index_format',
+                      type=str,
+                      choices=['tbi', 'csi'],
+                      default='tbi',
+                      help='Type of index to create for vcf.gz output (default: %(default)s). \
+                            Use csi for reference contigs longer than 512Mbp.')
+    group.add_argument('--output_threads',
+                      type=int,
+                      default=1,
+                      help='Number of threads used for compressing vcf.gz or bcf output (default: %(default)s).')
+    group.add_argument('--format_threads',
+                      type=int,
+                      default=1,
+                      help='Number of threads that format the output records of different chromosomes \
+                            (including the retrieval of sequence alleles from the reference) \
+                            while the records of earlier chromosomes are written (default: %(default)s).')
+    group.add_argument('--save_candidates',
+                      action='store_true',
+                      help='Additionally save the final SV candidates in binary format to the directory candidates.svim \
+                            in the working directory (default: %(default)s). The candidate store can be loaded \
+                            with svim_asm.SVIM_api.load_candidates without parsing the VCF.')
+
 
 def parse_arguments(program_version, arguments = sys.argv[1:]):
     parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
                                      description="""SVIM-asm (pronounced SWIM-assem) is a structural variant caller for genome-genome alignments. 
 It discriminates five different variant classes: deletions, insertions, tandem and interspersed duplications and inversions.
-SVIM-asm analyzes alignments between a haploid or diploid query assembly and a reference assembly in SAM/BAM format. 
+SVIM-asm analyzes alignments between a haploid or diploid query assembly and a reference assembly in SAM/BAM/CRAM format. 
 We recommend to produce the alignments using minimap2.
 
-SVIM-asm has an haploid and a diploid mode depending on the input assembly and performs the following steps:
+SVIM-asm has an haploid, a diploid and a polyploid mode depending on the input assembly and performs the following steps:
 - COLLECT detects SVs from genome-genome alignments in BAM format
-- PAIR merges the SV calls from the two haplotypes of a diploid assembly (diploid mode only)
+- PAIR merges the SV calls from the haplotypes of a diploid or polyploid assembly (diploid and polyploid mode only)
 - OUTPUT prints the found SVs in VCF format
 """)
 
@@ -32,104 +251,14 @@ SVIM-asm has an haploid and a diploid mode depending on the input assembly and p
                                    If the directory does not exist, it is created.')
     parser_haploid.add_argument('bam_file',
                              type=str,
-                             help='SAM/BAM file with alignment of query assembly to reference assembly (needs to be coordinate-sorted and indexed)')
+                             help='SAM/BAM/CRAM file with alignment of query assembly to reference assembly (coordinate-sorted and indexed or, if unsorted or grouped by query, read in one streaming pass; - reads from standard input)')
     parser_haploid.add_argument('genome',
                                type=str,
                                help='Reference genome file that the assembly was aligned to (FASTA)')
-    group_haploid_collect = parser_haploid.add_argument_group('COLLECT')
-    group_haploid_collect.add_argument('--min_mapq',
-                                      type=int,
-                                      default=20,
-                                      help='Minimum mapping quality of alignments to consider (default: %(default)s). \
-                                            Alignments with a lower mapping quality are ignored.')
-    group_haploid_collect.add_argument('--min_sv_size',
-                                      type=int,
-                                      default=40,
-                                      help='Minimum SV size to detect (default: %(default)s). \
-                                            SVIM can potentially detect events of any size but is limited by the \
-                                            signal-to-noise ratio in the input alignments. That means that more \
-                                            accurate assemblies and alignments enable the detection of smaller events.')
-    group_haploid_collect.add_argument('--max_sv_size',
-                                      type=int,
-                                      default=100000,
-                                      help='Maximum SV size to detect (default: %(default)s). \
-                                              This parameter is used to distinguish long deletions (and inversions) from \
-                                              translocations which cannot be distinguished from the alignment alone. \
-                                              Split read segments mapping far apart on the reference could either \
-                                              indicate a very long deletion (inversion) or a translocation breakpoint. \
-                                              SVIM calls a translocation breakpoint if the mapping distance is larger \
-                                              than this parameter and a deletion (or inversion) if it is smaller or equal.')
-    group_haploid_collect.add_argument('--query_gap_tolerance',
-                                      type=int,
-                                      default=50,
-                                      help='Maximum tolerated gap between adjacent alignment segments on the query \
-                                            (default: %(default)s). Example: \
-                                            Deletions are detected from two subsequent segments of a split query sequence that are mapped \
-                                            far apart from each other on the reference. The query gap tolerance determines \
-                                            the maximum tolerated length of the query gap between both segments. If there is an \
-                                            unaligned query segment larger than this value between the two segments, no deletion is called.')
-    group_haploid_collect.add_argument('--query_overlap_tolerance',
-                                      type=int,
-                                      default=50,
-                                      help='Maximum tolerated overlap between adjacent alignment segments on the query \
-                                            (default: %(default)s). Example: \
-                                            Deletions are detected from two subsequent segments of a split query sequence that are mapped \
-                                            far apart from each other on the reference. The query overlap tolerance determines \
-                                            the maximum tolerated length of an overlap between both segments in the query. If the \
-                                            overlap between the two segments in the query is larger than this value, no deletion is called.')
-    group_haploid_collect.add_argument('--reference_gap_tolerance',
-                                      type=int,
-                                      default=50,
-                                      help='Maximum tolerated gap between adjacent alignment segments on the reference \
-                                            (default: %(default)s). Example: \
-                                            Insertions are detected from two segments of a split query sequence that are mapped \
-                                            right next to each other on the reference but with unaligned sequence between them on the query. \
-                                            The reference gap tolerance determines the maximum tolerated length of the reference gap between \
-                                            both segments. If there is a reference gap larger than this value between the two segments, no \
-                                            insertion is called.')
-    group_haploid_collect.add_argument('--reference_overlap_tolerance',
-                                      type=int,
-                                      default=50,
-                                      help='Maximum tolerated overlap between adjacent alignment segments on the reference \
-                                            (default: %(default)s). Example: \
-                                            Insertions are detected from two segments of a split query sequence that are mapped \
-                                            right next to each other on the reference but with unaligned sequence between them on the query. \
-                                            The reference overlap tolerance determines the maximum tolerated length of an overlap between \
-                                            both segments on the reference. If there is a reference gap larger than this value between the \
-                                            two segments, no insertion is called.')
-    
-    group_haploid_output = parser_haploid.add_argument_group('OUTPUT')
-    group_haploid_output.add_argument('--sample',
-                                        type=str,
-                                        default="Sample",
-                                        help='Sample ID to include in output vcf file (default: %(default)s)')
-    group_haploid_output.add_argument('--types',
-                                        type=str,
-                                        default="DEL,INS,INV,DUP:TANDEM,DUP:INT,BND",
-                                        help='SV types to include in output VCF (default: %(default)s). \
-                                              Give a comma-separated list of SV types. The possible SV types are: DEL (deletions), \
-                                              INS (novel insertions), INV (inversions), DUP:TANDEM (tandem duplications), \
-                                              DUP:INT (interspersed duplications), BND (breakends).')
-    group_haploid_output.add_argument('--symbolic_alleles',
-                                        action='store_true',
-                                        help='Use symbolic alleles, such as <DEL> or <INV> in the VCF output (default: %(default)s). \
-                                              By default, deletions, insertions, and inversions are represented by their nucleotide sequence in the output VCF.')
-    group_haploid_output.add_argument('--tandem_duplications_as_insertions',
-                                        action='store_true',
-                                        help='Represent tandem duplications as insertions in output VCF (default: %(default)s). \
-                                              By default, tandem duplications are represented by the SVTYPE=DUP:TANDEM and the genomic source is given by the \
-                                              POS and END tags. When enabling this option, duplications are instead represented by the SVTYPE=INS \
-                                              and POS and END both give the insertion point of the duplication.')
-    group_haploid_output.add_argument('--interspersed_duplications_as_insertions',
-                                        action='store_true',
-                                        help='Represent interspersed duplications as insertions in output VCF (default: %(default)s). \
-                                              By default, interspersed duplications are represented by the SVTYPE=DUP:INT and the genomic source is given by the \
-                                              POS and END tags. When enabling this option, duplications are instead represented by the SVTYPE=INS \
-                                              and POS and END both give the insertion point of the duplication.')
-    group_haploid_output.add_argument('--query_names',
-                                        action='store_true',
-                                        help='Output names of supporting query sequences in INFO tag of VCF (default: %(default)s). \
-                                              If enabled, the INFO/READS tag contains the list of names of the supporting query sequences.')
+    group_collect_haploid = parser_haploid.add_argument_group('COLLECT')
+    add_collect_arguments(group_collect_haploid)
+    add_collect_process_arguments(group_collect_haploid)
+    add_output_arguments(parser_haploid.add_argument_group('OUTPUT'))
 
     parser_diploid = subparsers.add_parser('diploid',
                                         help='Detect SVs from the alignment of a diploid query assembly to a reference assembly')
@@ -140,111 +269,182 @@ SVIM-asm has an haploid and a diploid mode depending on the input assembly and p
                                    If the directory does not exist, it is created.')
     parser_diploid.add_argument('bam_file1',
                              type=str,
-                             help='SAM/BAM file with alignment of query assembly\'s first haplotype to reference assembly (needs to be coordinate-sorted and indexed)')
+                             help='SAM/BAM/CRAM file with alignment of query assembly\'s first haplotype to reference assembly (coordinate-sorted and indexed or, if unsorted or grouped by query, read in one streaming pass; - reads from standard input)')
     parser_diploid.add_argument('bam_file2',
                              type=str,
-                             help='SAM/BAM file with alignment of query assembly\'s second haplotype to reference assembly (needs to be coordinate-sorted and indexed)')
+                             help='SAM/BAM/CRAM file with alignment of query assembly\'s second haplotype to reference assembly (coordinate-sorted and indexed or, if unsorted or grouped by query, read in one streaming pass; - reads from standard input)')
     parser_diploid.add_argument('genome',
                                type=str,
                                help='Reference genome file that the assembly was aligned to (FASTA)')
-    group_diploid_collect = parser_diploid.add_argument_group('COLLECT')
-    group_diploid_collect.add_argument('--min_mapq',
-                                      type=int,
-                                      default=20,
-                                      help='Minimum mapping quality of alignments to consider (default: %(default)s). \
-                                            Alignments with a lower mapping quality are ignored.')
-    group_diploid_collect.add_argument('--min_sv_size',
-                                      type=int,
-                                      default=40,
-                                      help='Minimum SV size to detect (default: %(default)s). \
-                                            SVIM can potentially detect events of any size but is limited by the \
-                                            signal-to-noise ratio in the input alignments. That means that more \
-                                            accurate assemblies and alignments enable the detection of smaller events.')
-    group_diploid_collect.add_argument('--max_sv_size',
-                                      type=int,
-                                      default=100000,
-                                      help='Maximum SV size to detect (default: %(default)s). \
-                                              This parameter is used to distinguish long deletions (and inversions) from \
-                                              translocations which cannot be distinguished from the alignment alone. \
-                                              Split read segments mapping far apart on the reference could either \
-                                              indicate a very long deletion (inversion) or a translocation breakpoint. \
-                                              SVIM calls a translocation breakpoint if the mapping distance is larger \
-                                              than this parameter and a deletion (or inversion) if it is smaller or equal.')
-    group_diploid_collect.add_argument('--query_gap_tolerance',
-                                      type=int,
-                                      default=50,
-                                      help='Maximum tolerated gap between adjacent alignment segments on the query \
-                                            (default: %(default)s). Example: \
-                                            Deletions are detected from two subsequent segments of a split query sequence that are mapped \
-                                            far apart from each other on the reference. The query gap tolerance determines \
-                                            the maximum tolerated length of the query gap between both segments. If there is an \
-                                            unaligned query segment larger than this value between the two segments, no deletion is called.')
-    group_diploid_collect.add_argument('--query_overlap_tolerance',
-                                      type=int,
-                                      default=50,
-                                      help='Maximum tolerated overlap between adjacent alignment segments on the query \
-                                            (default: %(default)s). Example: \
-                                            Deletions are detected from two subsequent segments of a split query sequence that are mapped \
-                                            far apart from each other on the reference. The query overlap tolerance determines \
-                                            the maximum tolerated length of an overlap between both segments in the query. If the \
-                                            overlap between the two segments in the query is larger than this value, no deletion is called.')
-    group_diploid_collect.add_argument('--reference_gap_tolerance',
-                                      type=int,
-                                      default=50,
-                                      help='Maximum tolerated gap between adjacent alignment segments on the reference \
-                                            (default: %(default)s). Example: \
-                                            Insertions are detected from two segments of a split query sequence that are mapped \
-                                            right next to each other on the reference but with unaligned sequence between them on the query. \
-                                            The reference gap tolerance determines the maximum tolerated length of the reference gap between \
-                                            both segments. If there is a reference gap larger than this value between the two segments, no \
-                                            insertion is called.')
-    group_diploid_collect.add_argument('--reference_overlap_tolerance',
-                                      type=int,
-                                      default=50,
-                                      help='Maximum tolerated overlap between adjacent alignment segments on the reference \
-                                            (default: %(default)s). Example: \
-                                            Insertions are detected from two segments of a split query sequence that are mapped \
-                                            right next to each other on the reference but with unaligned sequence between them on the query. \
-                                            The reference overlap tolerance determines the maximum tolerated length of an overlap between \
-                                            both segments on the reference. If there is a reference gap larger than this value between the \
-                                            two segments, no insertion is called.')
-
-    group_diploid_pair = parser_diploid.add_argument_group('PAIR')
-    group_diploid_pair.add_argument('--max_edit_distance',
-                                        type=int,
-                                        default=200,
-                                        help='Maximum edit distance between both alleles to be paired up into a homozygous call (default: %(default)s).')
-
-    group_diploid_output = parser_diploid.add_argument_group('OUTPUT')
-    group_diploid_output.add_argument('--sample',
+    group_collect_diploid = parser_diploid.add_argument_group('COLLECT')
+    add_collect_arguments(group_collect_diploid)
+    add_collect_process_arguments(group_collect_diploid)
+    add_pair_arguments(parser_diploid.add_argument_group('PAIR'))
+    add_output_arguments(parser_diploid.add_argument_group('OUTPUT'))
+
+    parser_polyploid = subparsers.add_parser('polyploid',
+                                        help='Detect SVs jointly from the alignments of many haplotypes (e.g. of a polyploid assembly or a haplotype panel) to a reference assembly')
+    parser_polyploid.add_argument('working_dir',
+                             type=os.path.abspath,
+                             help='Working and output directory. \
+                                   Existing files in the directory are overwritten. \
+                                   If the directory does not exist, it is created.')
+    parser_polyploid.add_argument('bam_files',
+                             type=str,
+                             nargs='+',
+                             help='SAM/BAM/CRAM files with alignments of one haplotype each to reference assembly (coordinate-sorted and indexed or, if unsorted or grouped by query, read in one streaming pass). \
+                                   The genotype of each SV lists the haplotypes in this order, e.g. 1/0/1 for an SV on the first and third haplotype.')
+    parser_polyploid.add_argument('genome',
+                               type=str,
+                               help='Reference genome file that the assembly was aligned to (FASTA)')
+    group_collect_polyploid = parser_polyploid.add_argument_group('COLLECT')
+    add_collect_arguments(group_collect_polyploid)
+    add_collect_process_arguments(group_collect_polyploid)
+    add_pair_arguments(parser_polyploid.add_argument_group('PAIR'))
+    add_output_arguments(parser_polyploid.add_argument_group('OUTPUT'))
+
+    parser_batch = subparsers.add_parser('batch',
+                                        help='Detect SVs for many haploid, diploid and/or polyploid assemblies aligned to the same reference assembly')
+    parser_batch.add_argument('working_dir',
+                             type=os.path.abspath,
+                             help='Working and output directory. \
+                                   Results of each sample are written to a subdirectory named after the sample. \
+                                   If the directory does not exist, it is created.')
+    parser_batch.add_argument('manifest',
+                             type=str,
+                             help='Tab-separated file with one sample per line: sample name followed by one (haploid), \
+                                   two (diploid) or more (polyploid) SAM/BAM/CRAM files with alignments to the reference assembly. \
+                                   Empty lines and lines starting with # are ignored.')
+    parser_batch.add_argument('genome',
+                               type=str,
+                               help='Reference genome file that the assemblies were aligned to (FASTA)')
+    group_batch = parser_batch.add_argument_group('BATCH')
+    group_batch.add_argument('--processes',
+                            type=int,
+                            default=1,
+                            help='Number of samples to analyze in parallel (default: %(default)s). \
+                                  Samples are scheduled by decreasing BAM file size. Run index-reference \
+                                  beforehand so that all processes share one memory-mapped copy of the reference.')
+    add_collect_arguments(parser_batch.add_argument_group('COLLECT'))
+    add_pair_arguments(parser_batch.add_argument_group('PAIR'))
+    add_output_arguments(parser_batch.add_argument_group('OUTPUT'), sample = False)
+
+    parser_collect = subparsers.add_parser('collect',
+                                        help='Run COLLECT for one shard of the reference contigs and save the SV candidates for gather')
+    parser_collect.add_argument('working_dir',
+                             type=os.path.abspath,
+                             help='Working directory shared by all shards. \
+                                   The candidates of the shard are written to shards/<i>_of_<N> in this directory.')
+    parser_collect.add_argument('bam_files',
+                             type=str,
+                             nargs='+',
+                             help='Coordinate-sorted and indexed SAM/BAM/CRAM files with alignments of one haplotype each to the reference assembly. \
+                                   All shards of a sample must be given the same files in the same order.')
+    group_shard = parser_collect.add_argument_group('SHARD')
+    group_shard.add_argument('--shard',
+                            type=parse_shard,
+                            default=(1, 1),
+                            help='Shard to analyze, given as i/N (default: 1/1). \
+                                  The contigs (or windows) of the reference are distributed over N shards by their length.')
+    group_shard.add_argument('--window_size',
+                            type=int,
+                            default=None,
+                            help='Split contigs into windows of this size before distributing them over the shards (default: whole contigs). \
+                                  Alignments are analyzed in the window where they start.')
+    group_shard.add_argument('--genome',
+                            type=str,
+                            default=None,
+                            help='Reference genome file (FASTA), only needed to decode CRAM files (default: %(default)s)')
+    add_collect_arguments(parser_collect.add_argument_group('COLLECT'))
+
+    parser_gather = subparsers.add_parser('gather',
+                                        help='Run PAIR and OUTPUT on the SV candidates of all shards written by collect')
+    parser_gather.add_argument('working_dir',
+                             type=os.path.abspath,
+                             help='Working directory shared by all shards and output directory. \
+                                   Existing files in the directory are overwritten.')
+    parser_gather.add_argument('genome',
+                               type=str,
+                               help='Reference genome file that the assemblies were aligned to (FASTA)')
+    add_memory_argument(parser_gather.add_argument_group('GATHER'))
+    add_pair_arguments(parser_gather.add_argument_group('PAIR'))
+    add_output_arguments(parser_gather.add_argument_group('OUTPUT'))
+
+    parser_sweep = subparsers.add_parser('sweep',
+                                         help='Write the paired SV calls for several values of --max_edit_distance from the linkage trees \
+                                               saved by a previous diploid, polyploid or gather run with --save_linkage')
+    parser_sweep.add_argument('working_dir',
+                              type=os.path.abspath,
+                              help='Working directory of the run with --save_linkage. The results are written to the subdirectory sweep')
+    parser_sweep.add_argument('genome',
+                              type=str,
+                              help='Reference genome file that the assemblies were aligned to (FASTA)')
+    group_sweep = parser_sweep.add_argument_group('SWEEP')
+    group_sweep.add_argument('--thresholds',
+                             type=parse_thresholds,
+                             required=True,
+                             help='Comma-separated list of edit distance thresholds, e.g. 50,100,200. \
+                                   They cannot exceed the --max_edit_distance of the run with --save_linkage.')
+    add_output_arguments(parser_sweep.add_argument_group('OUTPUT'))
+
+    parser_parameter_sweep = subparsers.add_parser('parameter-sweep',
+                                                   help='Detect SVs with several sets of COLLECT parameters in a single pass over the alignments')
+    parser_parameter_sweep.add_argument('working_dir',
+                                        type=os.path.abspath,
+                                        help='Working and output directory. \
+                                              Results of each parameter set are written to a subdirectory named after the parameter set. \
+                                              If the directory does not exist, it is created.')
+    parser_parameter_sweep.add_argument('parameter_sets',
                                         type=str,
-                                        default="Sample",
-                                        help='Sample ID to include in output vcf file (default: %(default)s)')
-    group_diploid_output.add_argument('--types',
+                                        help='Tab-separated file with one parameter set per line. The first line names the columns: name followed by \
+                                              one or more of min_sv_size, max_sv_size, query_gap_tolerance, query_overlap_tolerance, reference_gap_tolerance \
+                                              and reference_overlap_tolerance. Parameters that are not listed are taken from the command line. \
+                                              Empty lines and lines starting with # are ignored.')
+    parser_parameter_sweep.add_argument('bam_files',
                                         type=str,
-                                        default="DEL,INS,INV,DUP:TANDEM,DUP:INT,BND",
-                                        help='SV types to include in output VCF (default: %(default)s). \
-                                              Give a comma-separated list of SV types. The possible SV types are: DEL (deletions), \
-                                              INS (novel insertions), INV (inversions), DUP:TANDEM (tandem duplications), \
-                                              DUP:INT (interspersed duplications), BND (breakends).')
-    group_diploid_output.add_argument('--symbolic_alleles',
-                                        action='store_true',
-                                        help='Use symbolic alleles, such as <DEL> or <INV> in the VCF output (default: %(default)s). \
-                                              By default, deletions, insertions, and inversions are represented by their nucleotide sequence in the output VCF.')
-    group_diploid_output.add_argument('--tandem_duplications_as_insertions',
-                                        action='store_true',
-                                        help='Represent tandem duplications as insertions in output VCF (default: %(default)s). \
-                                              By default, tandem duplications are represented by the SVTYPE=DUP:TANDEM and the genomic source is given by the \
-                                              POS and END tags. When enabling this option, duplications are instead represented by the SVTYPE=INS \
-                                              and POS and END both give the insertion point of the duplication.')
-    group_diploid_output.add_argument('--interspersed_duplications_as_insertions',
-                                        action='store_true',
-                                        help='Represent interspersed duplications as insertions in output VCF (default: %(default)s). \
-                                              By default, interspersed duplications are represented by the SVTYPE=DUP:INT and the genomic source is given by the \
-                                              POS and END tags. When enabling this option, duplications are instead represented by the SVTYPE=INS \
-                                              and POS and END both give the insertion point of the duplication.')
-    group_diploid_output.add_argument('--query_names',
-                                        action='store_true',
-                                        help='Output names of supporting query sequences in INFO tag of VCF (default: %(default)s). \
-                                              If enabled, the INFO/READS tag contains the list of names of the supporting query sequences.')
+                                        nargs='+',
+                                        help='SAM/BAM/CRAM files with alignments of one haplotype each to reference assembly. \
+                                              With more than one file, the SV candidates of each parameter set are paired as in diploid or polyploid mode.')
+    parser_parameter_sweep.add_argument('genome',
+                                        type=str,
+                                        help='Reference genome file that the assembly was aligned to (FASTA)')
+    group_collect_parameter_sweep = parser_parameter_sweep.add_argument_group('COLLECT')
+    add_collect_arguments(group_collect_parameter_sweep)
+    add_collect_process_arguments(group_collect_parameter_sweep)
+    add_pair_arguments(parser_parameter_sweep.add_argument_group('PAIR'))
+    add_output_arguments(parser_parameter_sweep.add_argument_group('OUTPUT'))
+
+    parser_serve = subparsers.add_parser('serve',
+                                         help='Keep the alignments and the reference genome open and call SVs in regions on request (HTTP on localhost or a Unix socket)')
+    parser_serve.add_argument('working_dir',
+                              type=os.path.abspath,
+                              help='Working directory for the log file. If the directory does not exist, it is created.')
+    parser_serve.add_argument('bam_files',
+                              type=str,
+                              nargs='+',
+                              help='Coordinate-sorted and indexed SAM/BAM/CRAM files with alignments of one haplotype each to the reference assembly. \
+                                    With more than one file, the SV candidates are paired as in diploid or polyploid mode.')
+    parser_serve.add_argument('genome',
+                              type=str,
+                              help='Reference genome file that the assembly was aligned to (FASTA)')
+    group_serve = parser_serve.add_argument_group('SERVE')
+    group_serve.add_argument('--port',
+                             type=int,
+                             default=8750,
+                             help='Port on localhost (127.0.0.1) to listen on (default: %(default)s). \
+                                   Requests have the form GET /call?region=chr1:1000001-2000000 and return VCF.')
+    group_serve.add_argument('--socket',
+                             type=str,
+                             default=None,
+                             help='Listen on this Unix domain socket instead of a port (default: %(default)s)')
+    add_collect_arguments(parser_serve.add_argument_group('COLLECT'))
+    add_pair_arguments(parser_serve.add_argument_group('PAIR'))
+    add_output_arguments(parser_serve.add_argument_group('OUTPUT'))
+
+    parser_index = subparsers.add_parser('index-reference',
+                                        help='Write a memory-mappable cache of the reference genome that is used by all subsequent runs')
+    parser_index.add_argument('genome',
+                               type=str,
+                               help='Reference genome file (FASTA with .fai index). \
+                                     The cache (<genome>.svimref and <genome>.svimref.idx) is written next to it.')
     return parser.parse_args(arguments)
\ No newline at end of file
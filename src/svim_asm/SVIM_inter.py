@@ -39,7 +39,7 @@ def reciprocal_overlap_distance(inversion1, inversion2):
     return 1 - minimum_relative_overlap
 
 
-def process_overlapping_inversions(active_inversions, query_name, bam):
+def process_overlapping_inversions(active_inversions, reads, bam):
     if len(active_inversions) < 2:
         clusters = [active_inversions]
     else:
@@ -56,11 +56,18 @@ def process_overlapping_inversions(active_inversions, query_name, bam):
         start = max([i[1] for i in cluster])
         end = min([i[2] for i in cluster])
         complete = True if len(cluster) > 1 else False
-        inversion_candidates.append(CandidateInversion(chrom, start, end, [query_name], complete, bam))
+        inversion_candidates.append(CandidateInversion(chrom, start, end, reads, complete, bam))
     return inversion_candidates
 
-def analyze_read_segments(primary, supplementaries, bam, options):
-    read_name = primary.query_name
+def analyze_read_segments(primary, supplementaries, bam, options, reads = None):
+    if reads is None:
+        reads = [primary.query_name]
+    return analyze_alignment_segments(primary, get_alignment_segments(primary, supplementaries), bam, options, reads)
+
+
+def get_alignment_segments(primary, supplementaries):
+    """Return the query and reference coordinates of the primary and supplementary alignments of a query,
+    sorted by their position on the query"""
     alignments = [primary] + supplementaries
     alignment_list = []
     for alignment in alignments:
@@ -80,9 +87,16 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                                 'is_reverse': alignment.is_reverse  }
         alignment_list.append(new_alignment_dict)
 
-    sorted_alignment_list = sorted(alignment_list, key=lambda aln: (aln['q_start'], aln['q_end']))
-    #inferred_read_length = alignments[0].infer_read_length()
+    return sorted(alignment_list, key=lambda aln: (aln['q_start'], aln['q_end']))
 
+
+def analyze_alignment_segments(primary, sorted_alignment_list, bam, options, reads):
+    """Detect SV candidates from the alignment segments of a query returned by get_alignment_segments.
+    Inserted sequences are taken from the primary alignment."""
+    #Candidate types that are not requested (see get_candidate_types) are not constructed
+    candidate_types = getattr(options, "candidate_types", None)
+    if candidate_types is None:
+        candidate_types = {"DEL", "INV", "INS", "DUP_TAN", "DUP_INT", "BND"}
     sv_candidates = []
     tandem_duplications = []
     translocations = []
@@ -112,30 +126,32 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                         #INS candidate
                         if deviation >= options.min_sv_size:
                             #No gap on reference
-                            if distance_on_reference <= options.reference_gap_tolerance:
+                            if distance_on_reference <= options.reference_gap_tolerance and "INS" in candidate_types:
                                 if not alignment_current['is_reverse']:
                                     insertion_seq = primary.query_sequence[alignment_current['q_end']:alignment_current['q_end']+deviation]
-                                    sv_candidates.append(CandidateInsertion(ref_chr, alignment_current['ref_end'], alignment_current['ref_end'] + deviation, [read_name], insertion_seq, bam))
+                                    sv_candidates.append(CandidateInsertion(ref_chr, alignment_current['ref_end'], alignment_current['ref_end'] + deviation, reads, insertion_seq, bam))
                                 else:
                                     insertion_seq = primary.query_sequence[primary.infer_read_length() - alignment_next['q_start']:primary.infer_read_length() - alignment_next['q_start'] + deviation]
-                                    sv_candidates.append(CandidateInsertion(ref_chr, alignment_current['ref_start'], alignment_current['ref_start'] + deviation, [read_name], insertion_seq, bam))
+                                    sv_candidates.append(CandidateInsertion(ref_chr, alignment_current['ref_start'], alignment_current['ref_start'] + deviation, reads, insertion_seq, bam))
                         #DEL candidate
                         elif -options.max_sv_size <= deviation <= -options.min_sv_size:
                             #No gap on read
-                            if distance_on_read <= options.query_gap_tolerance:
+                            if distance_on_read <= options.query_gap_tolerance and "DEL" in candidate_types:
                                 if not alignment_current['is_reverse']:
-                                    sv_candidates.append(CandidateDeletion(ref_chr, alignment_current['ref_end'], alignment_current['ref_end'] - deviation, [read_name], bam))
+                                    sv_candidates.append(CandidateDeletion(ref_chr, alignment_current['ref_end'], alignment_current['ref_end'] - deviation, reads, bam))
                                 else:
-                                    sv_candidates.append(CandidateDeletion(ref_chr, alignment_next['ref_end'], alignment_next['ref_end'] - deviation, [read_name], bam))
+                                    sv_candidates.append(CandidateDeletion(ref_chr, alignment_next['ref_end'], alignment_next['ref_end'] - deviation, reads, bam))
                         #Either very large DEL or TRANS
                         elif deviation < -options.max_sv_size:
                             #No gap on read
                             if distance_on_read <= options.query_gap_tolerance:
                                 if not alignment_current['is_reverse']:
-                                    sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_end'] - 1, 'fwd', ref_chr, alignment_next['ref_start'], 'fwd', [read_name], bam))
+                                    if "BND" in candidate_types:
+                                        sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_end'] - 1, 'fwd', ref_chr, alignment_next['ref_start'], 'fwd', reads, bam))
                                     translocations.append(('fwd', 'fwd', ref_chr, alignment_current['ref_end'] - 1, ref_chr, alignment_next['ref_start']))
                                 else:
-                                    sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_start'], 'rev', ref_chr, alignment_next['ref_end'] - 1, 'rev', [read_name], bam))
+                                    if "BND" in candidate_types:
+                                        sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_start'], 'rev', ref_chr, alignment_next['ref_end'] - 1, 'rev', reads, bam))
                                     translocations.append(('rev', 'rev', ref_chr, alignment_current['ref_start'], ref_chr, alignment_next['ref_end'] - 1))
                     #overlap on reference
                     else:
@@ -153,7 +169,8 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                                         tandem_duplications.append((ref_chr, alignment_next['ref_start'], alignment_next['ref_start'] + deviation, False, True))
                                     #Either very large TANDEM or TRANS
                                     else:
-                                        sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_end'] - 1, 'fwd', ref_chr, alignment_next['ref_start'], 'fwd', [read_name], bam))
+                                        if "BND" in candidate_types:
+                                            sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_end'] - 1, 'fwd', ref_chr, alignment_next['ref_start'], 'fwd', reads, bam))
                                         translocations.append(('fwd', 'fwd', ref_chr, alignment_current['ref_end'] - 1, ref_chr, alignment_next['ref_start']))
                                 else:
                                     #Tandem Duplication
@@ -164,7 +181,8 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                                         tandem_duplications.append((ref_chr, alignment_current['ref_start'], alignment_current['ref_start'] + deviation, False, False))
                                     #Either very large TANDEM or TRANS
                                     else:
-                                        sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_start'], 'rev', ref_chr, alignment_next['ref_end'] - 1, 'rev', [read_name], bam))
+                                        if "BND" in candidate_types:
+                                            sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_start'], 'rev', ref_chr, alignment_next['ref_end'] - 1, 'rev', reads, bam))
                                         translocations.append(('rev', 'rev', ref_chr, alignment_current['ref_start'], ref_chr, alignment_next['ref_end'] - 1))
             #Different orientations
             else:
@@ -180,7 +198,8 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                                 #transitions.append(('inversion', 'left_fwd', ref_chr, alignment_current['ref_end'], alignment_next['ref_end']))
                             #Either very large INV or TRANS
                             else:
-                                sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_end'] - 1, 'fwd', ref_chr, alignment_next['ref_end'] - 1, 'rev', [read_name], bam))
+                                if "BND" in candidate_types:
+                                    sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_end'] - 1, 'fwd', ref_chr, alignment_next['ref_end'] - 1, 'rev', reads, bam))
                                 translocations.append(('fwd', 'rev', ref_chr, alignment_current['ref_end'] - 1, ref_chr, alignment_next['ref_end'] - 1))
                         elif alignment_current['ref_start'] - alignment_next['ref_end'] >= -options.reference_overlap_tolerance: # Case 3
                             #INV candidate
@@ -189,7 +208,8 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                                 #transitions.append(('inversion', 'left_rev', ref_chr, alignment_next['ref_end'], alignment_current['ref_end']))
                             #Either very large INV or TRANS
                             else:
-                                sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_end'] - 1, 'fwd', ref_chr, alignment_next['ref_end'] - 1, 'rev', [read_name], bam))
+                                if "BND" in candidate_types:
+                                    sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_end'] - 1, 'fwd', ref_chr, alignment_next['ref_end'] - 1, 'rev', reads, bam))
                                 translocations.append(('fwd', 'rev', ref_chr, alignment_current['ref_end'] - 1, ref_chr, alignment_next['ref_end'] - 1))
                     else:
                         pass
@@ -206,7 +226,8 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                                 #transitions.append(('inversion', 'right_fwd', ref_chr, alignment_current['ref_start'], alignment_next['ref_start']))
                             #Either very large INV or TRANS
                             else:
-                                sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_start'], 'rev', ref_chr, alignment_next['ref_start'], 'fwd', [read_name], bam))
+                                if "BND" in candidate_types:
+                                    sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_start'], 'rev', ref_chr, alignment_next['ref_start'], 'fwd', reads, bam))
                                 translocations.append(('rev', 'fwd', ref_chr, alignment_current['ref_start'], ref_chr, alignment_next['ref_start']))
                         elif alignment_current['ref_start'] - alignment_next['ref_end'] >= -options.reference_overlap_tolerance: # Case 4
                             #INV candidate
@@ -215,7 +236,8 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                                 #transitions.append(('inversion', 'right_rev', ref_chr, alignment_next['ref_start'], alignment_current['ref_start']))
                             #Either very large INV or TRANS
                             else:
-                                sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_start'], 'rev', ref_chr, alignment_next['ref_start'], 'fwd', [read_name], bam))
+                                if "BND" in candidate_types:
+                                    sv_candidates.append(CandidateBreakend(ref_chr, alignment_current['ref_start'], 'rev', ref_chr, alignment_next['ref_start'], 'fwd', reads, bam))
                                 translocations.append(('rev', 'fwd', ref_chr, alignment_current['ref_start'], ref_chr, alignment_next['ref_start']))
                     else:
                         pass
@@ -231,10 +253,12 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                     #No gap on read
                     if distance_on_read <= options.query_gap_tolerance:
                         if not alignment_current['is_reverse']:
-                            sv_candidates.append(CandidateBreakend(ref_chr_current, alignment_current['ref_end'] - 1, 'fwd', ref_chr_next, alignment_next['ref_start'], 'fwd', [read_name], bam))
+                            if "BND" in candidate_types:
+                                sv_candidates.append(CandidateBreakend(ref_chr_current, alignment_current['ref_end'] - 1, 'fwd', ref_chr_next, alignment_next['ref_start'], 'fwd', reads, bam))
                             translocations.append(('fwd', 'fwd', ref_chr_current, alignment_current['ref_end'] - 1, ref_chr_next, alignment_next['ref_start']))
                         else:
-                            sv_candidates.append(CandidateBreakend(ref_chr_current, alignment_current['ref_start'], 'rev', ref_chr_next, alignment_next['ref_end'] - 1, 'rev', [read_name], bam))
+                            if "BND" in candidate_types:
+                                sv_candidates.append(CandidateBreakend(ref_chr_current, alignment_current['ref_start'], 'rev', ref_chr_next, alignment_next['ref_end'] - 1, 'rev', reads, bam))
                             translocations.append(('rev', 'rev', ref_chr_current, alignment_current['ref_start'], ref_chr_next, alignment_next['ref_end'] - 1))
                 #Overlap on read
                 else:
@@ -247,10 +271,12 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                     #No gap on read
                     if distance_on_read <= options.query_gap_tolerance:
                         if not alignment_current['is_reverse']:
-                            sv_candidates.append(CandidateBreakend(ref_chr_current, alignment_current['ref_end'] - 1, 'fwd', ref_chr_next, alignment_next['ref_end'] - 1, 'rev', [read_name], bam))
+                            if "BND" in candidate_types:
+                                sv_candidates.append(CandidateBreakend(ref_chr_current, alignment_current['ref_end'] - 1, 'fwd', ref_chr_next, alignment_next['ref_end'] - 1, 'rev', reads, bam))
                             translocations.append(('fwd', 'rev', ref_chr_current, alignment_current['ref_end'] - 1, ref_chr_next, alignment_next['ref_end'] - 1))
                         else:
-                            sv_candidates.append(CandidateBreakend(ref_chr_current, alignment_current['ref_start'], 'rev', ref_chr_next, alignment_next['ref_start'], 'fwd', [read_name], bam))
+                            if "BND" in candidate_types:
+                                sv_candidates.append(CandidateBreakend(ref_chr_current, alignment_current['ref_start'], 'rev', ref_chr_next, alignment_next['ref_start'], 'fwd', reads, bam))
                             translocations.append(('rev', 'fwd', ref_chr_current, alignment_current['ref_start'], ref_chr_next, alignment_next['ref_start']))
                 #Overlap on read
                 else:
@@ -263,6 +289,8 @@ def analyze_read_segments(primary, supplementaries, bam, options):
     current_ends = []
     current_copy_number = 0
     current_fully_covered = []
+    if "DUP_TAN" not in candidate_types:
+        tandem_duplications = []
     for tandem_duplication in tandem_duplications:
         if current_chromosome == None:
             current_chromosome = tandem_duplication[0]
@@ -279,7 +307,7 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                 current_fully_covered.append(tandem_duplication[3])
             else:
                 fully_covered = True if sum(current_fully_covered) else False
-                sv_candidates.append(CandidateDuplicationTandem(current_chromosome, int(mean(current_starts)), int(mean(current_ends)), current_copy_number, fully_covered, [read_name], bam))
+                sv_candidates.append(CandidateDuplicationTandem(current_chromosome, int(mean(current_starts)), int(mean(current_ends)), current_copy_number, fully_covered, reads, bam))
                 current_chromosome = tandem_duplication[0]
                 current_starts =[tandem_duplication[1]]
                 current_ends =[tandem_duplication[2]]
@@ -287,9 +315,11 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                 current_fully_covered = [tandem_duplication[3]]
     if current_chromosome != None:
         fully_covered = True if sum(current_fully_covered) else False
-        sv_candidates.append(CandidateDuplicationTandem(current_chromosome, int(mean(current_starts)), int(mean(current_ends)), current_copy_number, fully_covered, [read_name], bam))
+        sv_candidates.append(CandidateDuplicationTandem(current_chromosome, int(mean(current_starts)), int(mean(current_ends)), current_copy_number, fully_covered, reads, bam))
 
     #Handle interspersed duplications
+    if "DUP_INT" not in candidate_types:
+        translocations = []
     for this_index in range(len(translocations)):
         this_dir1 = translocations[this_index][0]
         this_dir2 = translocations[this_index][1]
@@ -310,16 +340,18 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                             if before_dir1 == 'fwd':
                                 length = this_pos1 + 1 - before_pos2
                                 if options.min_sv_size <= length <= options.max_sv_size:
-                                    sv_candidates.append(CandidateDuplicationInterspersed(before_chr2, before_pos2, this_pos1 + 1, before_chr1, int(mean([before_pos1 + 1, this_pos2])), int(mean([before_pos1 + 1, this_pos2])) + length, [read_name], bam))
+                                    sv_candidates.append(CandidateDuplicationInterspersed(before_chr2, before_pos2, this_pos1 + 1, before_chr1, int(mean([before_pos1 + 1, this_pos2])), int(mean([before_pos1 + 1, this_pos2])) + length, reads, bam))
                             elif before_dir1 == 'rev':
                                 length = before_pos2 + 1 - this_pos1
                                 if options.min_sv_size <= length <= options.max_sv_size:
-                                    sv_candidates.append(CandidateDuplicationInterspersed(before_chr2, this_pos1, before_pos2 + 1, before_chr1, int(mean([before_pos1, this_pos2 + 1])), int(mean([before_pos1, this_pos2 + 1])) + length, [read_name], bam))
+                                    sv_candidates.append(CandidateDuplicationInterspersed(before_chr2, this_pos1, before_pos2 + 1, before_chr1, int(mean([before_pos1, this_pos2 + 1])), int(mean([before_pos1, this_pos2 + 1])) + length, reads, bam))
                         #INV_INS_DUP candidate
                         else:
                             pass
 
     #Handle inversions (simple inversions produce two novel adjacencies that need to be merged for a complete candidate)
+    if "INV" not in candidate_types:
+        inversions = []
     sorted_inversions = sorted(inversions, key=lambda inversion: (inversion[0], inversion[1], inversion[2]))
     active_inversions = []
     for inversion in sorted_inversions:
@@ -332,9 +364,9 @@ def analyze_read_segments(primary, supplementaries, bam, options):
                 active_inversions.append(inversion)
             else:
                 #Cluster inversions
-                sv_candidates.extend(process_overlapping_inversions(active_inversions, read_name, bam))
+                sv_candidates.extend(process_overlapping_inversions(active_inversions, reads, bam))
                 active_inversions = []
     if len(active_inversions) > 0:
-        sv_candidates.extend(process_overlapping_inversions(active_inversions, read_name, bam))  
+        sv_candidates.extend(process_overlapping_inversions(active_inversions, reads, bam))  
 
     return sv_candidates
@@ -30,17 +30,29 @@ def analyze_cigar_indel(tuples, min_length):
     return indels
 
 
-def analyze_alignment_indel(alignment, bam, query_name, options):
+def analyze_alignment_indel(alignment, bam, reads, options):
+    candidate_types = getattr(options, "candidate_types", None)
+    if candidate_types is not None and "DEL" not in candidate_types and "INS" not in candidate_types:
+        return []
+    indels = analyze_cigar_indel(alignment.cigartuples, options.min_sv_size)
+    return get_indel_candidates(alignment, indels, bam, reads, options)
+
+
+def get_indel_candidates(alignment, indels, bam, reads, options):
+    """Return the SV candidates for the indels found by analyze_cigar_indel. The indels may have been
+    extracted with a smaller minimum length than options.min_sv_size, e.g. once for several parameter sets."""
+    candidate_types = getattr(options, "candidate_types", None)
     sv_candidates = []
     ref_chr = bam.getrname(alignment.reference_id)
     ref_start = alignment.reference_start
-    indels = analyze_cigar_indel(alignment.cigartuples, options.min_sv_size)
     for pos_ref, pos_read, length, typ in indels:
+        if length < options.min_sv_size:
+            continue
+        if candidate_types is not None and typ not in candidate_types:
+            continue
         if typ == "DEL":
-            sv_candidates.append(CandidateDeletion(ref_chr, ref_start + pos_ref, ref_start + pos_ref + length, [query_name], bam))
+            sv_candidates.append(CandidateDeletion(ref_chr, ref_start + pos_ref, ref_start + pos_ref + length, reads, bam))
         elif typ == "INS":
             insertion_seq = alignment.query_sequence[pos_read:pos_read+length]
-            sv_candidates.append(CandidateInsertion(ref_chr, ref_start + pos_ref, ref_start + pos_ref + length, [query_name], insertion_seq, bam))
+            sv_candidates.append(CandidateInsertion(ref_chr, ref_start + pos_ref, ref_start + pos_ref + length, reads, insertion_seq, bam))
     return sv_candidates
-
-
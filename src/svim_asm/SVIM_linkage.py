@@ -0,0 +1,88 @@
+import os
+import json
+
+import numpy as np
+
+from array import array
+
+from svim_asm.SVIM_COMBINE import cut_linkage_tree, merge_clusters
+from svim_asm.SVIM_spill import SpillingSorter, estimate_candidate_size
+from svim_asm.SVIM_store import save_candidates
+
+
+class LinkageCache:
+    """Collects the partitions of PAIR together with their linkage trees. Partitions without a tree form a single
+    cluster at every threshold (single candidates, identical candidates and breakend clusters).
+    The trees are built from distances that are only computed up to the edit distance threshold of the run.
+    Cutting them at a lower threshold gives the same clusters as a run with this threshold.
+    With a memory budget (max_memory), the candidates are spilled to temporary files in the given directory."""
+    def __init__(self, max_memory = None, directory = None):
+        # Candidates are kept in the order they were added. With a memory budget, they are spilled to the given directory.
+        self.candidates = SpillingSorter(key=lambda entry: entry[0], estimate_size=lambda entry: estimate_candidate_size(entry[1]),
+                                         max_memory=max_memory, directory=directory)
+        self.haplotypes = array("i")
+        self.sizes = array("q")
+        self.trees = []
+
+
+    def add(self, partition, tree = None):
+        self.sizes.append(len(partition))
+        for haplotype, candidate in partition:
+            self.haplotypes.append(haplotype)
+            self.candidates.add((len(self.candidates), candidate))
+        self.trees.append(tree)
+
+
+    def save(self, directory, contig_names, contig_lengths, num_haplotypes, max_edit_distance, query_names, coverages = None, uncovered_haplotypes = "ignore"):
+        """Save the partitions to the given directory. query_names is passed on to save_candidates."""
+        os.makedirs(directory, exist_ok = True)
+        save_candidates((candidate for order, candidate in self.candidates), os.path.join(directory, "candidates.svim"), query_names)
+        np.save(os.path.join(directory, "haplotypes.npy"), np.array(self.haplotypes, dtype = np.int32))
+        np.save(os.path.join(directory, "sizes.npy"), np.array(self.sizes, dtype = np.int64))
+        np.save(os.path.join(directory, "has_tree.npy"), np.array([tree is not None for tree in self.trees], dtype = bool))
+        np.save(os.path.join(directory, "trees.npy"), np.concatenate([tree for tree in self.trees if tree is not None] + [np.zeros((0, 4))]))
+        if coverages is not None:
+            for haplotype, coverage in enumerate(coverages, 1):
+                coverage.save(os.path.join(directory, "coverage_hap{0}.npz".format(haplotype)))
+        with open(os.path.join(directory, "linkage.json"), "w") as meta_file:
+            json.dump({"contigs": list(contig_names),
+                       "lengths": list(contig_lengths),
+                       "num_haplotypes": num_haplotypes,
+                       "max_edit_distance": max_edit_distance,
+                       "uncovered_haplotypes": uncovered_haplotypes if coverages is not None else "ignore"}, meta_file)
+
+
+    def close(self):
+        """Remove the spilled candidates"""
+        self.candidates.close()
+
+
+def get_linkage_directory(working_dir):
+    return os.path.join(working_dir, "linkage")
+
+
+def iterate_cached_partitions(directory, store):
+    """Yield (partition, linkage tree or None) for the partitions saved by LinkageCache.save()"""
+    haplotypes = np.load(os.path.join(directory, "haplotypes.npy")).tolist()
+    sizes = np.load(os.path.join(directory, "sizes.npy")).tolist()
+    has_tree = np.load(os.path.join(directory, "has_tree.npy")).tolist()
+    trees = np.load(os.path.join(directory, "trees.npy"))
+    candidate_offset = 0
+    tree_offset = 0
+    for size, partition_has_tree in zip(sizes, has_tree):
+        partition = [(haplotypes[index], store[index]) for index in range(candidate_offset, candidate_offset + size)]
+        candidate_offset += size
+        if partition_has_tree:
+            yield partition, trees[tree_offset:tree_offset + size - 1]
+            tree_offset += size - 1
+        else:
+            yield partition, None
+
+
+def sweep_candidates(directory, store, threshold, num_haplotypes, bam, coverages = None, drop_uncovered = False):
+    """Return the paired candidates for the given edit distance threshold from the cached linkage trees"""
+    paired_candidates = []
+    for partition, tree in iterate_cached_partitions(directory, store):
+        clusters = [partition] if tree is None else cut_linkage_tree(partition, tree, threshold)
+        paired_candidates.extend(merge_clusters(clusters, num_haplotypes, bam, coverages, drop_uncovered))
+    return paired_candidates
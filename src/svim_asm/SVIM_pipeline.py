@@ -0,0 +1,209 @@
+import os
+import logging
+import pysam
+
+from svim_asm.SVIM_COLLECT import analyze_alignment_file_coordsorted_multi, analyze_alignment_file_querysorted_multi, analyze_alignment_file_parallel_multi
+from svim_asm.SVIM_coverage import CoverageRecorder
+from svim_asm.SVIM_COMBINE import pair_candidates_multi, get_breakpoint_windows, write_final_vcf, write_final_vcf_spilled
+from svim_asm.SVIM_linkage import LinkageCache, get_linkage_directory
+from svim_asm.SVIM_plot import plot_sv_lengths
+from svim_asm.SVIM_reference import open_reference
+from svim_asm.SVIM_spill import SpillingCandidateList
+from svim_asm.SVIM_store import save_candidates
+from svim_asm.SVCandidate import QueryNameTable, get_read_names_argument, get_candidate_types
+
+
+def is_coordsorted_and_indexed(aln_file):
+    """Check whether the alignment file is coordinate-sorted and has an index for random access"""
+    try:
+        if aln_file.header["HD"]["SO"] != "coordinate":
+            return False
+    except KeyError:
+        return False
+    try:
+        return aln_file.has_index()
+    except (AttributeError, ValueError):
+        return False
+
+
+def collect_candidates(bam_path, description, options):
+    """Run COLLECT on a SAM/BAM/CRAM file. Coordinate-sorted and indexed files are analyzed chromosome by chromosome
+    (or window by window on several processes with --collect_processes). All other files, including standard input (-), are analyzed in one streaming pass.
+    Returns the opened alignment file and the list of SV candidates or None if the file cannot be read."""
+    result = collect_candidates_multi(bam_path, description, options, [options])
+    if result is None:
+        return None
+    return result[0], result[1][0]
+
+
+def collect_candidates_multi(bam_path, description, options, parameter_sets):
+    """Run COLLECT on a SAM/BAM/CRAM file in one pass for each of the given parameter sets (see analyze_alignment_multi).
+    Returns the opened alignment file and one list of SV candidates per parameter set or None if the file cannot be read."""
+    try:
+        # htslib decompresses BAM/CRAM on its own thread pool and decodes CRAM with the reference genome
+        aln_file = pysam.AlignmentFile(bam_path, threads = options.io_threads, reference_filename = options.genome)
+    except (ValueError, IOError) as e:
+        logging.error("The {0} cannot be read as SAM/BAM/CRAM ({1}). Exiting..".format(description, e))
+        return None
+    if bam_path != "-" and is_coordsorted_and_indexed(aln_file):
+        if getattr(options, "collect_processes", 1) > 1:
+            return aln_file, analyze_alignment_file_parallel_multi(bam_path, aln_file, options, parameter_sets)
+        return aln_file, analyze_alignment_file_coordsorted_multi(aln_file, options, parameter_sets)
+    logging.info("The {0} is not coordinate-sorted and indexed. Reading it in one streaming pass..".format(description))
+    return aln_file, analyze_alignment_file_querysorted_multi(aln_file, options, parameter_sets)
+
+
+def open_reference_or_log(genome):
+    """Open the reference genome or log an error and return None"""
+    try:
+        return open_reference(genome)
+    except ValueError:
+        logging.error("The given reference genome is missing an index file ({0}.fai). Sequence alleles cannot be retrieved.".format(genome))
+    except IOError:
+        logging.error("The given reference genome is missing ({0}). Sequence alleles cannot be retrieved.".format(genome))
+    return None
+
+
+def log_candidate_counts(count_type):
+    """Log the number of final candidates per SV type given a function returning the count for a type"""
+    logging.info("Found {0} deletion candidates.".format(count_type("DEL")))
+    logging.info("Found {0} inversion candidates.".format(count_type("INV")))
+    logging.info("Found {0} insertion candidates.".format(count_type("INS")))
+    logging.info("Found {0} tandem duplication candidates.".format(count_type("DUP_TAN")))
+    logging.info("Found {0} interspersed duplication candidates.".format(count_type("DUP_INT")))
+    logging.info("Found {0} breakend candidates.".format(count_type("BND")))
+
+
+def run_sample(options, version, reference = None):
+    """Run COLLECT, PAIR (diploid and polyploid mode only) and OUTPUT for the sample described by the given options.
+    If no reference is given, it is opened after COLLECT and closed at the end.
+    Returns True on success and False if the input could not be analyzed."""
+    logging.info("****************** STEP 1: COLLECT ******************")
+    # Query names are only tracked if they are written to the output
+    options.query_name_table = QueryNameTable() if options.query_names else None
+    # Candidates of SV types that are not written are neither constructed nor paired
+    options.candidate_types = get_candidate_types(options)
+
+    if options.sub == 'haploid':
+        logging.info("MODE: haploid")
+        logging.info("INPUT: {0}".format(os.path.abspath(options.bam_file)))
+        inputs = [(options.bam_file, "input BAM file")]
+    elif options.sub == 'diploid':
+        logging.info("MODE: diploid")
+        logging.info("INPUT1: {0}".format(os.path.abspath(options.bam_file1)))
+        logging.info("INPUT2: {0}".format(os.path.abspath(options.bam_file2)))
+        inputs = [(options.bam_file1, "first input BAM file"), (options.bam_file2, "second input BAM file")]
+    elif options.sub == 'polyploid':
+        logging.info("MODE: polyploid")
+        inputs = []
+        for index, bam_file in enumerate(options.bam_files, 1):
+            logging.info("INPUT{0}: {1}".format(index, os.path.abspath(bam_file)))
+            inputs.append((bam_file, "input BAM file {0}".format(index)))
+
+    aln_files = []
+    sv_candidate_lists = []
+    # The reference intervals covered by each haplotype are only recorded if they are used to genotype variants
+    coverages = [] if options.sub != 'haploid' and options.uncovered_haplotypes != "ignore" else None
+    for bam_file, description in inputs:
+        if coverages is not None:
+            options.coverage_recorder = CoverageRecorder()
+        result = collect_candidates(bam_file, description, options)
+        if result is None:
+            return False
+        aln_files.append(result[0])
+        sv_candidate_lists.append(result[1])
+        if coverages is not None:
+            coverages.append(options.coverage_recorder.finish())
+            options.coverage_recorder = None
+        # Spilled candidates of this input are moved to disk before the next input is analyzed
+        if isinstance(result[1], SpillingCandidateList):
+            result[1].flush()
+    aln_file1 = aln_files[0]
+
+    # Open reference genome sequence file
+    own_reference = reference is None
+    if own_reference:
+        reference = open_reference_or_log(options.genome)
+        if reference is None:
+            return False
+    return pair_and_output(sv_candidate_lists, options.sub != 'haploid', aln_file1.references, aln_file1.lengths, aln_file1, reference, own_reference, options, version, coverages)
+
+
+def pair_and_output(sv_candidate_lists, run_pair, contig_names, contig_lengths, bam, reference, own_reference, options, version, coverages = None):
+    """Run PAIR (if run_pair is set) and OUTPUT on the SV candidates of all haplotypes of a sample.
+    bam provides the contig lengths for merged candidates. The reference is closed at the end if own_reference is set.
+    coverages are the reference intervals covered by each haplotype (for --uncovered_haplotypes)."""
+    if not run_pair:
+        final_candidates = sv_candidate_lists[0]
+    else:
+        logging.info("****************** STEP 2: PAIR ******************")
+        linkage_cache = LinkageCache(options.max_memory, options.working_dir) if options.save_linkage else None
+        final_candidates = pair_candidates_multi(sv_candidate_lists, reference, options.max_edit_distance, bam, options.max_memory, options.working_dir,
+                                                 get_breakpoint_windows(options), options.sketch_prefilter, coverages, options.uncovered_haplotypes == "drop",
+                                                 get_candidate_types(options), linkage_cache)
+        if linkage_cache is not None:
+            logging.info("Save linkage trees..")
+            linkage_cache.save(get_linkage_directory(options.working_dir), contig_names, contig_lengths, len(sv_candidate_lists), options.max_edit_distance,
+                               options.query_name_table if options.query_name_table is not None else False, coverages, options.uncovered_haplotypes)
+            linkage_cache.close()
+
+    if not run_pair:
+        logging.info("****************** STEP 2: OUTPUT ******************")
+    else:
+        logging.info("****************** STEP 3: OUTPUT ******************")
+
+    if options.save_candidates:
+        logging.info("Save SV candidates to candidate store..")
+        save_candidates(final_candidates, os.path.join(options.working_dir, "candidates.svim"), get_read_names_argument(options))
+
+    types_to_output = [entry.strip() for entry in options.types.split(",")]
+    if isinstance(final_candidates, SpillingCandidateList):
+        final_candidates.flush()
+        log_candidate_counts(final_candidates.count_type)
+
+        # Write SV candidates
+        logging.info("Write SV candidates..")
+        write_final_vcf_spilled(final_candidates,
+                                version,
+                                contig_names,
+                                contig_lengths,
+                                types_to_output,
+                                reference,
+                                options)
+        if own_reference:
+            reference.close()
+        logging.info("Draw plots..")
+        plot_sv_lengths(final_candidates.iter_type("DEL"), final_candidates.iter_type("INV"), final_candidates.iter_type("DUP_INT"), final_candidates.iter_type("DUP_TAN"), final_candidates.iter_type("INS"), options)
+        for sv_candidates in set([final_candidates] + sv_candidate_lists):
+            sv_candidates.close()
+        return True
+
+    deletion_candidates = [cand for cand in final_candidates if cand.type == "DEL"]
+    insertion_candidates = [cand for cand in final_candidates if cand.type == "INS"]
+    inversion_candidates = [cand for cand in final_candidates if cand.type == "INV"]
+    tandem_duplication_candidates = [cand for cand in final_candidates if cand.type == "DUP_TAN"]
+    breakend_candidates = [cand for cand in final_candidates if cand.type == "BND"]
+    interspersed_duplication_candidates = [cand for cand in final_candidates if cand.type == "DUP_INT"]
+    candidates_by_type = {"DEL": deletion_candidates, "INS": insertion_candidates, "INV": inversion_candidates,
+                          "DUP_TAN": tandem_duplication_candidates, "BND": breakend_candidates, "DUP_INT": interspersed_duplication_candidates}
+    log_candidate_counts(lambda sv_type: len(candidates_by_type[sv_type]))
+
+    # Write SV candidates
+    logging.info("Write SV candidates..")
+    write_final_vcf(interspersed_duplication_candidates,
+                    inversion_candidates,
+                    tandem_duplication_candidates,
+                    deletion_candidates,
+                    insertion_candidates,
+                    breakend_candidates,
+                    version,
+                    contig_names,
+                    contig_lengths,
+                    types_to_output,
+                    reference,
+                    options)
+    if own_reference:
+        reference.close()
+    logging.info("Draw plots..")
+    plot_sv_lengths(deletion_candidates, inversion_candidates, interspersed_duplication_candidates, tandem_duplication_candidates, insertion_candidates, options)
+    return True
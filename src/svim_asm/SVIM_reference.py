@@ -0,0 +1,194 @@
+import os
+import mmap
+import logging
+
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+from pysam import FastaFile
+
+
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+def reverse_complement(sequence):
+    """Return the reverse complement of an upper-case nucleotide sequence. Other characters (e.g. N) are kept."""
+    return sequence.translate(COMPLEMENT)[::-1]
+
+
+def merge_regions(regions, max_gap, max_block_size):
+    """Merge the given regions (contig, start, end) into blocks per contig.
+    Regions closer than max_gap are merged as long as the block does not exceed max_block_size."""
+    regions_per_contig = defaultdict(list)
+    for contig, start, end in regions:
+        regions_per_contig[contig].append((start, end))
+    blocks = dict()
+    for contig, contig_regions in regions_per_contig.items():
+        contig_regions.sort()
+        contig_blocks = []
+        for start, end in contig_regions:
+            if len(contig_blocks) > 0:
+                block_start, block_end = contig_blocks[-1]
+                if start - block_end <= max_gap and max(end, block_end) - block_start <= max_block_size:
+                    contig_blocks[-1] = (block_start, max(end, block_end))
+                    continue
+            contig_blocks.append((start, end))
+        blocks[contig] = contig_blocks
+    return blocks
+
+
+class FastaReference:
+    """Reference genome read from an indexed FASTA file. Sequences are returned in upper case."""
+    def __init__(self, genome):
+        self.genome = genome
+        self.fasta = FastaFile(genome)
+        self.references = self.fasta.references
+        self.lengths = self.fasta.lengths
+
+
+    def clone(self):
+        """Open another handle to the same FASTA file, e.g. for use in another thread"""
+        return FastaReference(self.genome)
+
+
+    def fetch(self, contig, start = None, end = None):
+        return self.fasta.fetch(contig, start, end).upper()
+
+
+    def get_reference_length(self, contig):
+        return self.fasta.get_reference_length(contig)
+
+
+    def close(self):
+        self.fasta.close()
+
+
+def get_cache_path(genome):
+    """Return the paths of the sequence and index file of the reference cache for the given FASTA file"""
+    return (genome + ".svimref", genome + ".svimref.idx")
+
+
+def write_reference_cache(genome, chunk_size = 10000000):
+    """Write the reference cache next to the given FASTA file: all contigs in upper case and concatenated
+    (one byte per base) plus a tab-separated index with the name, offset and length of each contig.
+    Files are written under a temporary name and renamed at the end so that readers never see a partial cache."""
+    sequence_path, index_path = get_cache_path(genome)
+    reference = FastaFile(genome)
+    offset = 0
+    with open(sequence_path + ".tmp", "wb") as sequence_file, open(index_path + ".tmp", "w") as index_file:
+        for contig, length in zip(reference.references, reference.lengths):
+            logging.info("Writing contig {0} to reference cache..".format(contig))
+            for chunk_start in range(0, length, chunk_size):
+                sequence_file.write(reference.fetch(contig, chunk_start, min(length, chunk_start + chunk_size)).upper().encode())
+            print("{0}\t{1}\t{2}".format(contig, offset, length), file=index_file)
+            offset += length
+    reference.close()
+    os.replace(sequence_path + ".tmp", sequence_path)
+    os.replace(index_path + ".tmp", index_path)
+    return sequence_path
+
+
+class MappedReference:
+    """Reference genome read from a memory-mapped cache written by write_reference_cache.
+    Fetches are plain slices of the mapped file which is shared through the page cache
+    by all processes on a machine that use the same reference."""
+    def __init__(self, genome):
+        self.genome = genome
+        sequence_path, index_path = get_cache_path(genome)
+        self.references = []
+        self.lengths = []
+        self.offsets = dict()
+        with open(index_path) as index_file:
+            for line in index_file:
+                contig, offset, length = line.rstrip("\n").split("\t")
+                self.references.append(contig)
+                self.lengths.append(int(length))
+                self.offsets[contig] = (int(offset), int(length))
+        self.handle = open(sequence_path, "rb")
+        self.map = mmap.mmap(self.handle.fileno(), 0, access = mmap.ACCESS_READ)
+
+
+    def clone(self):
+        """Map the cache another time, e.g. for use in another thread. The pages are shared with this instance."""
+        return MappedReference(self.genome)
+
+
+    def fetch(self, contig, start = None, end = None):
+        offset, length = self.offsets[contig]
+        start = 0 if start is None else min(max(0, start), length)
+        end = length if end is None else min(max(start, end), length)
+        return self.map[offset + start:offset + end].decode()
+
+
+    def get_reference_length(self, contig):
+        return self.offsets[contig][1]
+
+
+    def close(self):
+        self.map.close()
+        self.handle.close()
+
+
+def has_reference_cache(genome):
+    """Check whether an up-to-date reference cache exists for the given FASTA file"""
+    sequence_path, index_path = get_cache_path(genome)
+    if not (os.path.exists(sequence_path) and os.path.exists(index_path)):
+        return False
+    return os.path.getmtime(index_path) >= os.path.getmtime(genome)
+
+
+def open_reference(genome):
+    """Open the reference genome from its cache if present or from the indexed FASTA file otherwise"""
+    if has_reference_cache(genome):
+        logging.info("Using reference cache {0}".format(get_cache_path(genome)[0]))
+        return MappedReference(genome)
+    return FastaReference(genome)
+
+
+class BlockReference:
+    """Read-only view of the reference genome for a known set of regions.
+    The regions are merged into per-chromosome blocks that are read once. Requesting the regions
+    in genomic order therefore results in one sequential read of the needed parts of the reference.
+    Fetches outside of the blocks are passed through to the underlying reference."""
+    def __init__(self, reference, regions, max_gap = 100000, max_block_size = 10000000, cache_size = 4):
+        self.reference = reference
+        self.blocks = merge_regions(regions, max_gap, max_block_size)
+        self.block_starts = {contig: [start for start, end in contig_blocks] for contig, contig_blocks in self.blocks.items()}
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+
+    def get_block(self, contig, start, end):
+        """Return (block_start, block_sequence) of the block containing the given region or None"""
+        if contig not in self.blocks:
+            return None
+        block_index = bisect_right(self.block_starts[contig], start) - 1
+        if block_index < 0:
+            return None
+        block_start, block_end = self.blocks[contig][block_index]
+        if end > block_end:
+            return None
+        key = (contig, block_index)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        else:
+            self.cache[key] = (block_start, self.reference.fetch(contig, block_start, block_end))
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last = False)
+        return self.cache[key]
+
+
+    def fetch(self, contig, start, end):
+        block = self.get_block(contig, start, end)
+        if block is None:
+            return self.reference.fetch(contig, start, end)
+        block_start, block_sequence = block
+        return block_sequence[start - block_start:end - block_start]
+
+
+    def get_reference_length(self, contig):
+        return self.reference.get_reference_length(contig)
+
+
+    def close(self):
+        """Drop the cached blocks. The underlying reference stays open and is closed by its owner."""
+        self.cache.clear()
@@ -0,0 +1,80 @@
+import re
+
+import numpy as np
+
+
+BASE_CODES = bytes.maketrans(b"ACGT", b"\x00\x01\x02\x03")
+BASES = np.frombuffer(b"ACGT", dtype = np.uint8)
+NON_ACGT = re.compile(r"[^ACGT]+")
+LOWER_CASE = re.compile(r"[a-z]+")
+
+
+class EncodedSequence:
+    """Nucleotide sequence stored with 2 bits per base. Runs of other characters (N, IUPAC codes) are kept in an
+    exception list and runs of lower-case bases as intervals so that decode() returns exactly the original sequence.
+    Two encoded sequences are equal if and only if the decoded sequences are equal."""
+    __slots__ = ("packed", "length", "exceptions", "lower_case")
+
+    def __init__(self, sequence):
+        self.length = len(sequence)
+        self.lower_case = tuple(match.span() for match in LOWER_CASE.finditer(sequence))
+        if len(self.lower_case) > 0:
+            sequence = sequence.upper()
+        self.exceptions = tuple((match.start(), match.group()) for match in NON_ACGT.finditer(sequence))
+        codes = np.zeros(self.length + (-self.length % 4), dtype = np.uint8)
+        codes[:self.length] = np.frombuffer(sequence.encode().translate(BASE_CODES), dtype = np.uint8)
+        # Exception characters are encoded with code 0 (A) and restored from the exception list
+        codes[codes > 3] = 0
+        self.packed = (codes[0::4] << 6 | codes[1::4] << 4 | codes[2::4] << 2 | codes[3::4]).tobytes()
+
+
+    def decode(self):
+        """Return the sequence as string"""
+        packed = np.frombuffer(self.packed, dtype = np.uint8)
+        codes = np.empty(len(packed) * 4, dtype = np.uint8)
+        for shift, offset in ((6, 0), (4, 1), (2, 2), (0, 3)):
+            codes[offset::4] = (packed >> shift) & 3
+        sequence = BASES[codes[:self.length]]
+        for start, run in self.exceptions:
+            sequence[start:start + len(run)] = np.frombuffer(run.encode(), dtype = np.uint8)
+        for start, end in self.lower_case:
+            sequence[start:end] |= 0x20
+        return sequence.tobytes().decode()
+
+
+    def __len__(self):
+        return self.length
+
+
+    def __str__(self):
+        return self.decode()
+
+
+    def __repr__(self):
+        return "EncodedSequence({0!r})".format(self.decode())
+
+
+    def __eq__(self, other):
+        if not isinstance(other, EncodedSequence):
+            return NotImplemented
+        return self.length == other.length and self.packed == other.packed and \
+               self.exceptions == other.exceptions and self.lower_case == other.lower_case
+
+
+    def __hash__(self):
+        return hash((self.length, self.packed, self.exceptions, self.lower_case))
+
+
+    def __getstate__(self):
+        return (self.packed, self.length, self.exceptions, self.lower_case)
+
+
+    def __setstate__(self, state):
+        self.packed, self.length, self.exceptions, self.lower_case = state
+
+
+def encode_sequence(sequence):
+    """Return the given sequence (string or EncodedSequence) as EncodedSequence"""
+    if isinstance(sequence, EncodedSequence):
+        return sequence
+    return EncodedSequence(sequence)
@@ -0,0 +1,275 @@
+import io
+import os
+import json
+import signal
+import logging
+import socketserver
+import pysam
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from svim_asm.SVIM_api import parse_region
+from svim_asm.SVIM_COLLECT import analyze_alignment
+from svim_asm.SVIM_COMBINE import pair_candidates_multi, get_breakpoint_windows, write_final_vcf
+from svim_asm.SVIM_coverage import CoverageRecorder
+from svim_asm.SVIM_pipeline import is_coordsorted_and_indexed, open_reference_or_log
+from svim_asm.SVIM_vcf import get_vcf_header_lines, TextVcfWriter
+from svim_asm.SVCandidate import QueryNameTable, get_candidate_types
+
+
+def get_candidate_intervals(candidate):
+    """Return the reference intervals (contig, start, end) spanned by the source and destination of the candidate"""
+    intervals = []
+    if hasattr(candidate, "source_contig"):
+        intervals.append((candidate.source_contig, candidate.source_start, getattr(candidate, "source_end", candidate.source_start)))
+    if hasattr(candidate, "dest_contig"):
+        intervals.append((candidate.dest_contig, candidate.dest_start, getattr(candidate, "dest_end", candidate.dest_start)))
+    return intervals
+
+
+def touches_regions(candidate, regions):
+    """Check whether the candidate may be written with a position inside one of the regions"""
+    for contig, start, end in get_candidate_intervals(candidate):
+        for region_contig, region_start, region_end in regions:
+            if contig == region_contig and (region_start is None or end + 1 >= region_start) and (region_end is None or start - 1 < region_end):
+                return True
+    return False
+
+
+def in_regions(contig, position, regions):
+    """Check whether a 1-based position lies inside one of the regions (0-based start, end)"""
+    for region_contig, start, end in regions:
+        if contig == region_contig and (start is None or start < position) and (end is None or position <= end):
+            return True
+    return False
+
+
+class RegionRecordFilter:
+    """Passes the VCF records with a position inside the regions through to a VCF writer"""
+    def __init__(self, vcf_writer, regions):
+        self.vcf_writer = vcf_writer
+        self.regions = regions
+
+
+    def write(self, record, variant_id):
+        if in_regions(record.chrom, record.pos, self.regions):
+            self.vcf_writer.write(record, variant_id)
+
+
+    def close(self):
+        self.vcf_writer.close()
+
+
+def fetch_primary_alignment(aln_file, supplementary):
+    """Return the primary alignment of the query of a supplementary alignment or None if it cannot be found
+    at the positions listed in the SA tag. aln_file needs to be a different handle than the one that
+    supplementary was fetched from because nested fetches on the same contig disturb the outer iterator."""
+    if not supplementary.has_tag("SA"):
+        return None
+    for element in supplementary.get_tag("SA").split(";"):
+        fields = element.split(",")
+        if len(fields) != 6:
+            continue
+        position = int(fields[1]) - 1
+        for alignment in aln_file.fetch(contig = fields[0], start = position, stop = position + 1):
+            if alignment.query_name == supplementary.query_name and alignment.reference_start == position and \
+               not alignment.is_supplementary and not alignment.is_secondary:
+                return alignment
+    return None
+
+
+class RegionCaller:
+    """Keeps the indexed alignment files of all haplotypes and the reference genome open and calls SVs in
+    regions on request. Candidates are collected from all alignments overlapping a region (including alignments
+    that start before it). Candidates that touch a region are paired and their VCF records inside the region are written."""
+    def __init__(self, options, reference, version):
+        self.options = options
+        self.version = version
+        self.reference = reference
+        self.aln_files = []
+        # Second handles of the alignment files to look up primary alignments while a region is fetched
+        self.lookup_files = []
+        self.types_to_output = [entry.strip() for entry in options.types.split(",")]
+        self.breakpoint_windows = get_breakpoint_windows(options)
+        options.candidate_types = get_candidate_types(options)
+        for index, bam_file in enumerate(options.bam_files, 1):
+            aln_file = pysam.AlignmentFile(bam_file, threads = options.io_threads, reference_filename = options.genome)
+            self.aln_files.append(aln_file)
+            self.lookup_files.append(pysam.AlignmentFile(bam_file, reference_filename = options.genome))
+            if not is_coordsorted_and_indexed(aln_file):
+                self.close()
+                raise ValueError("The input BAM file {0} is not coordinate-sorted and indexed".format(index))
+        self.contig_lengths = dict(zip(self.reference.references, self.reference.lengths))
+
+
+    def parse_regions(self, region_strings):
+        """Parse regions given as contig names or samtools-style strings (chr1:1001-2000)"""
+        regions = []
+        for region_string in region_strings:
+            contig, start, end = parse_region(region_string)
+            if contig not in self.contig_lengths:
+                raise ValueError("Unknown contig: {0}".format(contig))
+            if start is not None and (start < 0 or end <= start):
+                raise ValueError("Invalid region: {0}".format(region_string))
+            regions.append((contig, start, end))
+        return regions
+
+
+    def collect(self, aln_file, lookup_file, regions, options):
+        """Return the SV candidates reported inside the regions. Split alignments are analyzed from their primary
+        alignment, which is looked up through the SA tag if only a supplementary alignment overlaps a region."""
+        sv_candidates = []
+        analyzed = set()
+        for contig, start, end in regions:
+            for alignment in aln_file.fetch(contig = contig, start = start, stop = end):
+                alignments = [alignment]
+                if alignment.is_supplementary:
+                    primary = fetch_primary_alignment(lookup_file, alignment)
+                    if primary is not None:
+                        alignments.append(primary)
+                for current_alignment in alignments:
+                    alignment_key = (current_alignment.query_name, current_alignment.flag, current_alignment.reference_id, current_alignment.reference_start)
+                    if alignment_key in analyzed:
+                        continue
+                    analyzed.add(alignment_key)
+                    sv_candidates.extend(candidate for candidate in analyze_alignment(current_alignment, aln_file, options) if touches_regions(candidate, regions))
+        return sv_candidates
+
+
+    def call(self, region_strings):
+        """Return the VCF (header and records) of the SVs in the given regions"""
+        options = self.options
+        regions = self.parse_regions(region_strings)
+        # Query names are tracked per request
+        options.query_name_table = QueryNameTable() if options.query_names else None
+        record_coverage = len(self.aln_files) > 1 and options.uncovered_haplotypes != "ignore"
+        sv_candidate_lists = []
+        coverages = [] if record_coverage else None
+        for aln_file, lookup_file in zip(self.aln_files, self.lookup_files):
+            if record_coverage:
+                options.coverage_recorder = CoverageRecorder()
+            sv_candidate_lists.append(self.collect(aln_file, lookup_file, regions, options))
+            if record_coverage:
+                coverages.append(options.coverage_recorder.finish())
+                options.coverage_recorder = None
+        if len(sv_candidate_lists) > 1:
+            final_candidates = pair_candidates_multi(sv_candidate_lists, self.reference, options.max_edit_distance, self.aln_files[0],
+                                                     breakpoint_windows = self.breakpoint_windows, sketch_prefilter = options.sketch_prefilter,
+                                                     coverages = coverages, drop_uncovered = options.uncovered_haplotypes == "drop",
+                                                     candidate_types = options.candidate_types)
+        else:
+            final_candidates = sv_candidate_lists[0]
+
+        candidates_by_type = {"DEL": [], "INV": [], "INS": [], "DUP_TAN": [], "DUP_INT": [], "BND": []}
+        for candidate in final_candidates:
+            candidates_by_type[candidate.type].append(candidate)
+        output = io.StringIO()
+        header_lines = get_vcf_header_lines(self.version, self.reference.references, self.reference.lengths, self.types_to_output, options)
+        write_final_vcf(candidates_by_type["DUP_INT"],
+                        candidates_by_type["INV"],
+                        candidates_by_type["DUP_TAN"],
+                        candidates_by_type["DEL"],
+                        candidates_by_type["INS"],
+                        candidates_by_type["BND"],
+                        self.version,
+                        self.reference.references,
+                        self.reference.lengths,
+                        self.types_to_output,
+                        self.reference,
+                        options,
+                        vcf_writer = RegionRecordFilter(TextVcfWriter(output, header_lines, options.sample), regions))
+        return output.getvalue()
+
+
+    def close(self):
+        for aln_file in self.aln_files + self.lookup_files:
+            aln_file.close()
+
+
+class RegionCallHandler(BaseHTTPRequestHandler):
+    """Answers GET /call?region=chr1:1001-2000 (region may be repeated) with the VCF of the SVs in the regions
+    and GET /status with a JSON description of the loaded inputs"""
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/call":
+            region_strings = parse_qs(url.query).get("region", [])
+            if len(region_strings) == 0:
+                self.send_text(400, "Missing parameter: region\n")
+                return
+            try:
+                vcf = self.server.region_caller.call(region_strings)
+            except ValueError as e:
+                self.send_text(400, "{0}\n".format(e))
+                return
+            self.send_text(200, vcf, "text/plain")
+        elif url.path == "/status":
+            options = self.server.region_caller.options
+            status = {"version": self.server.region_caller.version,
+                      "inputs": [os.path.abspath(bam_file) for bam_file in options.bam_files],
+                      "genome": os.path.abspath(options.genome)}
+            self.send_text(200, json.dumps(status) + "\n", "application/json")
+        else:
+            self.send_text(404, "Unknown path: {0}. Use /call?region=<region> or /status\n".format(url.path))
+
+
+    def send_text(self, code, text, content_type = "text/plain"):
+        body = text.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        logging.info("REQUEST: {0}".format(format % args))
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    """HTTP server listening on a Unix domain socket"""
+    def get_request(self):
+        request, client_address = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) address
+        return request, ("local", 0)
+
+
+def raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def run_serve(options, version):
+    """Open the alignment files and the reference genome and answer region call requests until interrupted.
+    Requests are handled one at a time and share the open files. Returns True on success."""
+    reference = open_reference_or_log(options.genome)
+    if reference is None:
+        return False
+    try:
+        region_caller = RegionCaller(options, reference, version)
+    except (ValueError, IOError) as e:
+        logging.error("The alignments cannot be served ({0}). Exiting..".format(e))
+        reference.close()
+        return False
+
+    if options.socket is not None:
+        if os.path.exists(options.socket):
+            os.remove(options.socket)
+        server = UnixHTTPServer(options.socket, RegionCallHandler)
+        logging.info("Listening on Unix socket {0}".format(options.socket))
+    else:
+        server = HTTPServer(("127.0.0.1", options.port), RegionCallHandler)
+        logging.info("Listening on http://127.0.0.1:{0}".format(server.server_address[1]))
+    server.region_caller = region_caller
+    # Shut down cleanly (and remove the socket) when terminated
+    signal.signal(signal.SIGTERM, raise_keyboard_interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down..")
+    finally:
+        server.server_close()
+        if options.socket is not None and os.path.exists(options.socket):
+            os.remove(options.socket)
+        region_caller.close()
+        reference.close()
+    return True
@@ -0,0 +1,195 @@
+import os
+import json
+import heapq
+import shutil
+import logging
+import pysam
+
+from svim_asm.SVIM_COLLECT import analyze_regions_coordsorted, get_regions
+from svim_asm.SVIM_pipeline import is_coordsorted_and_indexed, open_reference_or_log, pair_and_output
+from svim_asm.SVIM_spill import new_candidate_list, SpillingCandidateList
+from svim_asm.SVIM_store import save_candidates, load_candidates
+from svim_asm.SVIM_coverage import CoverageRecorder, load_coverage
+from svim_asm.SVCandidate import QueryNameTable
+
+
+class ContigTable:
+    """Contig names and lengths of the reference, e.g. as recorded by the shards of a sample"""
+    def __init__(self, references, lengths):
+        self.references = list(references)
+        self.lengths = list(lengths)
+        self.length_by_name = dict(zip(self.references, self.lengths))
+
+
+    def get_reference_length(self, contig):
+        return self.length_by_name[contig]
+
+
+def get_region_length(region, contig_lengths_by_name):
+    contig, start, end = region
+    if start is None:
+        return contig_lengths_by_name[contig]
+    return end - start
+
+
+def assign_regions_to_shards(region_lengths, num_shards):
+    """Distribute regions over shards so that the total length per shard is balanced.
+    Regions are assigned in order of decreasing length to the shard with the smallest total length so far
+    (ties are broken by region and shard index). Returns the sorted region indices of each shard."""
+    shards = [[] for shard in range(num_shards)]
+    loads = [(0, shard) for shard in range(num_shards)]
+    for region_index in sorted(range(len(region_lengths)), key=lambda index: (-region_lengths[index], index)):
+        load, shard = heapq.heappop(loads)
+        shards[shard].append(region_index)
+        heapq.heappush(loads, (load + region_lengths[region_index], shard))
+    return [sorted(region_indices) for region_indices in shards]
+
+
+def get_shard_directory(working_dir, shard_index, num_shards):
+    return os.path.join(working_dir, "shards", "{0}_of_{1}".format(shard_index, num_shards))
+
+
+def run_collect_shard(options):
+    """Run COLLECT on the regions of one shard for every input file and save the candidates of each haplotype
+    to a candidate store. A manifest (shard.json) listing the number of candidates per region is written last
+    so that gather only sees complete shards. Returns True on success."""
+    shard_index, num_shards = options.shard
+    logging.info("****************** STEP 1: COLLECT (shard {0} of {1}) ******************".format(shard_index, num_shards))
+    # Query names are always saved because gather decides whether they are written
+    options.query_name_table = QueryNameTable()
+    aln_files = []
+    for index, bam_file in enumerate(options.bam_files, 1):
+        logging.info("INPUT{0}: {1}".format(index, os.path.abspath(bam_file)))
+        try:
+            aln_file = pysam.AlignmentFile(bam_file, threads = options.io_threads, reference_filename = options.genome)
+        except (ValueError, IOError) as e:
+            logging.error("The input BAM file {0} cannot be read as SAM/BAM/CRAM ({1}). Exiting..".format(index, e))
+            return False
+        if not is_coordsorted_and_indexed(aln_file):
+            logging.error("The input BAM file {0} is not coordinate-sorted and indexed. Sharding requires random access. Exiting..".format(index))
+            return False
+        aln_files.append(aln_file)
+
+    contig_names, contig_lengths = list(aln_files[0].references), list(aln_files[0].lengths)
+    regions = get_regions(contig_names, contig_lengths, options.window_size)
+    contig_lengths_by_name = dict(zip(contig_names, contig_lengths))
+    shard_regions = assign_regions_to_shards([get_region_length(region, contig_lengths_by_name) for region in regions], num_shards)[shard_index - 1]
+    logging.info("Shard {0} of {1} contains {2} of {3} regions ({4} bp).".format(shard_index, num_shards, len(shard_regions), len(regions),
+                                                                                sum(get_region_length(regions[index], contig_lengths_by_name) for index in shard_regions)))
+
+    shard_directory = get_shard_directory(options.working_dir, shard_index, num_shards)
+    if os.path.exists(shard_directory):
+        shutil.rmtree(shard_directory)
+    os.makedirs(shard_directory)
+    region_counts = []
+    for haplotype, aln_file in enumerate(aln_files, 1):
+        # Covered intervals are always saved because gather decides whether they are used
+        options.coverage_recorder = CoverageRecorder()
+        counts = []
+        def iterate_shard_candidates():
+            for region_index in shard_regions:
+                count = 0
+                for candidate in analyze_regions_coordsorted(aln_file, [regions[region_index]], options):
+                    count += 1
+                    yield candidate
+                counts.append(count)
+        num_candidates = save_candidates(iterate_shard_candidates(), os.path.join(shard_directory, "hap{0}.svim".format(haplotype)), options.query_name_table)
+        logging.info("Saved {0} SV candidates of haplotype {1}.".format(num_candidates, haplotype))
+        options.coverage_recorder.finish().save(os.path.join(shard_directory, "hap{0}.coverage.npz".format(haplotype)))
+        options.coverage_recorder = None
+        region_counts.append(counts)
+        aln_file.close()
+
+    manifest = {"shard": shard_index,
+                "num_shards": num_shards,
+                "num_haplotypes": len(aln_files),
+                "contigs": contig_names,
+                "lengths": contig_lengths,
+                "window_size": options.window_size,
+                "regions": shard_regions,
+                "counts": region_counts}
+    with open(os.path.join(shard_directory, "shard.json.tmp"), "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(os.path.join(shard_directory, "shard.json.tmp"), os.path.join(shard_directory, "shard.json"))
+    return True
+
+
+def read_shard_manifests(working_dir):
+    """Read the manifests of all shards in the working directory. Raises ValueError if shards are missing or inconsistent."""
+    shards_directory = os.path.join(working_dir, "shards")
+    if not os.path.isdir(shards_directory):
+        raise ValueError("No shards found in {0}".format(shards_directory))
+    manifests = []
+    for name in sorted(os.listdir(shards_directory)):
+        manifest_path = os.path.join(shards_directory, name, "shard.json")
+        if not os.path.exists(manifest_path):
+            raise ValueError("Shard {0} is incomplete (no shard.json)".format(name))
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        manifest["directory"] = os.path.join(shards_directory, name)
+        manifests.append(manifest)
+    if len(manifests) == 0:
+        raise ValueError("No shards found in {0}".format(shards_directory))
+    first = manifests[0]
+    for manifest in manifests:
+        for key in ["num_shards", "num_haplotypes", "contigs", "lengths", "window_size"]:
+            if manifest[key] != first[key]:
+                raise ValueError("Shards {0} and {1} differ in {2}".format(first["directory"], manifest["directory"], key))
+    found_shards = set(manifest["shard"] for manifest in manifests)
+    missing_shards = [shard for shard in range(1, first["num_shards"] + 1) if shard not in found_shards]
+    if len(missing_shards) > 0 or len(manifests) != first["num_shards"]:
+        raise ValueError("Expected {0} shards but shards {1} are missing".format(first["num_shards"], ", ".join(str(shard) for shard in missing_shards)))
+    return sorted(manifests, key=lambda manifest: manifest["shard"])
+
+
+def iterate_haplotype_candidates(manifests, stores, haplotype):
+    """Iterate over the candidates of one haplotype from all shards in the genomic order of their regions.
+    This is the order in which the candidates are found when the whole input file is analyzed at once."""
+    segments = []
+    for manifest, store in zip(manifests, stores):
+        offset = 0
+        for region_index, count in zip(manifest["regions"], manifest["counts"][haplotype]):
+            segments.append((region_index, store, offset, count))
+            offset += count
+    for region_index, store, offset, count in sorted(segments, key=lambda segment: segment[0]):
+        for index in range(offset, offset + count):
+            yield store[index]
+
+
+def run_gather(options, version):
+    """Load the candidates of all shards and run PAIR (for more than one haplotype) and OUTPUT. Returns True on success."""
+    logging.info("****************** STEP 1: GATHER ******************")
+    try:
+        manifests = read_shard_manifests(options.working_dir)
+    except ValueError as e:
+        logging.error("{0}. Exiting..".format(e))
+        return False
+    num_haplotypes = manifests[0]["num_haplotypes"]
+    logging.info("Gathering {0} shards with {1} haplotypes..".format(len(manifests), num_haplotypes))
+    contigs = ContigTable(manifests[0]["contigs"], manifests[0]["lengths"])
+    options.query_name_table = QueryNameTable() if options.query_names else None
+
+    sv_candidate_lists = []
+    all_stores = []
+    for haplotype in range(num_haplotypes):
+        stores = [load_candidates(os.path.join(manifest["directory"], "hap{0}.svim".format(haplotype + 1)), options.query_name_table if options.query_names else False) for manifest in manifests]
+        all_stores.extend(stores)
+        sv_candidates = new_candidate_list(options.max_memory, options.working_dir)
+        for candidate in iterate_haplotype_candidates(manifests, stores, haplotype):
+            sv_candidates.append(candidate)
+        if isinstance(sv_candidates, SpillingCandidateList):
+            sv_candidates.flush()
+        sv_candidate_lists.append(sv_candidates)
+    for store in all_stores:
+        store.close()
+
+    if num_haplotypes > 1 and options.uncovered_haplotypes != "ignore":
+        coverages = [load_coverage([os.path.join(manifest["directory"], "hap{0}.coverage.npz".format(haplotype + 1)) for manifest in manifests])
+                     for haplotype in range(num_haplotypes)]
+    else:
+        coverages = None
+
+    reference = open_reference_or_log(options.genome)
+    if reference is None:
+        return False
+    return pair_and_output(sv_candidate_lists, num_haplotypes > 1, contigs.references, contigs.lengths, contigs, reference, True, options, version, coverages)
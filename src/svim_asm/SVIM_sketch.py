@@ -0,0 +1,48 @@
+import numpy as np
+
+
+#Length of the q-grams and number of hash bits (the sketches have 2^bits bins)
+QGRAM_LENGTH = 10
+SKETCH_BITS = 14
+
+
+def get_qgram_profile(sequence, q = QGRAM_LENGTH, bits = SKETCH_BITS):
+    """Return the number of q-grams of the sequence that fall into each bin of a hash table"""
+    values = np.frombuffer(sequence.encode(), dtype = np.uint8).astype(np.uint64)
+    num_qgrams = len(values) - q + 1
+    if num_qgrams <= 0:
+        return np.zeros(1 << bits, dtype = np.int32)
+    codes = np.zeros(num_qgrams, dtype = np.uint64)
+    for offset in range(q):
+        codes = codes * np.uint64(257) + values[offset:offset + num_qgrams]
+    hashes = (codes * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(64 - bits)
+    return np.bincount(hashes.astype(np.int64), minlength = 1 << bits).astype(np.int32)
+
+
+def get_inserted_sequence(candidate, reference):
+    if candidate.type == "INS":
+        return candidate.sequence.decode()
+    return reference.fetch(candidate.source_contig, candidate.source_start, candidate.source_end)
+
+
+def compute_haplotype_sketch(candidate, reference, q = QGRAM_LENGTH):
+    """Return the sketch of the alternative haplotype of an insertion or interspersed duplication.
+    The q-gram profile of the haplotype (reference with the inserted sequence) differs from the profile of the
+    reference only by the q-grams around the inserted sequence that are added and the q-grams across the insertion
+    point that are removed. The sketch is this difference, binned by hash. It does not depend on the flanking
+    region that compute_distance uses for a pair, so the difference of two sketches is the binned difference
+    of the q-gram profiles of both haplotypes."""
+    contig = candidate.dest_contig
+    position = candidate.dest_start
+    start = max(0, position - (q - 1))
+    end = min(reference.get_reference_length(contig), position + (q - 1))
+    left, right = reference.fetch(contig, start, position), reference.fetch(contig, position, end)
+    return get_qgram_profile(left + get_inserted_sequence(candidate, reference) + right, q) - get_qgram_profile(left + right, q)
+
+
+def sketch_lower_bound(sketch1, sketch2, q = QGRAM_LENGTH):
+    """Return a lower bound of the edit distance between two haplotypes from their sketches.
+    An edit operation changes the q-gram profile by at most 2q (q-gram lemma) and merging q-grams into bins
+    can only decrease the difference between profiles."""
+    difference = int(np.abs(sketch1 - sketch2).sum())
+    return (difference + 2 * q - 1) // (2 * q)
@@ -0,0 +1,176 @@
+import os
+import pickle
+import shutil
+import tempfile
+import logging
+
+from heapq import merge
+
+
+def parse_memory_size(value):
+    """Parse a memory size such as 500M or 4G into bytes"""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    value = value.strip().upper()
+    if value[-1:] == "B":
+        value = value[:-1]
+    if value[-1:] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def estimate_candidate_size(candidate):
+    """Rough estimate of the memory (in bytes) taken up by an SV candidate, its attributes and its supporting reads"""
+    return 1000 + 100 * len(candidate.reads) + len(getattr(candidate, "sequence", "")) // 4
+
+
+def estimate_vcf_entry_size(entry):
+    """Rough estimate of the memory (in bytes) taken up by an entry (sort key, VcfRecord, svtype) of the output"""
+    record = entry[1]
+    return 1000 + len(record.ref) + len(record.alt) + sum(len(str(value)) for key, value in record.info)
+
+
+def new_candidate_list(max_memory, directory = None):
+    """Return an empty list for SV candidates or, if a memory budget (in bytes) is given, a SpillingCandidateList"""
+    if max_memory is None:
+        return []
+    return SpillingCandidateList(max_memory, directory)
+
+
+class SpillingSorter:
+    """Sorts items by a key. Items are kept in memory until flush() is called or their estimated size exceeds max_memory.
+    The buffered items are then sorted and written as a run of pickled batches to a temporary directory.
+    Iterating over the sorter merges all runs and the in-memory buffer. Items with equal keys keep the order in which they were added."""
+    def __init__(self, key, estimate_size, max_memory = None, directory = None, batch_size = 1000):
+        self.key = key
+        self.estimate_size = estimate_size
+        self.max_memory = max_memory
+        self.directory = directory
+        self.batch_size = batch_size
+        self.temp_dir = None
+        self.runs = []
+        self.buffer = []
+        self.buffer_size = 0
+        self.length = 0
+
+
+    def add(self, item):
+        self.buffer.append(item)
+        self.buffer_size += self.estimate_size(item)
+        self.length += 1
+        if self.max_memory is not None and self.buffer_size > self.max_memory:
+            self.flush()
+
+
+    def flush(self):
+        """Write the buffered items as a sorted run to disk"""
+        if len(self.buffer) == 0:
+            return
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.mkdtemp(prefix="svim_spill_", dir=self.directory)
+        self.buffer.sort(key=self.key)
+        run_path = os.path.join(self.temp_dir, "run{0}.pkl".format(len(self.runs)))
+        with open(run_path, "wb") as run_file:
+            for batch_start in range(0, len(self.buffer), self.batch_size):
+                pickle.dump(self.buffer[batch_start:batch_start + self.batch_size], run_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.runs.append(run_path)
+        self.buffer = []
+        self.buffer_size = 0
+
+
+    def read_run(self, run_path):
+        with open(run_path, "rb") as run_file:
+            while True:
+                try:
+                    batch = pickle.load(run_file)
+                except EOFError:
+                    break
+                yield from batch
+
+
+    def __iter__(self):
+        self.buffer.sort(key=self.key)
+        if len(self.runs) == 0:
+            return iter(self.buffer)
+        return merge(*[self.read_run(run_path) for run_path in self.runs], self.buffer, key=self.key)
+
+
+    def __len__(self):
+        return self.length
+
+
+    def close(self):
+        self.buffer = []
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
+        self.runs = []
+
+
+class SpillingCandidateList:
+    """Container for SV candidates that stays within a memory budget by spilling sorted runs to disk.
+    Each SV type is kept in its own SpillingSorter ordered by candidate key. Candidates are stored together with
+    their insertion order (optionally prefixed by a position) so that the order of candidates with equal keys is
+    the same as when a list of candidates is sorted by key."""
+    def __init__(self, max_memory, directory = None):
+        self.max_memory = max_memory
+        self.directory = directory
+        self.sorters = dict()
+        self.size = 0
+        self.counter = 0
+
+
+    def extend(self, candidates, position = ()):
+        for candidate in candidates:
+            if candidate.type not in self.sorters:
+                self.sorters[candidate.type] = SpillingSorter(key=lambda entry: (entry[1].get_key(), entry[0]),
+                                                              estimate_size=lambda entry: estimate_candidate_size(entry[1]),
+                                                              directory=self.directory)
+            entry = (position + (self.counter, ), candidate)
+            self.counter += 1
+            self.sorters[candidate.type].add(entry)
+            self.size += estimate_candidate_size(candidate)
+        if self.size > self.max_memory:
+            self.flush()
+
+
+    def append(self, candidate):
+        self.extend([candidate])
+
+
+    def flush(self):
+        """Spill the buffered candidates of all SV types to disk"""
+        if self.size > 0:
+            logging.info("Writing {0} MB of SV candidates to disk..".format(self.size // (1024 * 1024)))
+        for sorter in self.sorters.values():
+            sorter.flush()
+        self.size = 0
+
+
+    def iter_type_with_order(self, sv_type):
+        """Iterate over (order, candidate) of the given SV type in order of their keys"""
+        if sv_type in self.sorters:
+            yield from self.sorters[sv_type]
+
+
+    def iter_type(self, sv_type):
+        for order, candidate in self.iter_type_with_order(sv_type):
+            yield candidate
+
+
+    def count_type(self, sv_type):
+        return len(self.sorters[sv_type]) if sv_type in self.sorters else 0
+
+
+    def __iter__(self):
+        """Iterate over all candidates in order of their keys"""
+        for sv_type in sorted(self.sorters.keys()):
+            yield from self.iter_type(sv_type)
+
+
+    def __len__(self):
+        return sum(len(sorter) for sorter in self.sorters.values())
+
+
+    def close(self):
+        for sorter in self.sorters.values():
+            sorter.close()
@@ -0,0 +1,207 @@
+import os
+import json
+import mmap
+
+import numpy as np
+
+from svim_asm.SVIM_sequence import EncodedSequence
+from svim_asm.SVCandidate import QueryNameTable, CandidateDeletion, CandidateInversion, CandidateInsertion, CandidateDuplicationTandem, CandidateDuplicationInterspersed, CandidateBreakend
+
+
+#A candidate store is a directory with one row per candidate in a NumPy structured array (candidates.npy),
+#the offsets of all read names (read_offsets.npy), the concatenated read names (reads.bin) and insertion sequences
+#(sequences.bin) and a small JSON file with the pools of contig names and genotypes (meta.json).
+STORE_VERSION = 1
+SV_TYPES = ["DEL", "INV", "INS", "DUP_TAN", "DUP_INT", "BND"]
+CANDIDATE_CLASSES = {"DEL": CandidateDeletion, "INV": CandidateInversion, "INS": CandidateInsertion,
+                     "DUP_TAN": CandidateDuplicationTandem, "DUP_INT": CandidateDuplicationInterspersed, "BND": CandidateBreakend}
+DIRECTIONS = ["fwd", "rev"]
+#Flags: complete inversion, fully covered tandem duplication, cut-and-paste interspersed duplication
+FLAG_COMPLETE, FLAG_FULLY_COVERED, FLAG_CUTPASTE = 1, 2, 4
+
+CANDIDATE_DTYPE = np.dtype([("type", "u1"),
+                            ("flags", "u1"),
+                            ("source_direction", "u1"),
+                            ("dest_direction", "u1"),
+                            ("genotype", "i4"),
+                            ("source_contig", "i4"),
+                            ("dest_contig", "i4"),
+                            ("copies", "i4"),
+                            ("source_start", "i8"),
+                            ("source_end", "i8"),
+                            ("dest_start", "i8"),
+                            ("dest_end", "i8"),
+                            ("reads_start", "i8"),
+                            ("reads_count", "i8"),
+                            ("sequence_start", "i8"),
+                            ("sequence_end", "i8")])
+
+
+class StringPool:
+    """Assigns consecutive integer IDs to strings"""
+    def __init__(self):
+        self.ids = dict()
+        self.strings = []
+
+
+    def get_id(self, string):
+        try:
+            return self.ids[string]
+        except KeyError:
+            self.ids[string] = len(self.strings)
+            self.strings.append(string)
+            return self.ids[string]
+
+
+def save_candidates(candidates, path, query_names = True):
+    """Save the SV candidates to a candidate store at the given path (a directory that is created if needed).
+    query_names is the QueryNameTable of the run if the candidates store query IDs, True if they store the names directly
+    or False to omit the supporting reads. Returns the number of saved candidates."""
+    os.makedirs(path, exist_ok = True)
+    contigs = StringPool()
+    genotypes = StringPool()
+    rows = []
+    read_offsets = [0]
+    with open(os.path.join(path, "reads.bin"), "wb") as reads_file, open(os.path.join(path, "sequences.bin"), "wb") as sequences_file:
+        sequence_offset = 0
+        for candidate in candidates:
+            source_contig, source_start, source_end = -1, 0, 0
+            dest_contig, dest_start, dest_end = -1, 0, 0
+            source_direction, dest_direction, copies, flags = 0, 0, 0, 0
+            sequence_start = sequence_end = sequence_offset
+            if candidate.type in ("DEL", "INV", "DUP_TAN", "DUP_INT"):
+                source_contig, source_start, source_end = contigs.get_id(candidate.source_contig), candidate.source_start, candidate.source_end
+            if candidate.type in ("INS", "DUP_INT"):
+                dest_contig, dest_start, dest_end = contigs.get_id(candidate.dest_contig), candidate.dest_start, candidate.dest_end
+            if candidate.type == "BND":
+                source_contig, source_start = contigs.get_id(candidate.source_contig), candidate.source_start
+                dest_contig, dest_start = contigs.get_id(candidate.dest_contig), candidate.dest_start
+                source_direction, dest_direction = DIRECTIONS.index(candidate.source_direction), DIRECTIONS.index(candidate.dest_direction)
+            if candidate.type == "INV" and candidate.complete:
+                flags |= FLAG_COMPLETE
+            if candidate.type == "DUP_TAN":
+                copies = candidate.copies
+                if candidate.fully_covered:
+                    flags |= FLAG_FULLY_COVERED
+            if candidate.type == "DUP_INT" and candidate.cutpaste:
+                flags |= FLAG_CUTPASTE
+            if candidate.type == "INS":
+                sequence = candidate.sequence.decode().encode()
+                sequences_file.write(sequence)
+                sequence_offset += len(sequence)
+                sequence_end = sequence_offset
+            if query_names is False:
+                reads = []
+            else:
+                reads = candidate.get_read_names(query_names)
+            reads_start = len(read_offsets) - 1
+            for read in reads:
+                read = read.encode()
+                reads_file.write(read)
+                read_offsets.append(read_offsets[-1] + len(read))
+            rows.append((SV_TYPES.index(candidate.type), flags, source_direction, dest_direction, genotypes.get_id(candidate.genotype),
+                         source_contig, dest_contig, copies, source_start, source_end, dest_start, dest_end,
+                         reads_start, len(reads), sequence_start, sequence_end))
+    np.save(os.path.join(path, "candidates.npy"), np.array(rows, dtype = CANDIDATE_DTYPE))
+    np.save(os.path.join(path, "read_offsets.npy"), np.array(read_offsets, dtype = "i8"))
+    with open(os.path.join(path, "meta.json"), "w") as meta_file:
+        json.dump({"version": STORE_VERSION, "contigs": contigs.strings, "genotypes": genotypes.strings}, meta_file)
+    return len(rows)
+
+
+def map_file(file_path):
+    """Memory-map a file for reading. Empty files cannot be mapped and are returned as empty bytes."""
+    if os.path.getsize(file_path) == 0:
+        return b""
+    with open(file_path, "rb") as input_file:
+        return mmap.mmap(input_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+
+class CandidateStore:
+    """Read-only view of a candidate store written by save_candidates. All files are memory-mapped so that
+    loading is independent of the number of candidates. The columns can be analyzed directly with NumPy
+    (e.g. store.array["source_start"]) and candidate objects are only built when they are accessed.
+    The supporting reads of the candidates are either the query names (query_names = True), IDs in the
+    given QueryNameTable or, if query_names is False, not loaded at all."""
+    def __init__(self, path, query_names = True):
+        self.query_names = query_names
+        with open(os.path.join(path, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+        if meta["version"] != STORE_VERSION:
+            raise ValueError("Unsupported candidate store version {0} in {1}".format(meta["version"], path))
+        self.contigs = meta["contigs"]
+        self.genotypes = meta["genotypes"]
+        self.array = np.load(os.path.join(path, "candidates.npy"), mmap_mode = "r")
+        self.read_offsets = np.load(os.path.join(path, "read_offsets.npy"), mmap_mode = "r")
+        self.reads = map_file(os.path.join(path, "reads.bin"))
+        self.sequences = map_file(os.path.join(path, "sequences.bin"))
+
+
+    def __len__(self):
+        return len(self.array)
+
+
+    def __getitem__(self, index):
+        return self.build_candidate(self.array[index].tolist())
+
+
+    def __iter__(self):
+        """Iterate over the candidates in the order in which they were saved"""
+        for chunk_start in range(0, len(self.array), 10000):
+            for row in self.array[chunk_start:chunk_start + 10000].tolist():
+                yield self.build_candidate(row)
+
+
+    def get_types(self):
+        """Return the SV type of every candidate as an array of strings"""
+        return np.array(SV_TYPES)[self.array["type"]]
+
+
+    def build_candidate(self, row):
+        """Build the candidate object for a row of the structured array. The coordinates were already checked
+        against the contig lengths when the candidate was created and are therefore set directly."""
+        sv_type_index, flags, source_direction, dest_direction, genotype, source_contig, dest_contig, copies, \
+            source_start, source_end, dest_start, dest_end, reads_start, reads_count, sequence_start, sequence_end = row
+        sv_type = SV_TYPES[sv_type_index]
+        candidate = object.__new__(CANDIDATE_CLASSES[sv_type])
+        candidate.type = sv_type
+        candidate.genotype = self.genotypes[genotype]
+        if self.query_names is False:
+            candidate.reads = ()
+        else:
+            offsets = self.read_offsets[reads_start:reads_start + reads_count + 1].tolist()
+            candidate.reads = [self.reads[offsets[i]:offsets[i + 1]].decode() for i in range(reads_count)]
+            if isinstance(self.query_names, QueryNameTable):
+                candidate.reads = tuple(self.query_names.get_id(name) for name in candidate.reads)
+        if sv_type in ("DEL", "INV", "DUP_TAN", "DUP_INT", "BND"):
+            candidate.source_contig, candidate.source_start = self.contigs[source_contig], source_start
+        if sv_type in ("DEL", "INV", "DUP_TAN", "DUP_INT"):
+            candidate.source_end = source_end
+        if sv_type in ("INS", "DUP_INT"):
+            candidate.dest_contig, candidate.dest_start, candidate.dest_end = self.contigs[dest_contig], dest_start, dest_end
+        if sv_type == "INS":
+            candidate.sequence = EncodedSequence(self.sequences[sequence_start:sequence_end].decode())
+        elif sv_type == "INV":
+            candidate.complete = bool(flags & FLAG_COMPLETE)
+        elif sv_type == "DUP_TAN":
+            candidate.copies = copies
+            candidate.fully_covered = bool(flags & FLAG_FULLY_COVERED)
+        elif sv_type == "DUP_INT":
+            candidate.cutpaste = bool(flags & FLAG_CUTPASTE)
+        elif sv_type == "BND":
+            candidate.source_direction, candidate.dest_direction = DIRECTIONS[source_direction], DIRECTIONS[dest_direction]
+            candidate.dest_contig, candidate.dest_start = self.contigs[dest_contig], dest_start
+        return candidate
+
+
+    def close(self):
+        for pool in (self.reads, self.sequences):
+            if isinstance(pool, mmap.mmap):
+                pool.close()
+        self.array = None
+        self.read_offsets = None
+
+
+def load_candidates(path, query_names = True):
+    """Open the candidate store at the given path"""
+    return CandidateStore(path, query_names)
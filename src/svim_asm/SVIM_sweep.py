@@ -0,0 +1,166 @@
+import os
+import json
+import logging
+import argparse
+
+from svim_asm.SVIM_coverage import CoverageRecorder, load_coverage
+from svim_asm.SVIM_linkage import get_linkage_directory, sweep_candidates
+from svim_asm.SVIM_pipeline import collect_candidates_multi, open_reference_or_log, pair_and_output
+from svim_asm.SVIM_shard import ContigTable
+from svim_asm.SVIM_spill import SpillingCandidateList
+from svim_asm.SVIM_store import load_candidates
+from svim_asm.SVCandidate import QueryNameTable, get_candidate_types
+
+
+#COLLECT options that can be varied by the parameter sets of parameter-sweep
+SWEEP_PARAMETERS = ["min_sv_size", "max_sv_size", "query_gap_tolerance", "query_overlap_tolerance", "reference_gap_tolerance", "reference_overlap_tolerance"]
+
+
+def count_genotypes(candidates):
+    """Return the number of candidates per (SV type, genotype)"""
+    counts = dict()
+    for candidate in candidates:
+        counts[(candidate.type, candidate.genotype)] = counts.get((candidate.type, candidate.genotype), 0) + 1
+    return counts
+
+
+def load_coverage_files(directory, num_haplotypes):
+    return [load_coverage([os.path.join(directory, "coverage_hap{0}.npz".format(haplotype))]) for haplotype in range(1, num_haplotypes + 1)]
+
+
+def run_sweep(options, version):
+    """Write the paired SV candidates for each of the given edit distance thresholds from the linkage trees
+    saved by a previous run with --save_linkage. Returns True on success."""
+    logging.info("****************** STEP 1: SWEEP ******************")
+    directory = get_linkage_directory(options.working_dir)
+    if not os.path.exists(os.path.join(directory, "linkage.json")):
+        logging.error("No linkage trees found in {0}. Run diploid, polyploid or gather with --save_linkage first. Exiting..".format(directory))
+        return False
+    with open(os.path.join(directory, "linkage.json")) as meta_file:
+        meta = json.load(meta_file)
+    larger_thresholds = [threshold for threshold in options.thresholds if threshold > meta["max_edit_distance"]]
+    if len(larger_thresholds) > 0:
+        logging.error("The linkage trees were built with --max_edit_distance {0} and cannot be cut at larger thresholds ({1}). Exiting..".format(
+                      meta["max_edit_distance"], ", ".join(str(threshold) for threshold in larger_thresholds)))
+        return False
+
+    options.query_name_table = QueryNameTable() if options.query_names else None
+    store = load_candidates(os.path.join(directory, "candidates.svim"), options.query_name_table if options.query_names else False)
+    contigs = ContigTable(meta["contigs"], meta["lengths"])
+    if meta["uncovered_haplotypes"] != "ignore":
+        coverages = load_coverage_files(directory, meta["num_haplotypes"])
+    else:
+        coverages = None
+    reference = open_reference_or_log(options.genome)
+    if reference is None:
+        return False
+
+    sweep_directory = os.path.join(options.working_dir, "sweep")
+    summary = []
+    for threshold in options.thresholds:
+        logging.info("Cutting linkage trees at edit distance {0}..".format(threshold))
+        candidates = sweep_candidates(directory, store, threshold, meta["num_haplotypes"], contigs, coverages, meta["uncovered_haplotypes"] == "drop")
+        for (sv_type, genotype), count in sorted(count_genotypes(candidates).items()):
+            summary.append((threshold, sv_type, genotype, count))
+        options.working_dir = os.path.join(sweep_directory, "max_edit_distance_{0}".format(threshold))
+        os.makedirs(options.working_dir, exist_ok = True)
+        pair_and_output([candidates], False, contigs.references, contigs.lengths, contigs, reference, False, options, version)
+    store.close()
+    reference.close()
+
+    with open(os.path.join(sweep_directory, "summary.tsv"), "w") as summary_file:
+        print("max_edit_distance\tsvtype\tgenotype\tcount", file=summary_file)
+        for row in summary:
+            print("\t".join(str(value) for value in row), file=summary_file)
+    logging.info("Summary written to {0}".format(os.path.join(sweep_directory, "summary.tsv")))
+    return True
+
+
+def read_parameter_sets(path):
+    """Read the parameter sets of parameter-sweep and return a list of (name, dict of parameter values).
+    The first line names the columns: name followed by one or more of SWEEP_PARAMETERS, separated by tabs.
+    Each further line contains the name of a parameter set followed by the values of these parameters."""
+    parameter_sets = []
+    names = set()
+    header = None
+    with open(path) as parameter_file:
+        for line_number, line in enumerate(parameter_file, 1):
+            if line.strip() == "" or line.startswith("#"):
+                continue
+            fields = [field.strip() for field in line.rstrip("\n").split("\t")]
+            if header is None:
+                if fields[0] != "name" or len(fields) < 2:
+                    raise ValueError("The first line of the parameter sets needs to contain the column name followed by at least one parameter.")
+                unknown_parameters = [field for field in fields[1:] if field not in SWEEP_PARAMETERS]
+                if len(unknown_parameters) > 0:
+                    raise ValueError("Unknown parameters in line {0}: {1}. Supported are {2}.".format(line_number, ", ".join(unknown_parameters), ", ".join(SWEEP_PARAMETERS)))
+                header = fields
+                continue
+            if len(fields) != len(header):
+                raise ValueError("Line {0} of the parameter sets needs to contain {1} fields.".format(line_number, len(header)))
+            name = fields[0]
+            if name in names:
+                raise ValueError("Parameter set {0} is listed more than once (line {1}).".format(name, line_number))
+            names.add(name)
+            try:
+                parameter_sets.append((name, {parameter: int(value) for parameter, value in zip(header[1:], fields[1:])}))
+            except ValueError:
+                raise ValueError("The parameters in line {0} need to be integers.".format(line_number))
+    if len(parameter_sets) == 0:
+        raise ValueError("No parameter sets found in {0}.".format(path))
+    return parameter_sets
+
+
+def get_parameter_set_options(options, name, parameters):
+    """Derive the options of one parameter set from the options of parameter-sweep"""
+    parameter_set_options = argparse.Namespace(**vars(options))
+    for parameter, value in parameters.items():
+        setattr(parameter_set_options, parameter, value)
+    parameter_set_options.working_dir = os.path.join(options.working_dir, name)
+    return parameter_set_options
+
+
+def run_parameter_sweep(options, version):
+    """Run COLLECT once per alignment file for all parameter sets and write the SV candidates of each
+    parameter set to its own subdirectory. Returns True on success."""
+    try:
+        parameter_sets = read_parameter_sets(options.parameter_sets)
+    except (ValueError, IOError) as e:
+        logging.error("The parameter sets cannot be read ({0}). Exiting..".format(e))
+        return False
+    logging.info("Found {0} parameter sets.".format(len(parameter_sets)))
+
+    logging.info("****************** STEP 1: COLLECT ******************")
+    options.query_name_table = QueryNameTable() if options.query_names else None
+    options.candidate_types = get_candidate_types(options)
+    parameter_set_options = [get_parameter_set_options(options, name, parameters) for name, parameters in parameter_sets]
+    aln_files = []
+    #Lists of SV candidates per parameter set and haplotype
+    sv_candidate_lists = [[] for parameter_set in parameter_sets]
+    #The covered reference intervals do not depend on the parameter sets and are recorded once per haplotype
+    coverages = [] if len(options.bam_files) > 1 and options.uncovered_haplotypes != "ignore" else None
+    for index, bam_file in enumerate(options.bam_files, 1):
+        logging.info("INPUT{0}: {1}".format(index, os.path.abspath(bam_file)))
+        if coverages is not None:
+            options.coverage_recorder = CoverageRecorder()
+        result = collect_candidates_multi(bam_file, "input BAM file {0}".format(index), options, parameter_set_options)
+        if result is None:
+            return False
+        aln_files.append(result[0])
+        if coverages is not None:
+            coverages.append(options.coverage_recorder.finish())
+            options.coverage_recorder = None
+        for parameter_set_candidates, sv_candidates in zip(sv_candidate_lists, result[1]):
+            parameter_set_candidates.append(sv_candidates)
+            if isinstance(sv_candidates, SpillingCandidateList):
+                sv_candidates.flush()
+
+    reference = open_reference_or_log(options.genome)
+    if reference is None:
+        return False
+    for (name, parameters), set_options, set_candidate_lists in zip(parameter_sets, parameter_set_options, sv_candidate_lists):
+        logging.info("PARAMETER SET: {0} ({1})".format(name, ", ".join("{0}={1}".format(parameter, value) for parameter, value in parameters.items())))
+        os.makedirs(set_options.working_dir, exist_ok = True)
+        pair_and_output(set_candidate_lists, len(set_candidate_lists) > 1, aln_files[0].references, aln_files[0].lengths, aln_files[0], reference, False, set_options, version, coverages)
+    reference.close()
+    return True
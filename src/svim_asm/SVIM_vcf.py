@@ -0,0 +1,111 @@
+import os
+import time
+
+from pysam import tabix_index, bcftools
+
+from svim_asm.SVCandidate import format_vcf_record
+from svim_asm.SVIM_bgzf import BgzfWriter
+
+
+def get_vcf_header_lines(version, contig_names, contig_lengths, types_to_output, options):
+    """Return the meta-information lines (##) of the output VCF"""
+    header_lines = []
+    header_lines.append("##fileformat=VCFv4.2")
+    header_lines.append("##fileDate={0}".format(time.strftime("%Y-%m-%d|%I:%M:%S%p|%Z|%z")))
+    header_lines.append("##source=SVIM-asm-v{0}".format(version))
+    for contig_name, contig_length in zip(contig_names, contig_lengths):
+        header_lines.append("##contig=<ID={0},length={1}>".format(contig_name, contig_length))
+    if "DEL" in types_to_output:
+        header_lines.append("##ALT=<ID=DEL,Description=\"Deletion\">")
+    if "INV" in types_to_output:
+        header_lines.append("##ALT=<ID=INV,Description=\"Inversion\">")
+    if (not options.tandem_duplications_as_insertions and "DUP:TANDEM" in types_to_output) or \
+       (not options.interspersed_duplications_as_insertions and "DUP:INT" in types_to_output):
+        header_lines.append("##ALT=<ID=DUP,Description=\"Duplication\">")
+    if not options.tandem_duplications_as_insertions and "DUP:TANDEM" in types_to_output:
+        header_lines.append("##ALT=<ID=DUP:TANDEM,Description=\"Tandem Duplication\">")
+    if not options.interspersed_duplications_as_insertions and "DUP:INT" in types_to_output:
+        header_lines.append("##ALT=<ID=DUP:INT,Description=\"Interspersed Duplication\">")
+    if "INS" in types_to_output:
+        header_lines.append("##ALT=<ID=INS,Description=\"Insertion\">")
+    if "BND" in types_to_output:
+        header_lines.append("##ALT=<ID=BND,Description=\"Breakend\">")
+    header_lines.append("##INFO=<ID=SVTYPE,Number=1,Type=String,Description=\"Type of structural variant\">")
+    header_lines.append("##INFO=<ID=CUTPASTE,Number=0,Type=Flag,Description=\"Genomic origin of interspersed duplication seems to be deleted\">")
+    header_lines.append("##INFO=<ID=END,Number=1,Type=Integer,Description=\"End position of the variant described in this record\">")
+    header_lines.append("##INFO=<ID=SVLEN,Number=1,Type=Integer,Description=\"Difference in length between REF and ALT alleles\">")
+    if options.query_names:
+        header_lines.append("##INFO=<ID=READS,Number=.,Type=String,Description=\"Names of all supporting reads\">")
+    header_lines.append("##FILTER=<ID=not_fully_covered,Description=\"Tandem duplication is not fully covered by a contig\">")
+    header_lines.append("##FILTER=<ID=incomplete_inversion,Description=\"Only one inversion breakpoint is supported\">")
+    header_lines.append("##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">")
+    if not options.tandem_duplications_as_insertions and "DUP:TANDEM" in types_to_output:
+        header_lines.append("##FORMAT=<ID=CN,Number=1,Type=Integer,Description=\"Copy number of tandem duplication (e.g. 2 for one additional copy)\">")
+    return header_lines
+
+
+class TextVcfWriter:
+    """Writes VCF records as text lines, either uncompressed or BGZF-compressed and tabix-indexed.
+    Instead of a path, an open text stream can be given that is written to but not closed."""
+    def __init__(self, path, header_lines, sample, compressed = False, threads = 1, index_format = "tbi"):
+        self.path = path
+        self.compressed = compressed
+        self.index_format = index_format
+        self.own_output = not hasattr(path, "write")
+        if not self.own_output:
+            self.output = path
+        elif compressed:
+            self.output = BgzfWriter(path, threads = threads)
+        else:
+            self.output = open(path, 'w')
+        for line in header_lines:
+            print(line, file=self.output)
+        print("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" + sample, file=self.output)
+
+
+    def write(self, record, variant_id):
+        print(format_vcf_record(record, variant_id), file=self.output)
+
+
+    def close(self):
+        if not self.own_output:
+            self.output.flush()
+            return
+        self.output.close()
+        # Index compressed output so that it can be queried by region right away
+        if self.compressed:
+            tabix_index(self.path, preset="vcf", force=True, csi=(self.index_format == "csi"))
+
+
+class HtslibVcfWriter:
+    """Writes VCF records through htslib, e.g. as binary BCF with a CSI index.
+    The records are written as text to a temporary VCF next to the output which bcftools converts on close.
+    Records built with pysam would get their INFO/END recomputed from SVLEN and their INFO fields reordered,
+    whereas the text parser of htslib stores them exactly as in the text output."""
+    def __init__(self, path, header_lines, sample, mode = "wb", threads = 1):
+        self.path = path
+        self.output_type = {"w": "v", "wz": "z", "wb": "b", "wbu": "u"}[mode]
+        self.threads = threads
+        self.text_path = path + ".tmp.vcf"
+        self.text_writer = TextVcfWriter(self.text_path, header_lines, sample)
+
+
+    def write(self, record, variant_id):
+        self.text_writer.write(record, variant_id)
+
+
+    def close(self):
+        self.text_writer.close()
+        bcftools.view("-O", self.output_type, "--threads", str(self.threads), "-o", self.path, self.text_path, catch_stdout = False)
+        os.remove(self.text_path)
+        bcftools.index(self.path)
+
+
+def open_vcf_writer(header_lines, options):
+    """Open the output file (variants.vcf, variants.vcf.gz or variants.bcf) in the working directory"""
+    if options.output_format == "bcf":
+        return HtslibVcfWriter(options.working_dir + '/variants.bcf', header_lines, options.sample, mode = "wb", threads = options.output_threads)
+    elif options.output_format == "vcf.gz":
+        return TextVcfWriter(options.working_dir + '/variants.vcf.gz', header_lines, options.sample, compressed = True, threads = options.output_threads, index_format = options.index_format)
+    else:
+        return TextVcfWriter(options.working_dir + '/variants.vcf', header_lines, options.sample)
@@ -3,6 +3,7 @@ import pysam
 import tempfile
 
 from svim_asm.SVIM_COLLECT import bam_iterator, analyze_alignment_file_querysorted, retrieve_other_alignments
+from svim_asm.SVIM_intra import analyze_alignment_indel
 from svim_asm.SVIM_input_parsing import parse_arguments
 from random import choice, triangular, uniform
 
@@ -267,10 +268,14 @@ class TestCollect(unittest.TestCase):
         self.assertEqual(num_primary_supplementary, 10)
 
     def test_analyze_alignment_file_querysorted(self):
-        arguments = ['alignment', 'myworkdir', 'mybamfile', 'mygenome']
+        arguments = ['haploid', 'myworkdir', 'mybamfile', 'mygenome']
         options = parse_arguments('1.2.0', arguments)
-        signatures = analyze_alignment_file_querysorted(self.alignment_file, options)
-        self.assertEqual(len([sig for sig in signatures if sig.signature == "cigar"]), 0)
+        candidates = analyze_alignment_file_querysorted(self.alignment_file, options)
+        self.assertTrue(all(candidate.type in ["DEL", "INV", "INS", "DUP_TAN", "DUP_INT", "BND"] for candidate in candidates))
+        #The simulated CIGAR strings contain no indels larger than 10bp
+        alignment_file = pysam.AlignmentFile(self.bam_file.name, "rb")
+        cigar_candidates = [candidate for alignment in alignment_file.fetch(until_eof=True) for candidate in analyze_alignment_indel(alignment, alignment_file, (), options)]
+        self.assertEqual(len(cigar_candidates), 0)
     
     def test_retrieve_supplementary_alignment_from_primary(self):
         alignment_it = self.alignment_file.fetch(until_eof=True)
@@ -286,7 +291,8 @@ class TestCollect(unittest.TestCase):
             self.assertEqual(retrieved_supplementary_alns[0].reference_end, supplementary.reference_end)
             self.assertEqual(retrieved_supplementary_alns[0].flag, supplementary.flag)
             self.assertEqual(retrieved_supplementary_alns[0].mapping_quality, supplementary.mapping_quality)
-            self.assertEqual(retrieved_supplementary_alns[0].query_sequence[retrieved_supplementary_alns[0].query_alignment_start:retrieved_supplementary_alns[0].query_alignment_end], supplementary.query_sequence)
+            #The sequence is not reconstructed from the SA tag
+            self.assertEqual(retrieved_supplementary_alns[0].query_sequence, None)
             self.assertEqual(retrieved_supplementary_alns[0].query_name, supplementary.query_name)
 
     def test_retrieve_primary_alignment_from_supplementary(self):
@@ -0,0 +1,107 @@
+import unittest
+import tempfile
+import os
+import io
+import pysam
+
+from random import choice, randint, seed
+
+from svim_asm.SVIM_api import collect, pair, write_vcf, get_options, parse_region, save_candidates, load_candidates
+from svim_asm.SVIM_COLLECT import analyze_alignment_file_coordsorted
+
+class TestApi(unittest.TestCase):
+    def setUp(self):
+        seed(0)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.genome = os.path.join(self.tmpdir.name, "genome.fa")
+        sequences = {contig: "".join(choice("ACGT") for i in range(160000)) for contig in ["chr1", "chr2"]}
+        with open(self.genome, "w") as fasta_file:
+            for contig, sequence in sequences.items():
+                print(">" + contig, file=fasta_file)
+                print(sequence, file=fasta_file)
+        pysam.faidx(self.genome)
+        header = pysam.AlignmentHeader.from_dict({"HD": {"VN": "1.6", "SO": "coordinate"},
+                                                  "SQ": [{"SN": "chr1", "LN": 160000}, {"SN": "chr2", "LN": 160000}]})
+        self.bam_paths = []
+        for haplotype in range(2):
+            records = []
+            for index in range(20):
+                #Alignment with a deletion
+                record = pysam.AlignedSegment(header)
+                record.query_name = "hap{0}_query{1}".format(haplotype, index)
+                record.reference_id = index % 2
+                record.reference_start = (index // 2) * 15000 + haplotype
+                record.query_sequence = sequences[header.get_reference_name(index % 2)][record.reference_start:record.reference_start + 1000] + \
+                                        sequences[header.get_reference_name(index % 2)][record.reference_start + 1100:record.reference_start + 2000]
+                record.flag = 0
+                record.mapping_quality = 60
+                record.cigarstring = "1000M100D900M"
+                records.append(record)
+            bam_path = os.path.join(self.tmpdir.name, "hap{0}.bam".format(haplotype))
+            with pysam.AlignmentFile(bam_path, "wb", header = header) as bam:
+                for record in sorted(records, key=lambda record: (record.reference_id, record.reference_start)):
+                    bam.write(record)
+            pysam.index(bam_path)
+            self.bam_paths.append(bam_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_options(self):
+        options = get_options(min_sv_size = 100, max_memory = "1K")
+        self.assertEqual(options.min_sv_size, 100)
+        self.assertEqual(options.max_memory, 1024)
+        self.assertEqual(options.min_mapq, get_options().min_mapq)
+        with self.assertRaises(TypeError):
+            get_options(no_such_parameter = 1)
+
+    def test_parse_region(self):
+        self.assertEqual(parse_region("chr1"), ("chr1", None, None))
+        self.assertEqual(parse_region("chr1:1,001-2000"), ("chr1", 1000, 2000))
+        self.assertEqual(parse_region(("chr2", 5, 10)), ("chr2", 5, 10))
+
+    def test_collect(self):
+        with pysam.AlignmentFile(self.bam_paths[0]) as bam:
+            expected = [(cand.type, cand.get_key()) for cand in analyze_alignment_file_coordsorted(bam, get_options())]
+        self.assertEqual(len(expected), 20)
+        self.assertEqual([(cand.type, cand.get_key()) for cand in collect(self.bam_paths[0])], expected)
+        #Adjacent regions do not report candidates twice
+        regions = ["chr1:1-45000", "chr1:45001-160000", ("chr2", 0, 160000)]
+        self.assertEqual([(cand.type, cand.get_key()) for cand in collect(self.bam_paths[0], regions = regions)], expected)
+        self.assertEqual(len(list(collect(self.bam_paths[0], regions = ["chr2"]))), 10)
+
+    def test_pair_and_write(self):
+        paired = list(pair(collect(self.bam_paths[0]), collect(self.bam_paths[1]), reference = self.genome))
+        self.assertEqual(len(paired), 20)
+        self.assertTrue(all(cand.genotype == "1/1" for cand in paired))
+        output = io.StringIO()
+        self.assertEqual(write_vcf(paired, output, reference = self.genome, sample = "mysample"), 20)
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("##fileformat=VCF"))
+        self.assertTrue([line for line in lines if line.startswith("#CHROM")][0].endswith("mysample"))
+        self.assertEqual(len([line for line in lines if not line.startswith("#")]), 20)
+        #Candidates and records spilled to disk are written in the same order
+        spilled_output = io.StringIO()
+        self.assertEqual(write_vcf(iter(paired), spilled_output, reference = self.genome, sample = "mysample", max_memory = "1K"), 20)
+        self.assertEqual([line for line in spilled_output.getvalue().splitlines() if not line.startswith("##fileDate")],
+                         [line for line in lines if not line.startswith("##fileDate")])
+
+    def test_query_names(self):
+        #Candidates carry the query names themselves, so no table is kept between calls
+        candidates = list(collect(self.bam_paths[0], regions = ["chr2"], query_names = True))
+        self.assertEqual([cand.reads for cand in candidates], [("hap0_query{0}".format(index), ) for index in range(1, 20, 2)])
+        self.assertEqual(list(collect(self.bam_paths[1], regions = ["chr2:1-2000"], query_names = True))[0].reads, ("hap1_query1", ))
+        self.assertEqual(list(collect(self.bam_paths[0], regions = ["chr2"]))[0].reads, ())
+        paired = list(pair(candidates, collect(self.bam_paths[1], regions = ["chr2"], query_names = True), reference = self.genome))
+        self.assertEqual(sorted(paired[0].reads), ["hap0_query1", "hap1_query1"])
+        output = io.StringIO()
+        write_vcf(paired, output, reference = self.genome, query_names = True)
+        self.assertIn("READS=hap0_query1,hap1_query1", output.getvalue())
+        store_path = os.path.join(self.tmpdir.name, "paired.svim")
+        save_candidates(paired, store_path)
+        store = load_candidates(store_path, query_names = True)
+        self.assertEqual([sorted(cand.reads) for cand in store], [sorted(cand.reads) for cand in paired])
+        store.close()
+
+if __name__ == '__main__':
+    unittest.main()
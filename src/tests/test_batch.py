@@ -0,0 +1,59 @@
+import unittest
+import tempfile
+import os
+
+from svim_asm.SVIM_input_parsing import parse_arguments
+from svim_asm.SVIM_batch import read_manifest, schedule_samples, get_sample_options
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.bam_files = []
+        for name, size in [("a.bam", 10), ("b1.bam", 30), ("b2.bam", 5), ("c.bam", 20)]:
+            path = os.path.join(self.tmpdir.name, name)
+            with open(path, "wb") as bam_file:
+                bam_file.write(b"x" * size)
+            self.bam_files.append(path)
+        self.manifest = os.path.join(self.tmpdir.name, "manifest.tsv")
+        with open(self.manifest, "w") as manifest_file:
+            print("# sample\tbam files", file=manifest_file)
+            print("A\t{0}".format(self.bam_files[0]), file=manifest_file)
+            print("", file=manifest_file)
+            print("B\t{0}\t{1}".format(self.bam_files[1], self.bam_files[2]), file=manifest_file)
+            print("C\t{0}".format(self.bam_files[3]), file=manifest_file)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_manifest(self):
+        samples = read_manifest(self.manifest)
+        self.assertEqual(samples, [("A", [self.bam_files[0]]), ("B", self.bam_files[1:3]), ("C", [self.bam_files[3]])])
+
+    def test_read_manifest_invalid(self):
+        with open(self.manifest, "a") as manifest_file:
+            print("A\t{0}".format(self.bam_files[0]), file=manifest_file)
+        self.assertRaises(ValueError, read_manifest, self.manifest)
+        with open(self.manifest, "w") as manifest_file:
+            print("D", file=manifest_file)
+        self.assertRaises(ValueError, read_manifest, self.manifest)
+
+    def test_schedule_samples(self):
+        samples = schedule_samples(read_manifest(self.manifest))
+        self.assertEqual([sample for sample, bam_files in samples], ["B", "C", "A"])
+
+    def test_sample_options(self):
+        options = parse_arguments('1.0.1', ['batch', self.tmpdir.name, self.manifest, 'mygenome', '--max_edit_distance', '100'])
+        haploid_options = get_sample_options(options, "A", [self.bam_files[0]])
+        self.assertEqual(haploid_options.sub, 'haploid')
+        self.assertEqual(haploid_options.bam_file, self.bam_files[0])
+        self.assertEqual(haploid_options.sample, "A")
+        self.assertEqual(haploid_options.working_dir, os.path.join(self.tmpdir.name, "A"))
+        diploid_options = get_sample_options(options, "B", self.bam_files[1:3])
+        self.assertEqual(diploid_options.sub, 'diploid')
+        self.assertEqual((diploid_options.bam_file1, diploid_options.bam_file2), tuple(self.bam_files[1:3]))
+        self.assertEqual(diploid_options.max_edit_distance, 100)
+        self.assertEqual(options.sub, 'batch')
+
+if __name__ == '__main__':
+    unittest.main()
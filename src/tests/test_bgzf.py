@@ -0,0 +1,40 @@
+import unittest
+import tempfile
+import gzip
+import os
+import pysam
+
+from random import choice
+
+from svim_asm.SVIM_bgzf import BgzfWriter, BGZF_EOF
+
+class TestBgzfWriter(unittest.TestCase):
+    def setUp(self):
+        self.lines = []
+        for i in range(20000):
+            self.lines.append("chr1\t{0}\t{1}".format(i + 1, "".join(choice("ACGT") for j in range(20))))
+
+    def test_roundtrip(self):
+        for threads in [1, 4]:
+            with tempfile.TemporaryDirectory() as tmpdirname:
+                path = os.path.join(tmpdirname, "test.txt.gz")
+                with BgzfWriter(path, threads = threads) as writer:
+                    for line in self.lines:
+                        print(line, file=writer)
+                with gzip.open(path, "rt") as reader:
+                    self.assertEqual(reader.read().splitlines(), self.lines)
+                with open(path, "rb") as raw:
+                    self.assertEqual(raw.read()[-len(BGZF_EOF):], BGZF_EOF)
+
+    def test_tabix(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, "test.bed.gz")
+            with BgzfWriter(path, threads = 2) as writer:
+                for i, line in enumerate(self.lines):
+                    print("chr1\t{0}\t{1}".format(i, i + 1), file=writer)
+            pysam.tabix_index(path, preset="bed", force=True)
+            with pysam.TabixFile(path) as tabix_file:
+                self.assertEqual(len(list(tabix_file.fetch("chr1", 100, 200))), 100)
+
+if __name__ == '__main__':
+    unittest.main()
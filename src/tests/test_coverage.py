@@ -0,0 +1,74 @@
+import unittest
+import tempfile
+import os
+
+from svim_asm.SVIM_coverage import CoverageRecorder, load_coverage
+from svim_asm.SVIM_COMBINE import get_genotype, pair_candidates_multi
+from svim_asm.SVCandidate import CandidateDeletion, CandidateInsertion
+
+class FakeAlignmentFile:
+    def get_reference_length(self, contig):
+        return 100000
+
+class FakeReference:
+    def fetch(self, contig, start, end):
+        return "A" * (end - start)
+
+    def get_reference_length(self, contig):
+        return 100000
+
+class TestCoverage(unittest.TestCase):
+    def setUp(self):
+        self.recorder = CoverageRecorder()
+        for contig, start, end in [("chr1", 100, 500), ("chr1", 400, 800), ("chr1", 800, 900), ("chr1", 2000, 3000),
+                                   ("chr2", 5000, 6000), ("chr1", 50, 150)]:
+            self.recorder.add(contig, start, end)
+        self.coverage = self.recorder.finish()
+
+    def test_merged_intervals(self):
+        starts, ends = self.coverage.intervals["chr1"]
+        self.assertEqual(list(zip(starts.tolist(), ends.tolist())), [(50, 900), (2000, 3000)])
+
+    def test_queries(self):
+        self.assertTrue(self.coverage.covers("chr1", 50))
+        self.assertTrue(self.coverage.covers("chr1", 899))
+        self.assertFalse(self.coverage.covers("chr1", 900))
+        self.assertFalse(self.coverage.covers("chr1", 49))
+        self.assertTrue(self.coverage.covers("chr2", 5500))
+        self.assertFalse(self.coverage.covers("chr3", 5500))
+        bam = FakeAlignmentFile()
+        self.assertTrue(self.coverage.covers_candidate(CandidateDeletion("chr1", 100, 800, [], bam)))
+        self.assertFalse(self.coverage.covers_candidate(CandidateDeletion("chr1", 100, 1500, [], bam)))
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            self.coverage.save(os.path.join(tmpdirname, "a.npz"))
+            other = CoverageRecorder()
+            other.add("chr1", 900, 1000)
+            other.finish().save(os.path.join(tmpdirname, "b.npz"))
+            loaded = load_coverage([os.path.join(tmpdirname, "a.npz"), os.path.join(tmpdirname, "b.npz")])
+        starts, ends = loaded.intervals["chr1"]
+        self.assertEqual(list(zip(starts.tolist(), ends.tolist())), [(50, 1000), (2000, 3000)])
+        self.assertTrue(loaded.covers("chr2", 5000))
+
+class TestUncoveredHaplotypes(unittest.TestCase):
+    def test_genotype(self):
+        self.assertEqual(get_genotype({2}, 2, {1}), "./1")
+        self.assertEqual(get_genotype({1, 2}, 2, {1}), "1/1")
+
+    def test_pairing(self):
+        bam = FakeAlignmentFile()
+        covered, gap = CoverageRecorder(), CoverageRecorder()
+        covered.add("chr1", 0, 100000)
+        gap.add("chr1", 0, 40000)
+        haplotypes = [[CandidateDeletion("chr1", 10000, 10500, [], bam), CandidateInsertion("chr1", 50000, 50100, [], "C" * 100, bam)], []]
+        coverages = [covered.finish(), gap.finish()]
+        genotypes = [cand.genotype for cand in pair_candidates_multi(haplotypes, FakeReference(), 200, bam)]
+        self.assertEqual(genotypes, ["1/0", "1/0"])
+        genotypes = [cand.genotype for cand in pair_candidates_multi(haplotypes, FakeReference(), 200, bam, coverages = coverages)]
+        self.assertEqual(genotypes, ["1/0", "1/."])
+        genotypes = [cand.genotype for cand in pair_candidates_multi(haplotypes, FakeReference(), 200, bam, coverages = coverages, drop_uncovered = True)]
+        self.assertEqual(genotypes, ["1/0"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,469 @@
+"""Differential tests: every optimized or parallel path of COLLECT, PAIR and OUTPUT has to give the same
+(normalized) candidates or VCF records as the serial reference path on randomized synthetic assemblies."""
+
+import unittest
+import tempfile
+import os
+import pysam
+
+from random import Random
+
+from svim_asm.SVIM_input_parsing import parse_arguments
+from svim_asm.SVIM_intra import analyze_cigar_indel
+from svim_asm.SVIM_COLLECT import analyze_alignment_file_coordsorted, analyze_alignment_file_coordsorted_multi, \
+                                  analyze_alignment_file_querysorted, analyze_regions_coordsorted, analyze_alignment_file_parallel_multi
+from svim_asm.SVIM_COMBINE import pair_candidates, pair_candidates_multi
+from svim_asm.SVIM_linkage import LinkageCache, sweep_candidates
+from svim_asm.SVIM_coverage import CoverageRecorder
+from svim_asm.SVIM_pipeline import run_sample
+from svim_asm.SVIM_reference import open_reference
+from svim_asm.SVIM_serve import RegionCaller
+from svim_asm.SVIM_shard import get_regions, run_collect_shard, run_gather
+from svim_asm.SVIM_spill import SpillingCandidateList
+from svim_asm.SVIM_store import load_candidates
+from svim_asm.SVIM_sweep import get_parameter_set_options, run_parameter_sweep, run_sweep
+from svim_asm.SVCandidate import QueryNameTable, CandidateDeletion, CandidateInsertion, CandidateInversion, \
+                                 CandidateDuplicationTandem, CandidateDuplicationInterspersed, CandidateBreakend
+
+CONTIGS = [("chr1", 90000), ("chr2", 70000), ("chr3", 50000)]
+
+
+def normalize(candidates, read_names = None):
+    """Return the candidates as a sorted list of their attributes, with supporting reads given by name"""
+    rows = []
+    for candidate in candidates:
+        row = [(key, str(value)) for key, value in sorted(vars(candidate).items()) if key != "reads"]
+        row.append(("reads", tuple(sorted(candidate.get_read_names(read_names)))))
+        rows.append(tuple(row))
+    return sorted(rows)
+
+
+def read_vcf_records(path):
+    """Return the lines of a VCF file except for the file date"""
+    with open(path) as vcf_file:
+        return [line for line in vcf_file if not line.startswith("##fileDate")]
+
+
+def random_indel_body(rng, length):
+    """Return CIGAR operations for an aligned segment with indels of sizes around the minimum SV size"""
+    body = [(0, rng.randint(100, 500))]
+    for index in range(rng.randint(1, 8)):
+        operation = rng.choice([1, 1, 2, 2, 7, 8, 6])
+        body.append((operation, rng.choice([1, 5, 19, 20, 21, 39, 40, 41, 120, 800])))
+        body.append((rng.choice([0, 7]), rng.randint(50, 400)))
+    body.append((0, length))
+    return body
+
+
+def segment(contig, ref_start, length, is_reverse = False, body = None):
+    return {"contig": contig, "ref_start": ref_start, "is_reverse": is_reverse, "body": body if body is not None else [(0, length)]}
+
+
+def random_layout(rng):
+    """Return the alignment segments of a random query in query order together with the gaps between them.
+    The layouts cover all branches of analyze_read_segments: indels, deletions, insertions, tandem duplications,
+    inversions, interspersed duplications, translocations and segments with gaps and overlaps around the tolerances."""
+    contig, length = rng.choice(CONTIGS)
+    position = rng.randint(0, length - 1)
+    layout = rng.choice(["indel", "deletion", "insertion", "tandem", "inversion", "interspersed", "translocation", "random"])
+    if layout == "indel":
+        segments = [segment(contig, position, 0, body = random_indel_body(rng, rng.randint(100, 2000)))]
+    elif layout == "deletion":
+        distance = rng.choice([10, 45, 500, 5000, 25000])
+        segments = [segment(contig, position, 3000), segment(contig, position + 3000 + distance, 3000)]
+    elif layout == "insertion":
+        segments = [segment(contig, position, 3000), segment(contig, position + 3000 + rng.randint(-70, 70), 3000)]
+    elif layout == "tandem":
+        duplication = rng.randint(100, 2500)
+        segments = [segment(contig, position + index * (3000 - duplication), 3000) for index in range(rng.randint(2, 4))]
+    elif layout == "inversion":
+        inverted = rng.randint(300, 8000)
+        inversion_start = position + 3000 + rng.randint(-20, 20)
+        segments = [segment(contig, position, 3000), segment(contig, inversion_start, inverted, True),
+                    segment(contig, inversion_start + inverted + rng.randint(-20, 20), 3000)]
+        if rng.random() < 0.3:
+            segments = segments[:2]
+    elif layout == "interspersed":
+        other_contig, other_length = rng.choice(CONTIGS)
+        segments = [segment(contig, position, 3000), segment(other_contig, rng.randint(0, other_length - 1), rng.randint(100, 5000), rng.random() < 0.3),
+                    segment(contig, position + 3000 + rng.randint(-10, 10), 3000)]
+    elif layout == "translocation":
+        other_contig, other_length = rng.choice(CONTIGS)
+        segments = [segment(contig, position, 3000), segment(other_contig, rng.randint(0, other_length - 1), 3000, rng.random() < 0.5)]
+    else:
+        segments = []
+        for index in range(rng.randint(2, 4)):
+            other_contig, other_length = rng.choice(CONTIGS)
+            segments.append(segment(other_contig, rng.randint(0, other_length - 1), rng.randint(200, 4000), rng.random() < 0.5))
+    if layout in ("insertion", "interspersed"):
+        gaps = [rng.choice([50, 200, 2000]) if layout == "insertion" else rng.randint(-20, 20) for index in range(len(segments) - 1)]
+    else:
+        gaps = [rng.choice([-120, -60, -50, -10, 0, 10, 50, 60, 120]) for index in range(len(segments) - 1)]
+    #Reverse the whole query
+    if rng.random() < 0.3:
+        segments = [dict(seg, is_reverse = not seg["is_reverse"]) for seg in reversed(segments)]
+        gaps = list(reversed(gaps))
+    return segments, gaps
+
+
+def get_span(body, operations):
+    return sum(length for operation, length in body if operation in operations)
+
+
+def build_records(rng, header, name, segments, gaps):
+    """Return the primary and supplementary records of a query with the given segments"""
+    contig_lengths = dict(CONTIGS)
+    cursor = rng.randint(0, 100)
+    for index, seg in enumerate(segments):
+        seg["q_start"] = cursor
+        seg["q_end"] = cursor + get_span(seg["body"], (0, 1, 7, 8))
+        seg["ref_end"] = seg["ref_start"] + get_span(seg["body"], (0, 2, 3, 7, 8))
+        if seg["ref_start"] < 0 or seg["ref_end"] > contig_lengths[seg["contig"]]:
+            return []
+        cursor = seg["q_end"] + (gaps[index] if index < len(gaps) else 0)
+        if cursor < 0:
+            return []
+    read_length = max(seg["q_end"] for seg in segments) + rng.randint(0, 100)
+    primary_index = rng.randrange(len(segments))
+    for index, seg in enumerate(segments):
+        if seg["is_reverse"]:
+            seg["clips"] = (read_length - seg["q_end"], seg["q_start"])
+            seg["record_body"] = list(reversed(seg["body"]))
+        else:
+            seg["clips"] = (seg["q_start"], read_length - seg["q_end"])
+            seg["record_body"] = seg["body"]
+        seg["mapq"] = 60 if rng.random() < 0.95 else 10
+    def get_cigar(seg, clip_operation):
+        left, right = seg["clips"]
+        return ([(clip_operation, left)] if left > 0 else []) + seg["record_body"] + ([(clip_operation, right)] if right > 0 else [])
+    def get_cigar_string(cigar):
+        return "".join("{0}{1}".format(length, "MIDNSHP=X"[operation]) for operation, length in cigar)
+
+    records = []
+    for index, seg in enumerate(segments):
+        record = pysam.AlignedSegment(header)
+        record.query_name = name
+        is_primary = index == primary_index
+        record.cigartuples = get_cigar(seg, 4 if is_primary else 5)
+        record.query_sequence = "".join(rng.choice("ACGT") for i in range(read_length if is_primary else seg["q_end"] - seg["q_start"]))
+        record.flag = (0 if is_primary else 2048) + (16 if seg["is_reverse"] else 0)
+        record.reference_id = header.get_tid(seg["contig"])
+        record.reference_start = seg["ref_start"]
+        record.mapping_quality = seg["mapq"]
+        other_segments = [other for other_index, other in enumerate(segments) if other_index != index]
+        if len(other_segments) > 0:
+            record.set_tag("SA", "".join("{0},{1},{2},{3},{4},0;".format(other["contig"], other["ref_start"] + 1, "-" if other["is_reverse"] else "+",
+                                                                          get_cigar_string(get_cigar(other, 4)), other["mapq"]) for other in other_segments))
+        records.append(record)
+    #Secondary alignments are ignored
+    if rng.random() < 0.05:
+        secondary = pysam.AlignedSegment(header)
+        secondary.query_name = name
+        secondary.cigartuples = records[0].cigartuples
+        secondary.query_sequence = records[0].query_sequence
+        secondary.flag = records[0].flag | 256
+        secondary.reference_id = records[0].reference_id
+        secondary.reference_start = records[0].reference_start
+        secondary.mapping_quality = 0
+        records.append(secondary)
+    return records
+
+
+def write_haplotype(rng, directory, name, num_queries):
+    """Write the alignments of one random haplotype as coordinate-sorted and indexed BAM file and as query-grouped BAM file.
+    Returns the paths of both files."""
+    header = pysam.AlignmentHeader.from_dict({"HD": {"VN": "1.6", "SO": "coordinate"},
+                                              "SQ": [{"SN": contig, "LN": length} for contig, length in CONTIGS]})
+    queries = []
+    while len(queries) < num_queries:
+        records = build_records(rng, header, "{0}_query{1}".format(name, len(queries)), *random_layout(rng))
+        if len(records) > 0:
+            queries.append(records)
+    sorted_path = os.path.join(directory, name + ".bam")
+    with pysam.AlignmentFile(sorted_path, "wb", header = header) as bam:
+        for record in sorted([record for records in queries for record in records], key=lambda record: (record.reference_id, record.reference_start)):
+            bam.write(record)
+    pysam.index(sorted_path)
+    grouped_path = os.path.join(directory, name + ".grouped.bam")
+    rng.shuffle(queries)
+    grouped_header = pysam.AlignmentHeader.from_dict({"HD": {"VN": "1.6", "SO": "unsorted"},
+                                                      "SQ": [{"SN": contig, "LN": length} for contig, length in CONTIGS]})
+    with pysam.AlignmentFile(grouped_path, "wb", header = grouped_header) as bam:
+        for records in queries:
+            for record in records:
+                bam.write(record)
+    return sorted_path, grouped_path
+
+
+def write_reference(rng, directory):
+    genome = os.path.join(directory, "genome.fa")
+    with open(genome, "w") as fasta_file:
+        for contig, length in CONTIGS:
+            print(">" + contig, file=fasta_file)
+            print("".join(rng.choice("ACGT") for i in range(length)), file=fasta_file)
+    pysam.faidx(genome)
+    return genome
+
+
+class TestCigarEquivalence(unittest.TestCase):
+    def test_cigar_edge_cases(self):
+        #(CIGAR, minimum length, expected indels (reference position, query position, length, type))
+        cases = [([(0, 100), (2, 40), (0, 100)], 40, [(100, 100, 40, "DEL")]),
+                 ([(0, 100), (2, 39), (0, 100)], 40, []),
+                 ([(4, 50), (1, 40), (0, 100)], 40, [(0, 50, 40, "INS")]),
+                 ([(5, 50), (1, 40), (0, 100)], 40, [(0, 0, 40, "INS")]),
+                 ([(0, 10), (1, 40), (2, 40), (0, 10)], 40, [(10, 10, 40, "INS"), (10, 50, 40, "DEL")]),
+                 ([(7, 10), (8, 5), (2, 50), (6, 3), (1, 45), (7, 10), (4, 20)], 40, [(15, 15, 50, "DEL"), (65, 15, 45, "INS")]),
+                 ([(0, 10), (1, 20), (1, 20), (0, 10)], 40, []),
+                 ([(0, 100), (2, 40), (1, 41)], 41, [(140, 100, 41, "INS")])]
+        for cigar, min_length, expected in cases:
+            self.assertEqual(analyze_cigar_indel(cigar, min_length), expected)
+
+    def test_cigar_filtering(self):
+        #Indels extracted once with the smallest minimum length and filtered afterwards (parameter-sweep)
+        #equal the indels extracted with each minimum length
+        rng = Random(1)
+        for index in range(200):
+            cigar = random_indel_body(rng, rng.randint(0, 100))
+            indels = analyze_cigar_indel(cigar, 1)
+            for min_length in (1, 20, 40, 41, 500):
+                self.assertEqual([indel for indel in indels if indel[2] >= min_length], analyze_cigar_indel(cigar, min_length))
+
+
+class TestCollectEquivalence(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.sorted_path, self.grouped_path = write_haplotype(Random(0), self.tmpdir.name, "hap1", 300)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def get_options(self, *arguments):
+        options = parse_arguments('1.0.1', ['haploid', self.tmpdir.name, self.sorted_path, 'genome', '--max_sv_size', '20000'] + list(arguments))
+        options.query_name_table = QueryNameTable()
+        return options
+
+    def collect_serial(self, options):
+        with pysam.AlignmentFile(self.sorted_path) as bam:
+            return normalize(analyze_alignment_file_coordsorted(bam, options), options.query_name_table)
+
+    def test_collect_paths(self):
+        options = self.get_options()
+        expected = self.collect_serial(options)
+        self.assertEqual(set(dict(row)["type"] for row in expected), {"DEL", "INS", "INV", "DUP_TAN", "DUP_INT", "BND"})
+
+        options = self.get_options()
+        with pysam.AlignmentFile(self.grouped_path) as bam:
+            self.assertEqual(normalize(analyze_alignment_file_querysorted(bam, options), options.query_name_table), expected)
+
+        options = self.get_options('--max_memory', '1')
+        with pysam.AlignmentFile(self.sorted_path) as bam:
+            spilled = analyze_alignment_file_coordsorted(bam, options)
+            self.assertIsInstance(spilled, SpillingCandidateList)
+            self.assertEqual(normalize(spilled, options.query_name_table), expected)
+            spilled.close()
+
+        options = self.get_options('--max_memory', '1')
+        with pysam.AlignmentFile(self.grouped_path) as bam:
+            spilled = analyze_alignment_file_querysorted(bam, options)
+            self.assertEqual(normalize(spilled, options.query_name_table), expected)
+            spilled.close()
+
+        for window_size in (997, 7000):
+            options = self.get_options()
+            with pysam.AlignmentFile(self.sorted_path) as bam:
+                regions = get_regions(bam.references, bam.lengths, window_size)
+                self.assertEqual(normalize(analyze_regions_coordsorted(bam, regions, options), options.query_name_table), expected)
+
+    def test_parallel_windows(self):
+        options = self.get_options()
+        options.coverage_recorder = CoverageRecorder()
+        expected = self.collect_serial(options)
+        expected_coverage = options.coverage_recorder.finish().intervals
+        for window_size in ('997', '7000', '1000000'):
+            options = self.get_options('--collect_processes', '3', '--collect_window_size', window_size)
+            options.coverage_recorder = CoverageRecorder()
+            with pysam.AlignmentFile(self.sorted_path) as bam:
+                candidates = analyze_alignment_file_parallel_multi(self.sorted_path, bam, options, [options])[0]
+            self.assertEqual(normalize(candidates, options.query_name_table), expected)
+            coverage = options.coverage_recorder.finish().intervals
+            self.assertEqual(sorted(coverage.keys()), sorted(expected_coverage.keys()))
+            for contig in coverage:
+                self.assertEqual(coverage[contig][0].tolist(), expected_coverage[contig][0].tolist())
+                self.assertEqual(coverage[contig][1].tolist(), expected_coverage[contig][1].tolist())
+
+    def test_parameter_sets(self):
+        options = self.get_options()
+        parameter_sets = [get_parameter_set_options(options, name, parameters) for name, parameters in
+                          [("default", {}),
+                           ("small", {"min_sv_size": 20, "max_sv_size": 5000}),
+                           ("strict", {"query_gap_tolerance": 10, "query_overlap_tolerance": 10, "reference_gap_tolerance": 10, "reference_overlap_tolerance": 10}),
+                           ("tolerant", {"query_gap_tolerance": 100, "query_overlap_tolerance": 100, "reference_gap_tolerance": 100, "reference_overlap_tolerance": 100})]]
+        with pysam.AlignmentFile(self.sorted_path) as bam:
+            candidate_lists = analyze_alignment_file_coordsorted_multi(bam, options, parameter_sets)
+        results = []
+        for parameter_set, candidates in zip(parameter_sets, candidate_lists):
+            parameter_set.query_name_table = QueryNameTable()
+            expected = self.collect_serial(parameter_set)
+            self.assertEqual(normalize(candidates, options.query_name_table), expected)
+            results.append(expected)
+        #The parameter sets give different results
+        self.assertEqual(len(set(tuple(result) for result in results)), 4)
+
+        options = self.get_options('--collect_processes', '2', '--collect_window_size', '5000')
+        with pysam.AlignmentFile(self.sorted_path) as bam:
+            candidate_lists = analyze_alignment_file_parallel_multi(self.sorted_path, bam, options, parameter_sets)
+        self.assertEqual([normalize(candidates, options.query_name_table) for candidates in candidate_lists], results)
+
+
+def random_partition_candidates(rng, reference, num_loci):
+    """Return the candidates of two haplotypes at random loci. At each locus, the haplotypes carry identical, similar
+    or different candidates or a candidate on only one haplotype. Some loci are dense clusters that exceed the maximum partition size."""
+    haplotypes = [[], []]
+    for locus in range(num_loci):
+        contig, length = rng.choice(CONTIGS)
+        position = rng.randint(1000, length - 12000)
+        sv_type = rng.choice(["DEL", "INS", "INV", "DUP_TAN", "DUP_INT", "BND"])
+        size = rng.randint(50, 3000)
+        sequence = "".join(rng.choice("ACGT") for i in range(size))
+        copies = [(haplotype, 0, sequence) for haplotype in (0, 1)]
+        relation = rng.choice(["identical", "similar", "different", "single", "dense"])
+        if relation == "similar":
+            copies[1] = (1, rng.randint(-30, 30), sequence[:size - rng.randint(0, 20)])
+        elif relation == "different":
+            copies[1] = (1, rng.randint(-300, 300), "".join(rng.choice("ACGT") for i in range(size)))
+        elif relation == "single":
+            copies = copies[rng.randint(0, 1):][:1]
+        elif relation == "dense":
+            copies = [(rng.randint(0, 1), rng.randint(-200, 200), sequence[:size - rng.randint(0, 200)]) for i in range(12)]
+        for haplotype, shift, copy_sequence in copies:
+            reads = ["h{0}_locus{1}_{2}".format(haplotype + 1, locus, len(haplotypes[haplotype]))]
+            start = position + shift
+            if sv_type == "DEL":
+                candidate = CandidateDeletion(contig, start, start + len(copy_sequence), reads, reference)
+            elif sv_type == "INS":
+                candidate = CandidateInsertion(contig, start, start + len(copy_sequence), reads, copy_sequence, reference)
+            elif sv_type == "INV":
+                candidate = CandidateInversion(contig, start, start + len(copy_sequence), reads, True, reference)
+            elif sv_type == "DUP_TAN":
+                candidate = CandidateDuplicationTandem(contig, start, start + len(copy_sequence), 1 + (shift % 2), True, reads, reference)
+            elif sv_type == "DUP_INT":
+                other_contig, other_length = CONTIGS[(CONTIGS.index((contig, length)) + 1) % len(CONTIGS)]
+                candidate = CandidateDuplicationInterspersed(contig, start, start + len(copy_sequence), other_contig, 5000 + shift, 5000 + shift + len(copy_sequence), reads, reference)
+            else:
+                other_contig, other_length = CONTIGS[(CONTIGS.index((contig, length)) + 1) % len(CONTIGS)]
+                candidate = CandidateBreakend(contig, start, "fwd", other_contig, 5000 + shift, "rev", reads, reference)
+            haplotypes[haplotype].append(candidate)
+    return haplotypes
+
+
+class TestPairEquivalence(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.reference = open_reference(write_reference(Random(0), self.tmpdir.name))
+
+    def tearDown(self):
+        self.reference.close()
+        self.tmpdir.cleanup()
+
+    def test_pair_paths(self):
+        for seed in range(3):
+            haplotypes = random_partition_candidates(Random(seed), self.reference, 60)
+            expected = normalize(pair_candidates_multi(haplotypes, self.reference, 200, self.reference))
+            self.assertEqual(set(dict(row)["genotype"] for row in expected), {"1/1", "1/0", "0/1"})
+
+            self.assertEqual(normalize(pair_candidates(haplotypes[0], haplotypes[1], self.reference, 200, self.reference)), expected)
+            self.assertEqual(normalize(pair_candidates_multi(haplotypes, self.reference, 200, self.reference, sketch_prefilter = True)), expected)
+
+            spilled_lists = []
+            for candidates in haplotypes:
+                spilled_candidates = SpillingCandidateList(1, self.tmpdir.name)
+                spilled_candidates.extend(candidates)
+                spilled_candidates.flush()
+                spilled_lists.append(spilled_candidates)
+            paired = pair_candidates_multi(spilled_lists, self.reference, 200, self.reference, 1, self.tmpdir.name)
+            self.assertEqual(normalize(paired), expected)
+            for spilled_candidates in spilled_lists + [paired]:
+                spilled_candidates.close()
+
+            types = {"DEL", "INS", "DUP_INT"}
+            self.assertEqual(normalize(pair_candidates_multi(haplotypes, self.reference, 200, self.reference, candidate_types = types)),
+                             [row for row in expected if dict(row)["type"] in types])
+
+    def test_linkage_sweep(self):
+        haplotypes = random_partition_candidates(Random(5), self.reference, 60)
+        linkage_cache = LinkageCache()
+        pair_candidates_multi(haplotypes, self.reference, 500, self.reference, linkage_cache = linkage_cache)
+        directory = os.path.join(self.tmpdir.name, "linkage")
+        linkage_cache.save(directory, [contig for contig, length in CONTIGS], [length for contig, length in CONTIGS], 2, 500, True)
+        store = load_candidates(os.path.join(directory, "candidates.svim"))
+        for threshold in (0, 50, 200, 500):
+            self.assertEqual(normalize(sweep_candidates(directory, store, threshold, 2, self.reference)),
+                             normalize(pair_candidates_multi(haplotypes, self.reference, threshold, self.reference)))
+        store.close()
+
+
+class TestOutputEquivalence(unittest.TestCase):
+    """Runs the command-line modes on two random haplotypes and compares their VCF with a serial diploid run"""
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = Random(2)
+        self.genome = write_reference(rng, self.tmpdir.name)
+        self.sorted_paths, self.grouped_paths = zip(*[write_haplotype(rng, self.tmpdir.name, "hap{0}".format(haplotype), 150) for haplotype in (1, 2)])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_diploid(self, name, bam_paths, *arguments):
+        working_dir = os.path.join(self.tmpdir.name, name)
+        os.makedirs(working_dir)
+        options = parse_arguments('1.0.1', ['diploid', working_dir] + list(bam_paths) + [self.genome, '--query_names', '--max_sv_size', '20000'] + list(arguments))
+        self.assertTrue(run_sample(options, '1.0.1'))
+        return working_dir
+
+    def test_output_paths(self):
+        expected = read_vcf_records(os.path.join(self.run_diploid("serial", self.sorted_paths), "variants.vcf"))
+        self.assertGreater(len(expected), 100)
+        for name, bam_paths, arguments in [("streaming", self.grouped_paths, []),
+                                           ("spilled", self.sorted_paths, ['--max_memory', '1']),
+                                           ("format_threads", self.sorted_paths, ['--format_threads', '3']),
+                                           ("sketch_prefilter", self.sorted_paths, ['--sketch_prefilter']),
+                                           ("collect_processes", self.sorted_paths, ['--collect_processes', '3', '--collect_window_size', '7000'])]:
+            self.assertEqual(read_vcf_records(os.path.join(self.run_diploid(name, bam_paths, *arguments), "variants.vcf")), expected, name)
+
+        #Linkage trees saved by a run with a larger edit distance threshold
+        for name, arguments in [("linkage", []), ("linkage_spilled", ['--max_memory', '1'])]:
+            working_dir = self.run_diploid(name, self.sorted_paths, '--max_edit_distance', '500', '--save_linkage', *arguments)
+            self.assertTrue(run_sweep(parse_arguments('1.0.1', ['sweep', working_dir, self.genome, '--thresholds', '200', '--query_names']), '1.0.1'))
+            self.assertEqual(read_vcf_records(os.path.join(working_dir, "sweep", "max_edit_distance_200", "variants.vcf")), expected)
+
+        #Sharded COLLECT with windows and gather
+        working_dir = os.path.join(self.tmpdir.name, "sharded")
+        for shard in range(1, 4):
+            options = parse_arguments('1.0.1', ['collect', working_dir] + list(self.sorted_paths) + ['--shard', '{0}/3'.format(shard), '--window_size', '7000', '--max_sv_size', '20000'])
+            self.assertTrue(run_collect_shard(options))
+        self.assertTrue(run_gather(parse_arguments('1.0.1', ['gather', working_dir, self.genome, '--query_names']), '1.0.1'))
+        self.assertEqual(read_vcf_records(os.path.join(working_dir, "variants.vcf")), expected)
+
+        #Parameter sweep with the default parameters
+        working_dir = os.path.join(self.tmpdir.name, "parameter_sweep")
+        os.makedirs(working_dir)
+        parameter_path = os.path.join(self.tmpdir.name, "parameters.tsv")
+        with open(parameter_path, "w") as parameter_file:
+            print("name\tmin_sv_size\tmax_sv_size", file=parameter_file)
+            print("default\t40\t20000", file=parameter_file)
+        options = parse_arguments('1.0.1', ['parameter-sweep', working_dir, parameter_path] + list(self.sorted_paths) + [self.genome, '--query_names'])
+        self.assertTrue(run_parameter_sweep(options, '1.0.1'))
+        self.assertEqual(read_vcf_records(os.path.join(working_dir, "default", "variants.vcf")), expected)
+
+        #Region calls of serve for all contigs
+        options = parse_arguments('1.0.1', ['serve', self.tmpdir.name] + list(self.sorted_paths) + [self.genome, '--query_names', '--max_sv_size', '20000'])
+        reference = open_reference(self.genome)
+        region_caller = RegionCaller(options, reference, '1.0.1')
+        served = [line + "\n" for line in region_caller.call([contig for contig, length in CONTIGS]).splitlines() if not line.startswith("##fileDate")]
+        region_caller.close()
+        reference.close()
+        self.assertEqual(served, expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+import tempfile
+
+from random import choice, randint, seed
+
+from svim_asm.SVIM_sketch import compute_haplotype_sketch, sketch_lower_bound
+from svim_asm.SVIM_COMBINE import compute_distance, get_genotype, pair_candidates, pair_candidates_multi
+from svim_asm.SVIM_input_parsing import parse_arguments
+from svim_asm.SVIM_linkage import LinkageCache, sweep_candidates
+from svim_asm.SVIM_store import load_candidates
+from svim_asm.SVCandidate import get_candidate_types, CandidateDeletion, CandidateInsertion, CandidateInversion, CandidateDuplicationTandem
+
+class FakeReference:
+    def __init__(self, sequences):
+        self.sequences = sequences
+
+    def fetch(self, contig, start, end):
+        return self.sequences[contig][start:end]
+
+    def get_reference_length(self, contig):
+        return len(self.sequences[contig])
+
+class FakeAlignmentFile:
+    def get_reference_length(self, contig):
+        return 100000
+
+class TestPairCandidates(unittest.TestCase):
+    def setUp(self):
+        seed(42)
+        self.reference = FakeReference({"chr1": "".join(choice("ACGT") for i in range(20000))})
+        self.bam = FakeAlignmentFile()
+
+    def test_genotype(self):
+        self.assertEqual(get_genotype({1}, 2), "1/0")
+        self.assertEqual(get_genotype({2}, 2), "0/1")
+        self.assertEqual(get_genotype({1, 2}, 2), "1/1")
+        self.assertEqual(get_genotype({1, 3}, 4), "1/0/1/0")
+
+    def test_bounded_distance(self):
+        deletion1 = (1, CandidateDeletion("chr1", 1000, 1500, ["read1"], self.bam))
+        deletion2 = (2, CandidateDeletion("chr1", 1010, 1500, ["read2"], self.bam))
+        distance = compute_distance(deletion1, deletion2, self.reference)
+        self.assertGreater(distance, 0)
+        self.assertEqual(compute_distance(deletion1, deletion2, self.reference, distance), distance)
+        self.assertEqual(compute_distance(deletion1, deletion2, self.reference, distance - 1), distance)
+
+    def test_breakpoint_windows(self):
+        inversion1 = (1, CandidateInversion("chr1", 2000, 12000, ["read1"], True, self.bam))
+        inversion2 = (2, CandidateInversion("chr1", 2005, 12000, ["read2"], True, self.bam))
+        inversion3 = (2, CandidateInversion("chr1", 2000, 12300, ["read3"], True, self.bam))
+        local_distance = compute_distance(inversion1, inversion2, self.reference, 200, (5000, 500))
+        self.assertGreaterEqual(local_distance, 5)
+        self.assertLessEqual(local_distance, 200)
+        self.assertEqual(compute_distance(inversion1, inversion3, self.reference, 200, (5000, 500)), 201)
+        #Windows are not used for SVs below the minimum size
+        self.assertEqual(compute_distance(inversion1, inversion2, self.reference, 200, (20000, 500)),
+                         compute_distance(inversion1, inversion2, self.reference, 200))
+        duplication1 = (1, CandidateDuplicationTandem("chr1", 2000, 8000, 1, True, ["read1"], self.bam))
+        duplication2 = (2, CandidateDuplicationTandem("chr1", 2000, 8000, 1, True, ["read2"], self.bam))
+        duplication3 = (2, CandidateDuplicationTandem("chr1", 2000, 8000, 2, True, ["read3"], self.bam))
+        self.assertEqual(compute_distance(duplication1, duplication2, self.reference, 200, (5000, 500)), 0)
+        self.assertEqual(compute_distance(duplication1, duplication3, self.reference, 200, (5000, 500)), 201)
+
+    def test_sketch_lower_bound(self):
+        base = "".join(choice("ACGT") for i in range(2000))
+        for i in range(30):
+            sequence = list(base[:randint(1500, 2000)])
+            for j in range(randint(0, 300)):
+                sequence[randint(0, len(sequence) - 1)] = choice("ACGT")
+            insertion1 = (1, CandidateInsertion("chr1", 5000, 7000, ["read1"], base, self.bam))
+            insertion2 = (2, CandidateInsertion("chr1", 5000 + randint(0, 50), 7000, ["read2"], "".join(sequence), self.bam))
+            bound = sketch_lower_bound(compute_haplotype_sketch(insertion1[1], self.reference), compute_haplotype_sketch(insertion2[1], self.reference))
+            self.assertLessEqual(bound, compute_distance(insertion1, insertion2, self.reference))
+
+    def test_sketch_prefilter(self):
+        haplotypes = [[CandidateInsertion("chr1", 5000, 5100, ["h1"], "ACGT" * 25, self.bam), CandidateInsertion("chr1", 5020, 5120, ["h1b"], "CAT" * 40, self.bam)],
+                      [CandidateInsertion("chr1", 5000, 5100, ["h2"], "ACGT" * 25, self.bam)],
+                      [CandidateInsertion("chr1", 5030, 5130, ["h3"], "CAT" * 40, self.bam)]]
+        results = []
+        for sketch_prefilter in (False, True):
+            paired = pair_candidates_multi(haplotypes, self.reference, 20, self.bam, sketch_prefilter = sketch_prefilter)
+            results.append(sorted((cand.get_key(), cand.genotype, sorted(cand.reads)) for cand in paired))
+        self.assertEqual(len(results[0]), 2)
+        self.assertEqual(results[0], results[1])
+
+    def test_identical_candidates(self):
+        class NoReference:
+            def fetch(self, contig, start, end):
+                raise AssertionError("Identical candidates should not be aligned")
+        haplotypes = [[CandidateDeletion("chr1", 1000, 1500, ["h1"], self.bam), CandidateInsertion("chr1", 5000, 5100, ["h1"], "A" * 100, self.bam)],
+                      [CandidateDeletion("chr1", 1000, 1500, ["h2"], self.bam), CandidateInsertion("chr1", 5000, 5100, ["h2"], "A" * 100, self.bam)]]
+        paired = pair_candidates_multi(haplotypes, NoReference(), 200, self.bam)
+        self.assertEqual([(cand.type, cand.genotype, sorted(cand.reads)) for cand in paired], [("DEL", "1/1", ["h1", "h2"]), ("INS", "1/1", ["h1", "h2"])])
+
+    def test_pair_multi(self):
+        haplotypes = [[CandidateDeletion("chr1", 1000, 1500, ["h1"], self.bam), CandidateInsertion("chr1", 5000, 5100, ["h1"], "A" * 100, self.bam)],
+                      [CandidateDeletion("chr1", 1001, 1501, ["h2"], self.bam)],
+                      [CandidateDeletion("chr1", 1000, 1500, ["h3"], self.bam), CandidateDeletion("chr1", 1020, 1200, ["h3b"], self.bam)],
+                      [CandidateInsertion("chr1", 5000, 5100, ["h4"], "A" * 100, self.bam)]]
+        paired = pair_candidates_multi(haplotypes, self.reference, 200, self.bam)
+        genotypes = sorted((cand.type, cand.get_key()[2], cand.genotype, sorted(cand.reads)) for cand in paired)
+        self.assertEqual(genotypes, [("DEL", 1110, "0/0/1/0", ["h3b"]),
+                                     ("DEL", 1250, "1/1/1/0", ["h1", "h2", "h3"]),
+                                     ("INS", 5000, "1/0/0/1", ["h1", "h4"])])
+
+    def test_linkage_sweep(self):
+        haplotypes = [[CandidateDeletion("chr1", 1000, 1500, ["h1"], self.bam), CandidateDeletion("chr1", 1030, 1500, ["h1b"], self.bam)],
+                      [CandidateDeletion("chr1", 1010, 1510, ["h2"], self.bam), CandidateInsertion("chr1", 5000, 5100, ["h2"], "A" * 100, self.bam)],
+                      [CandidateDeletion("chr1", 1000, 1500, ["h3"], self.bam)]]
+        #Without and with a memory budget that spills every candidate
+        for max_memory in (None, 1):
+            with tempfile.TemporaryDirectory() as directory:
+                linkage_cache = LinkageCache(max_memory, directory)
+                pair_candidates_multi(haplotypes, self.reference, 200, self.bam, linkage_cache = linkage_cache)
+                if max_memory is not None:
+                    self.assertGreater(len(linkage_cache.candidates.runs), 1)
+                linkage_cache.save(directory, ["chr1"], [100000], 3, 200, True)
+                linkage_cache.close()
+                store = load_candidates(directory + "/candidates.svim")
+                for threshold in (0, 20, 50, 200):
+                    expected = pair_candidates_multi(haplotypes, self.reference, threshold, self.bam)
+                    swept = sweep_candidates(directory, store, threshold, 3, self.bam)
+                    self.assertEqual(sorted((cand.get_key(), cand.genotype, sorted(cand.reads)) for cand in swept),
+                                     sorted((cand.get_key(), cand.genotype, sorted(cand.reads)) for cand in expected))
+                store.close()
+
+    def test_pair_diploid(self):
+        paired = pair_candidates([CandidateDeletion("chr1", 1000, 1500, ["h1"], self.bam)],
+                                 [CandidateDeletion("chr1", 1000, 1500, ["h2"], self.bam), CandidateDeletion("chr1", 8000, 8500, ["h2"], self.bam)],
+                                 self.reference, 200, self.bam)
+        self.assertEqual([(cand.get_source()[1], cand.genotype) for cand in paired], [(1000, "1/1"), (8000, "0/1")])
+
+class TestCandidateTypes(unittest.TestCase):
+    def test_candidate_types(self):
+        options = parse_arguments('1.0.1', ['diploid', 'mydir', 'bam1', 'bam2', 'mygenome'])
+        self.assertEqual(get_candidate_types(options), {"DEL", "INV", "INS", "DUP_TAN", "DUP_INT", "BND"})
+        options = parse_arguments('1.0.1', ['diploid', 'mydir', 'bam1', 'bam2', 'mygenome', '--types', 'DEL,INS', '--tandem_duplications_as_insertions'])
+        self.assertEqual(get_candidate_types(options), {"DEL", "INS", "DUP_TAN"})
+        options = parse_arguments('1.0.1', ['diploid', 'mydir', 'bam1', 'bam2', 'mygenome', '--types', 'DUP:INT', '--interspersed_duplications_as_insertions'])
+        self.assertEqual(get_candidate_types(options), set())
+
+    def test_pair_types(self):
+        bam = FakeAlignmentFile()
+        haplotypes = [[CandidateDeletion("chr1", 1000, 1500, ["h1"], bam), CandidateInversion("chr1", 3000, 4000, ["h1"], True, bam)],
+                      [CandidateInversion("chr1", 3000, 4000, ["h2"], True, bam)]]
+        paired = pair_candidates_multi(haplotypes, None, 200, bam, candidate_types = {"DEL"})
+        self.assertEqual([(cand.type, cand.genotype) for cand in paired], [("DEL", "1/0")])
+
+if __name__ == '__main__':
+    unittest.main()
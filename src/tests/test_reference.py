@@ -0,0 +1,82 @@
+import unittest
+import tempfile
+import os
+import pysam
+
+from random import choice, randint
+
+from svim_asm.SVIM_reference import reverse_complement, merge_regions, BlockReference, FastaReference, MappedReference, write_reference_cache, open_reference
+
+class FakeReference:
+    def __init__(self, sequences):
+        self.sequences = sequences
+        self.fetches = 0
+
+    def fetch(self, contig, start, end):
+        self.fetches += 1
+        return self.sequences[contig][start:end].upper()
+
+    def get_reference_length(self, contig):
+        return len(self.sequences[contig])
+
+    def close(self):
+        pass
+
+class TestReference(unittest.TestCase):
+
+    def test_reverse_complement(self):
+        self.assertEqual(reverse_complement("ACGTTN"), "NAACGT")
+        self.assertEqual(reverse_complement("RYACG"), "CGTYR")
+        self.assertEqual(reverse_complement(""), "")
+
+    def test_merge_regions(self):
+        blocks = merge_regions([("chr1", 100, 200), ("chr2", 0, 10), ("chr1", 250, 300), ("chr1", 1000, 1100), ("chr1", 150, 160)], 100, 10000)
+        self.assertEqual(blocks["chr1"], [(100, 300), (1000, 1100)])
+        self.assertEqual(blocks["chr2"], [(0, 10)])
+        blocks = merge_regions([("chr1", 0, 100), ("chr1", 100, 200)], 100, 150)
+        self.assertEqual(blocks["chr1"], [(0, 100), (100, 200)])
+
+    def test_block_reference(self):
+        sequences = {"chr1": "".join(choice("acgtACGTN") for i in range(50000)), "chr2": "".join(choice("ACGT") for i in range(1000))}
+        regions = []
+        for i in range(200):
+            start = randint(0, 49000)
+            regions.append(("chr1", start, start + randint(0, 1000)))
+        reference = FakeReference(sequences)
+        block_reference = BlockReference(reference, regions, max_gap = 1000, max_block_size = 20000)
+        for contig, start, end in sorted(regions):
+            self.assertEqual(block_reference.fetch(contig, start, end), sequences[contig][start:end].upper())
+        fetches_blocks = reference.fetches
+        self.assertLessEqual(fetches_blocks, len(block_reference.blocks["chr1"]))
+        #Regions outside of the blocks are passed through
+        self.assertEqual(block_reference.fetch("chr2", 10, 20), sequences["chr2"][10:20])
+        self.assertEqual(reference.fetches, fetches_blocks + 1)
+
+    def test_reference_cache(self):
+        sequences = {"chr1": "".join(choice("acgtACGTN") for i in range(5000)), "chr2": "".join(choice("ACGT") for i in range(777))}
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            genome = os.path.join(tmpdirname, "genome.fa")
+            with open(genome, "w") as fasta_file:
+                for contig, sequence in sequences.items():
+                    print(">" + contig, file=fasta_file)
+                    for i in range(0, len(sequence), 60):
+                        print(sequence[i:i+60], file=fasta_file)
+            pysam.faidx(genome)
+            self.assertIsInstance(open_reference(genome), FastaReference)
+            write_reference_cache(genome, chunk_size = 1000)
+            mapped_reference = open_reference(genome)
+            self.assertIsInstance(mapped_reference, MappedReference)
+            fasta_reference = FastaReference(genome)
+            self.assertEqual(mapped_reference.references, list(fasta_reference.references))
+            self.assertEqual(mapped_reference.lengths, list(fasta_reference.lengths))
+            for contig in sequences:
+                self.assertEqual(mapped_reference.fetch(contig), sequences[contig].upper())
+                for i in range(100):
+                    start = randint(0, 6000)
+                    end = start + randint(0, 1000)
+                    self.assertEqual(mapped_reference.fetch(contig, start, end), fasta_reference.fetch(contig, start, end))
+            mapped_reference.close()
+            fasta_reference.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import pickle
+
+from random import choice, randint, seed
+
+from svim_asm.SVIM_sequence import EncodedSequence, encode_sequence
+from svim_asm.SVIM_COMBINE import compute_distance
+from svim_asm.SVCandidate import CandidateInsertion
+
+class FakeReference:
+    def __init__(self, sequences):
+        self.sequences = sequences
+
+    def fetch(self, contig, start, end):
+        return self.sequences[contig][start:end]
+
+    def get_reference_length(self, contig):
+        return len(self.sequences[contig])
+
+class TestEncodedSequence(unittest.TestCase):
+    def test_round_trip(self):
+        seed(0)
+        for sequence in ["", "A", "ACGTN", "NNNNACGTRYacgtnnACG", "acgt" * 10]:
+            self.assertEqual(EncodedSequence(sequence).decode(), sequence)
+        for i in range(100):
+            sequence = "".join(choice("ACGTACGTACGTNacgtRY") for j in range(randint(0, 300)))
+            encoded = EncodedSequence(sequence)
+            self.assertEqual(len(encoded), len(sequence))
+            self.assertEqual(str(encoded), sequence)
+            self.assertEqual(pickle.loads(pickle.dumps(encoded)).decode(), sequence)
+
+    def test_equality(self):
+        self.assertEqual(EncodedSequence("ACGTN"), EncodedSequence("ACGTN"))
+        self.assertNotEqual(EncodedSequence("ACGTA"), EncodedSequence("ACGTN"))
+        self.assertNotEqual(EncodedSequence("ACGT"), EncodedSequence("ACGTA"))
+        self.assertNotEqual(EncodedSequence("ACGT"), EncodedSequence("acgt"))
+        encoded = EncodedSequence("ACGT")
+        self.assertIs(encode_sequence(encoded), encoded)
+
+    def test_insertion_distance(self):
+        seed(1)
+        reference = FakeReference({"chr1": "".join(choice("ACGT") for i in range(2000))})
+        bam = reference
+        insertion1 = CandidateInsertion("chr1", 1000, 1100, ["read1"], "ACGT" * 25, bam)
+        insertion2 = CandidateInsertion("chr1", 1000, 1100, ["read2"], "ACGT" * 25, bam)
+        insertion3 = CandidateInsertion("chr1", 1010, 1150, ["read3"], "ACGT" * 35, bam)
+        self.assertEqual(compute_distance((0, insertion1), (1, insertion2), reference), 0)
+        distance = compute_distance((0, insertion1), (1, insertion3), reference)
+        self.assertGreaterEqual(distance, 40)
+        self.assertEqual(compute_distance((0, insertion1), (1, insertion3), reference, 10), 11)
+        self.assertEqual(compute_distance((0, insertion1), (1, insertion3), reference, distance), distance)
+        self.assertEqual(insertion3.get_vcf_record(sequence_alleles = True, reference = reference).alt,
+                         reference.fetch("chr1", 1009, 1010) + "ACGT" * 35)
+
+if __name__ == '__main__':
+    unittest.main()
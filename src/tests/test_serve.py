@@ -0,0 +1,91 @@
+import unittest
+import tempfile
+import threading
+import os
+import pysam
+
+from http.server import HTTPServer
+from urllib.request import urlopen
+from urllib.error import HTTPError
+from random import choice, seed
+
+from svim_asm.SVIM_input_parsing import parse_arguments
+from svim_asm.SVIM_reference import open_reference
+from svim_asm.SVIM_serve import RegionCaller, RegionCallHandler
+
+class TestServe(unittest.TestCase):
+    def setUp(self):
+        seed(0)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        genome = os.path.join(self.tmpdir.name, "genome.fa")
+        sequences = {contig: "".join(choice("ACGT") for i in range(100000)) for contig in ["chr1", "chr2"]}
+        with open(genome, "w") as fasta_file:
+            for contig, sequence in sequences.items():
+                print(">" + contig, file=fasta_file)
+                print(sequence, file=fasta_file)
+        pysam.faidx(genome)
+        header = pysam.AlignmentHeader.from_dict({"HD": {"VN": "1.6", "SO": "coordinate"},
+                                                  "SQ": [{"SN": "chr1", "LN": 100000}, {"SN": "chr2", "LN": 100000}]})
+        bam_paths = []
+        for haplotype in range(2):
+            records = []
+            for index in range(10):
+                #Alignment with a deletion, the last one only on the first haplotype
+                if index == 9 and haplotype == 1:
+                    continue
+                record = pysam.AlignedSegment(header)
+                record.query_name = "hap{0}_query{1}".format(haplotype, index)
+                record.reference_id = index % 2
+                record.reference_start = (index // 2) * 15000
+                record.query_sequence = sequences[header.get_reference_name(index % 2)][record.reference_start:record.reference_start + 1000] + \
+                                        sequences[header.get_reference_name(index % 2)][record.reference_start + 1100:record.reference_start + 2000]
+                record.flag = 0
+                record.mapping_quality = 60
+                record.cigarstring = "1000M100D900M"
+                records.append(record)
+            bam_path = os.path.join(self.tmpdir.name, "hap{0}.bam".format(haplotype))
+            with pysam.AlignmentFile(bam_path, "wb", header = header) as bam:
+                for record in sorted(records, key=lambda record: (record.reference_id, record.reference_start)):
+                    bam.write(record)
+            pysam.index(bam_path)
+            bam_paths.append(bam_path)
+        options = parse_arguments('1.0.1', ['serve', self.tmpdir.name] + bam_paths + [genome])
+        self.reference = open_reference(genome)
+        self.server = HTTPServer(("127.0.0.1", 0), RegionCallHandler)
+        self.server.region_caller = RegionCaller(options, self.reference, '1.0.1')
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.server.region_caller.close()
+        self.reference.close()
+        self.tmpdir.cleanup()
+
+    def get(self, path):
+        with urlopen("http://127.0.0.1:{0}{1}".format(self.server.server_address[1], path)) as response:
+            return response.read().decode()
+
+    def get_records(self, path):
+        return [line.split("\t") for line in self.get(path).splitlines() if not line.startswith("#")]
+
+    def test_call_regions(self):
+        records = self.get_records("/call?region=chr2")
+        self.assertEqual([(record[0], record[1], record[9]) for record in records],
+                         [("chr2", "1000", "1/1"), ("chr2", "16000", "1/1"), ("chr2", "31000", "1/1"), ("chr2", "46000", "1/1"), ("chr2", "61000", "1/0")])
+        records = self.get_records("/call?region=chr1:15001-30000&region=chr2:60001-70000")
+        self.assertEqual([(record[0], record[1]) for record in records], [("chr1", "16000"), ("chr2", "61000")])
+        #Requests reuse the open files
+        self.assertEqual(self.get_records("/call?region=chr2"), self.get_records("/call?region=chr2"))
+
+    def test_bad_requests(self):
+        for path in ["/call", "/call?region=chrX", "/call?region=chr1:2000-1000"]:
+            with self.assertRaises(HTTPError) as context:
+                self.get(path)
+            self.assertEqual(context.exception.code, 400)
+        self.assertIn("inputs", self.get("/status"))
+
+if __name__ == '__main__':
+    unittest.main()
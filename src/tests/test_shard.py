@@ -0,0 +1,72 @@
+import unittest
+import tempfile
+import os
+import pysam
+
+from random import choice, randint, seed
+
+from svim_asm.SVIM_input_parsing import parse_arguments
+from svim_asm.SVIM_COLLECT import analyze_alignment_file_coordsorted
+from svim_asm.SVIM_shard import get_regions, assign_regions_to_shards, run_collect_shard, read_shard_manifests, iterate_haplotype_candidates
+from svim_asm.SVIM_store import load_candidates
+from svim_asm.SVCandidate import QueryNameTable
+
+class TestShard(unittest.TestCase):
+    def setUp(self):
+        seed(0)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        header = pysam.AlignmentHeader.from_dict({"HD": {"VN": "1.6", "SO": "coordinate"},
+                                                  "SQ": [{"SN": "chr1", "LN": 100000}, {"SN": "chr2", "LN": 60000}, {"SN": "chr3", "LN": 30000}]})
+        records = []
+        for index in range(60):
+            record = pysam.AlignedSegment(header)
+            record.query_name = "query{0}".format(index)
+            record.reference_id = randint(0, 2)
+            record.reference_start = randint(0, 25000)
+            record.query_sequence = "".join(choice("ACGT") for i in range(2700))
+            record.flag = 0
+            record.mapping_quality = 60
+            record.cigarstring = "1000M100D500M200I1000M"
+            records.append(record)
+        self.bam_path = os.path.join(self.tmpdir.name, "input.bam")
+        with pysam.AlignmentFile(self.bam_path, "wb", header = header) as bam:
+            for record in sorted(records, key=lambda record: (record.reference_id, record.reference_start)):
+                bam.write(record)
+        pysam.index(self.bam_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_regions(self):
+        self.assertEqual(get_regions(["chr1", "chr2"], [250, 100]), [("chr1", None, None), ("chr2", None, None)])
+        self.assertEqual(get_regions(["chr1", "chr2"], [250, 100], 100), [("chr1", 0, 100), ("chr1", 100, 200), ("chr1", 200, 250), ("chr2", 0, 100)])
+
+    def test_assign_regions(self):
+        self.assertEqual(assign_regions_to_shards([100, 60, 30, 50], 2), [[0, 2], [1, 3]])
+        self.assertEqual(assign_regions_to_shards([100, 60, 30, 50], 4), [[0], [1], [3], [2]])
+        shards = assign_regions_to_shards([10] * 7, 3)
+        self.assertEqual(sorted(index for shard in shards for index in shard), list(range(7)))
+        self.assertEqual([len(shard) for shard in shards], [3, 2, 2])
+
+    def test_shards_equal_whole_file(self):
+        working_dir = os.path.join(self.tmpdir.name, "work")
+        options = parse_arguments('1.0.1', ['haploid', working_dir, self.bam_path, 'mygenome'])
+        options.query_name_table = QueryNameTable()
+        with pysam.AlignmentFile(self.bam_path) as bam:
+            expected = [(cand.type, cand.get_key(), cand.get_read_names(options.query_name_table)) for cand in analyze_alignment_file_coordsorted(bam, options)]
+        for shard in range(1, 4):
+            options = parse_arguments('1.0.1', ['collect', working_dir, self.bam_path, '--shard', '{0}/3'.format(shard), '--window_size', '7000'])
+            self.assertTrue(run_collect_shard(options))
+        manifests = read_shard_manifests(working_dir)
+        self.assertEqual(len(manifests), 3)
+        stores = [load_candidates(os.path.join(manifest["directory"], "hap1.svim")) for manifest in manifests]
+        gathered = [(cand.type, cand.get_key(), cand.reads) for cand in iterate_haplotype_candidates(manifests, stores, 0)]
+        self.assertGreater(len(expected), 60)
+        self.assertEqual(gathered, expected)
+        #A missing shard is detected
+        os.remove(os.path.join(manifests[1]["directory"], "shard.json"))
+        with self.assertRaises(ValueError):
+            read_shard_manifests(working_dir)
+
+if __name__ == '__main__':
+    unittest.main()
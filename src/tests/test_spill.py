@@ -0,0 +1,52 @@
+import unittest
+import tempfile
+import os
+
+from random import randint, seed
+
+from svim_asm.SVIM_spill import parse_memory_size, SpillingSorter, SpillingCandidateList
+from svim_asm.SVCandidate import CandidateDeletion
+
+class FakeAlignmentFile:
+    def get_reference_length(self, contig):
+        return 100000
+
+class TestSpill(unittest.TestCase):
+    def setUp(self):
+        seed(0)
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_parse_memory_size(self):
+        self.assertEqual(parse_memory_size("1000"), 1000)
+        self.assertEqual(parse_memory_size("2K"), 2048)
+        self.assertEqual(parse_memory_size("1.5G"), 1536 * 1024 ** 2)
+        self.assertEqual(parse_memory_size("500mb"), 500 * 1024 ** 2)
+
+    def test_sorter_is_stable(self):
+        items = [(randint(0, 20), index) for index in range(2000)]
+        sorter = SpillingSorter(key=lambda item: item[0], estimate_size=lambda item: 100, max_memory=5000, directory=self.tmpdir.name, batch_size=7)
+        for item in items:
+            sorter.add(item)
+        self.assertGreater(len(sorter.runs), 1)
+        self.assertEqual(len(sorter), 2000)
+        self.assertEqual(list(sorter), sorted(items, key=lambda item: item[0]))
+        sorter.close()
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    def test_candidate_list_equals_sorted_list(self):
+        bam = FakeAlignmentFile()
+        candidates = [CandidateDeletion("chr1", start, start + 100, ["read{0}".format(index)], bam) for index, start in enumerate(randint(0, 1000) for i in range(500))]
+        spilled = SpillingCandidateList(2000, self.tmpdir.name)
+        for candidate in candidates:
+            spilled.append(candidate)
+        self.assertEqual(spilled.count_type("DEL"), 500)
+        self.assertEqual(spilled.count_type("INS"), 0)
+        expected = sorted(candidates, key=lambda cand: cand.get_key())
+        self.assertEqual([cand.reads for cand in spilled.iter_type("DEL")], [cand.reads for cand in expected])
+        spilled.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import tempfile
+import os
+
+from svim_asm.SVIM_store import save_candidates, load_candidates
+from svim_asm.SVCandidate import CandidateDeletion, CandidateInversion, CandidateInsertion, CandidateDuplicationTandem, CandidateDuplicationInterspersed, CandidateBreakend
+
+class FakeAlignmentFile:
+    def get_reference_length(self, contig):
+        return 100000
+
+class TestCandidateStore(unittest.TestCase):
+    def setUp(self):
+        bam = FakeAlignmentFile()
+        self.candidates = [CandidateDeletion("chr1", 1000, 1500, ["read1", "read2"], bam, "1/0"),
+                           CandidateInversion("chr2", 2000, 3000, ["read3"], False, bam, "0/1"),
+                           CandidateInsertion("chr1", 4000, 4100, ["read4"], "ACGT" * 25, bam),
+                           CandidateDuplicationTandem("chr1", 5000, 5200, 2, True, [], bam, "1/1/0"),
+                           CandidateDuplicationInterspersed("chr2", 100, 600, "chr10", 7000, 7500, ["read5"], bam, True),
+                           CandidateBreakend("chr10", 5000, 'fwd', "chr2", 200, 'rev', ["read6"], bam, "0/1")]
+
+    def test_roundtrip(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, "candidates.svim")
+            self.assertEqual(save_candidates(iter(self.candidates), path), 6)
+            store = load_candidates(path)
+            self.assertEqual(len(store), 6)
+            self.assertEqual(list(store.get_types()), ["DEL", "INV", "INS", "DUP_TAN", "DUP_INT", "BND"])
+            self.assertEqual(list(store.array["source_start"][:2]), [1000, 2000])
+            for original, loaded in zip(self.candidates, store):
+                self.assertIs(type(loaded), type(original))
+                self.assertEqual(vars(loaded), vars(original))
+                if original.type == "BND":
+                    self.assertEqual(loaded.get_vcf_record_reverse(True), original.get_vcf_record_reverse(True))
+                else:
+                    self.assertEqual(loaded.get_key(), original.get_key())
+            self.assertEqual(vars(store[2]), vars(self.candidates[2]))
+            store.close()
+
+    def test_empty(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, "empty.svim")
+            self.assertEqual(save_candidates([], path), 0)
+            store = load_candidates(path)
+            self.assertEqual(len(store), 0)
+            self.assertEqual(list(store), [])
+            store.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest
+import tempfile
+import os
+import pysam
+
+from random import choice, randint, shuffle, seed
+
+from svim_asm.SVIM_COLLECT import bam_iterator, analyze_alignment_file_coordsorted, analyze_alignment_file_querysorted, analyze_alignment_multi
+from svim_asm.SVIM_input_parsing import parse_arguments
+from svim_asm.SVIM_pipeline import collect_candidates, collect_candidates_multi
+from svim_asm.SVIM_sweep import get_parameter_set_options
+
+class TestStreamingCollect(unittest.TestCase):
+
+    def generate_records(self, header):
+        records = []
+        for index in range(40):
+            sequence = "".join(choice("ACGT") for i in range(3000))
+            if index % 2 == 0:
+                #Alignment with a deletion and an insertion
+                record = pysam.AlignedSegment(header)
+                record.query_name = "query{0}".format(index)
+                record.query_sequence = sequence
+                record.flag = 0
+                record.reference_id = randint(0, 1)
+                record.reference_start = randint(0, 90000)
+                record.mapping_quality = 60
+                record.cigarstring = "1000M100D500M200I1300M"
+                records.append(record)
+            else:
+                #Split alignment with supplementary segment on the other chromosome
+                primary = pysam.AlignedSegment(header)
+                supplementary = pysam.AlignedSegment(header)
+                primary_start, supplementary_start = randint(0, 90000), randint(0, 90000)
+                primary.query_name = supplementary.query_name = "query{0}".format(index)
+                primary.query_sequence = sequence
+                supplementary.query_sequence = sequence[1500:]
+                primary.flag, supplementary.flag = 0, 2048
+                primary.reference_id, supplementary.reference_id = 0, 1
+                primary.reference_start, supplementary.reference_start = primary_start, supplementary_start
+                primary.mapping_quality = supplementary.mapping_quality = 60
+                primary.cigarstring = "1500M1500S"
+                supplementary.cigarstring = "1500H1500M"
+                primary.set_tag("SA", "chr2,{0},+,1500S1500M,60,0;".format(supplementary_start + 1))
+                supplementary.set_tag("SA", "chr1,{0},+,1500M1500S,60,0;".format(primary_start + 1))
+                records.extend([primary, supplementary])
+        return records
+
+    def setUp(self):
+        seed(0)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        header = pysam.AlignmentHeader.from_dict({"HD": {"VN": "1.6", "SO": "coordinate"},
+                                                  "SQ": [{"SN": "chr1", "LN": 100000}, {"SN": "chr2", "LN": 100000}]})
+        records = self.generate_records(header)
+        self.sorted_path = os.path.join(self.tmpdir.name, "sorted.bam")
+        with pysam.AlignmentFile(self.sorted_path, "wb", header = header) as bam:
+            for record in sorted(records, key=lambda record: (record.reference_id, record.reference_start)):
+                bam.write(record)
+        pysam.index(self.sorted_path)
+        #Query-grouped but otherwise unsorted
+        self.grouped_path = os.path.join(self.tmpdir.name, "grouped.bam")
+        groups = [records[index:index + 2] if records[index].has_tag("SA") else records[index:index + 1] for index in range(len(records)) if not records[index].is_supplementary]
+        shuffle(groups)
+        with pysam.AlignmentFile(self.grouped_path, "wb", header = header) as bam:
+            for group in groups:
+                for record in group:
+                    bam.write(record)
+        self.options = parse_arguments('1.0.1', ['haploid', self.tmpdir.name, self.sorted_path, 'mygenome'])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_bam_iterator(self):
+        with pysam.AlignmentFile(self.grouped_path) as bam:
+            groups = list(bam_iterator(bam))
+        self.assertEqual(len(groups), 40)
+        self.assertEqual(sum(1 for prim, suppl, sec in groups if len(prim) == 1 and len(suppl) == 1), 20)
+
+    def test_streaming_equals_coordsorted(self):
+        with pysam.AlignmentFile(self.sorted_path) as bam:
+            coordsorted = [(cand.type, cand.get_key(), cand.reads) for cand in analyze_alignment_file_coordsorted(bam, self.options)]
+        with pysam.AlignmentFile(self.grouped_path) as bam:
+            streamed = [(cand.type, cand.get_key(), cand.reads) for cand in analyze_alignment_file_querysorted(bam, self.options)]
+        self.assertGreater(len(coordsorted), 40)
+        self.assertEqual(sorted(coordsorted), sorted(streamed))
+        self.assertEqual([key[1] for key in coordsorted], [key[1] for key in streamed])
+
+    def test_cram(self):
+        genome = os.path.join(self.tmpdir.name, "genome.fa")
+        with open(genome, "w") as fasta_file:
+            for contig in ["chr1", "chr2"]:
+                print(">" + contig, file=fasta_file)
+                print("".join(choice("ACGT") for i in range(100000)), file=fasta_file)
+        pysam.faidx(genome)
+        cram_path = os.path.join(self.tmpdir.name, "sorted.cram")
+        pysam.view("-C", "-T", genome, "-o", cram_path, self.sorted_path, catch_stdout=False)
+        pysam.index(cram_path)
+        options = parse_arguments('1.0.1', ['haploid', self.tmpdir.name, cram_path, genome, '--io_threads', '2'])
+        with pysam.AlignmentFile(self.sorted_path) as bam:
+            expected = [(cand.type, cand.get_key(), cand.reads) for cand in analyze_alignment_file_coordsorted(bam, options)]
+        cram, candidates = collect_candidates(cram_path, "input CRAM file", options)
+        self.assertTrue(cram.is_cram)
+        self.assertEqual([(cand.type, cand.get_key(), cand.reads) for cand in candidates], expected)
+        cram.close()
+
+    def test_parameter_sets(self):
+        parameter_sets = [get_parameter_set_options(self.options, name, parameters) for name, parameters in
+                          [("default", {}), ("large", {"min_sv_size": 150}), ("tolerant", {"min_sv_size": 20, "query_gap_tolerance": 0})]]
+        for path in (self.sorted_path, self.grouped_path):
+            bam, candidate_lists = collect_candidates_multi(path, "input BAM file", self.options, parameter_sets)
+            self.assertEqual(len(candidate_lists), 3)
+            for parameter_set, candidates in zip(parameter_sets, candidate_lists):
+                expected = [(cand.type, cand.get_key(), cand.reads) for cand in collect_candidates(path, "input BAM file", parameter_set)[1]]
+                self.assertEqual([(cand.type, cand.get_key(), cand.reads) for cand in candidates], expected)
+            bam.close()
+        self.assertGreater(len(candidate_lists[0]), len(candidate_lists[1]))
+
+
+class TestSplitReadInsertion(unittest.TestCase):
+    def setUp(self):
+        seed(0)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        header = pysam.AlignmentHeader.from_dict({"HD": {"VN": "1.6", "SO": "coordinate"}, "SQ": [{"SN": "chr1", "LN": 100000}]})
+        self.sequence = "".join(choice("ACGT") for i in range(3000))
+        records = []
+        #Query segments 0-1000 and 1200-3000 aligned next to each other: 200 bp insertion
+        for name, flag, primary_start, supplementary_start, primary_cigar, supplementary_cigar in [("forward", 0, 10000, 11000, "1000M2000S", "1200H1800M"),
+                                                                                                     ("reverse", 16, 31800, 30000, "2000S1000M", "1800M1200H")]:
+            primary = pysam.AlignedSegment(header)
+            supplementary = pysam.AlignedSegment(header)
+            primary.query_name = supplementary.query_name = name
+            primary.query_sequence = self.sequence
+            supplementary.query_sequence = self.sequence[1200:] if flag == 0 else self.sequence[:1800]
+            primary.flag, supplementary.flag = flag, flag + 2048
+            primary.reference_id = supplementary.reference_id = 0
+            primary.reference_start, supplementary.reference_start = primary_start, supplementary_start
+            primary.mapping_quality = supplementary.mapping_quality = 60
+            primary.cigarstring, supplementary.cigarstring = primary_cigar, supplementary_cigar
+            strand = "+" if flag == 0 else "-"
+            primary.set_tag("SA", "chr1,{0},{1},{2},60,0;".format(supplementary_start + 1, strand, supplementary_cigar.replace("H", "S")))
+            supplementary.set_tag("SA", "chr1,{0},{1},{2},60,0;".format(primary_start + 1, strand, primary_cigar))
+            records.extend([primary, supplementary])
+        self.bam_path = os.path.join(self.tmpdir.name, "split.bam")
+        with pysam.AlignmentFile(self.bam_path, "wb", header = header) as bam:
+            for record in sorted(records, key=lambda record: record.reference_start):
+                bam.write(record)
+        pysam.index(self.bam_path)
+        self.options = parse_arguments('1.0.1', ['haploid', self.tmpdir.name, self.bam_path, 'mygenome'])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_split_read_insertion(self):
+        parameter_sets = [self.options, get_parameter_set_options(self.options, "large", {"min_sv_size": 300})]
+        with pysam.AlignmentFile(self.bam_path) as bam:
+            primaries = [alignment for alignment in bam if not alignment.is_supplementary]
+            forward, reverse = [analyze_alignment_multi(alignment, bam, self.options, parameter_sets) for alignment in sorted(primaries, key=lambda aln: aln.query_name)]
+        self.assertEqual([(cand.type, cand.dest_start, cand.dest_end, cand.sequence.decode()) for cand in forward[0]], [("INS", 11000, 11200, self.sequence[1000:1200])])
+        self.assertEqual([(cand.type, cand.dest_start, cand.dest_end, cand.sequence.decode()) for cand in reverse[0]], [("INS", 31800, 32000, self.sequence[1800:2000])])
+        self.assertEqual(forward[1], [])
+        self.assertEqual(reverse[1], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import tempfile
+import pysam
+
+from random import choice, randint, seed
+
+from svim_asm.SVIM_input_parsing import parse_arguments
+from svim_asm.SVIM_vcf import get_vcf_header_lines, open_vcf_writer
+from svim_asm.SVIM_COMBINE import write_final_vcf
+from svim_asm.SVCandidate import QueryNameTable, get_read_names_argument, CandidateDeletion, CandidateInsertion, CandidateDuplicationTandem, CandidateDuplicationInterspersed, CandidateBreakend
+
+class FakeAlignmentFile:
+    def get_reference_length(self, contig):
+        return 100000
+
+class TestVcfWriters(unittest.TestCase):
+    def setUp(self):
+        bam = FakeAlignmentFile()
+        self.records = [CandidateDeletion("chr1", 1000, 1500, ["read1"], bam, "1/0").get_vcf_record(),
+                        CandidateInsertion("chr1", 2000, 2100, ["read2"], "A" * 100, bam, "0/1").get_vcf_record(),
+                        CandidateDuplicationTandem("chr1", 3000, 3200, 2, False, ["read3"], bam).get_vcf_record_as_dup(),
+                        CandidateDuplicationInterspersed("chr1", 4000, 4500, "chr2", 100, 600, ["read4"], bam, True).get_vcf_record_as_dup(),
+                        CandidateBreakend("chr1", 5000, 'fwd', "chr2", 200, 'rev', ["read5"], bam).get_vcf_record()]
+        self.contigs = ["chr1", "chr2"]
+
+    def write(self, tmpdirname, output_format):
+        options = parse_arguments('1.0.1', ['haploid', tmpdirname, 'mybamfile', 'mygenome', '--output_format', output_format])
+        header_lines = get_vcf_header_lines('1.0.1', self.contigs, [100000, 100000], options.types.split(","), options)
+        writer = open_vcf_writer(header_lines, options)
+        for index, record in enumerate(self.records):
+            writer.write(record, "svim_asm.{0}".format(index + 1))
+        writer.close()
+
+    def test_formats_agree(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            self.write(tmpdirname, "vcf")
+            self.write(tmpdirname, "vcf.gz")
+            self.write(tmpdirname, "bcf")
+            parsed = []
+            for path in ["variants.vcf", "variants.vcf.gz", "variants.bcf"]:
+                with pysam.VariantFile(tmpdirname + "/" + path) as vcf_file:
+                    #The INFO column is compared as text because dict(r.info) leaves out END
+                    parsed.append([(r.contig, r.pos, r.id, r.ref, r.alts, r.stop, list(r.filter), dict(r.info), str(r).split("\t")[7], r.samples[0]["GT"]) for r in vcf_file])
+            self.assertEqual(len(parsed[0]), 5)
+            self.assertEqual(parsed[0], parsed[1])
+            self.assertEqual(parsed[0], parsed[2])
+            with pysam.VariantFile(tmpdirname + "/variants.bcf") as vcf_file:
+                self.assertEqual(len(list(vcf_file.fetch("chr1", 2500, 3500))), 1)
+
+class TestQueryNames(unittest.TestCase):
+    def test_query_name_ids(self):
+        table = QueryNameTable()
+        reads = (table.get_id("query1"), table.get_id("query2"))
+        self.assertEqual(table.get_id("query1"), 0)
+        deletion = CandidateDeletion("chr1", 1000, 1500, reads, FakeAlignmentFile())
+        self.assertIn(("READS", "query1,query2"), deletion.get_vcf_record(read_names = table).info)
+        self.assertNotIn("READS", [key for key, value in deletion.get_vcf_record(read_names = False).info])
+
+    def test_read_names_argument(self):
+        options = parse_arguments('1.0.1', ['haploid', 'mydir', 'mybamfile', 'mygenome'])
+        self.assertEqual(get_read_names_argument(options), False)
+        options = parse_arguments('1.0.1', ['haploid', 'mydir', 'mybamfile', 'mygenome', '--query_names'])
+        self.assertEqual(get_read_names_argument(options), True)
+        options.query_name_table = QueryNameTable()
+        self.assertIs(get_read_names_argument(options), options.query_name_table)
+
+class FakeReference:
+    def __init__(self, sequences):
+        self.sequences = sequences
+
+    def clone(self):
+        return FakeReference(self.sequences)
+
+    def fetch(self, contig, start, end):
+        return self.sequences[contig][start:end]
+
+    def get_reference_length(self, contig):
+        return len(self.sequences[contig])
+
+    def close(self):
+        pass
+
+class TestPipelinedOutput(unittest.TestCase):
+    def setUp(self):
+        seed(0)
+        bam = FakeAlignmentFile()
+        self.contigs = ["chr1", "chr2", "chr10", "chrX"]
+        self.reference = FakeReference({contig: "".join(choice("ACGT") for i in range(100000)) for contig in self.contigs})
+        self.deletions, self.insertions, self.breakends = [], [], []
+        for index in range(300):
+            contig, start = choice(self.contigs), randint(0, 90000)
+            self.deletions.append(CandidateDeletion(contig, start, start + randint(50, 5000), ["read{0}".format(index)], bam, "1/0"))
+            self.insertions.append(CandidateInsertion(contig, start, start + 100, ["read{0}".format(index)], "C" * 100, bam, "0/1"))
+            self.breakends.append(CandidateBreakend(contig, start, 'fwd', choice(self.contigs), randint(0, 90000), 'rev', ["read{0}".format(index)], bam))
+
+    def write(self, tmpdirname, format_threads):
+        options = parse_arguments('1.0.1', ['haploid', tmpdirname, 'mybamfile', 'mygenome', '--format_threads', str(format_threads)])
+        write_final_vcf([], [], [], self.deletions, self.insertions, self.breakends, '1.0.1', self.contigs, [100000] * 4,
+                        options.types.split(","), self.reference, options)
+        with open(tmpdirname + "/variants.vcf") as vcf_file:
+            return [line for line in vcf_file if not line.startswith("##fileDate")]
+
+    def test_threads_agree(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            serial = self.write(tmpdirname, 1)
+            pipelined = self.write(tmpdirname, 3)
+        self.assertEqual(len([line for line in serial if not line.startswith("#")]), 1200)
+        self.assertEqual(serial, pipelined)
+
+if __name__ == '__main__':
+    unittest.main()